@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Background sending of the broadcast jobs stored in the database"""
+import logging
+import threading
+import time
+
+from bot.dispatcher import PRIORITY_BROADCAST
+
+logger = logging.getLogger(__name__)
+
+
+class _BatchResults(object):
+    """Collects the send results of the messages of a batch"""
+
+    def __init__(self, size):
+        self.size = size
+        self.sent = 0
+        self.failed = 0
+        self._condition = threading.Condition()
+
+    def add(self, success):
+        with self._condition:
+            if success:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._condition.notify_all()
+
+    def wait(self, timeout):
+        """Waits until the results of all messages arrived. Returns False if the timeout expired"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.sent + self.failed >= self.size, timeout)
+
+
+class BroadcastWorker(object):
+    """
+    Background thread which sends the unfinished broadcasts through the message dispatcher, batch by batch. After the
+    results of a batch arrived, its last recipient is stored as checkpoint - after a restart a broadcast continues
+    with the first batch which was not completed. report(broadcast) is called with the progress every report_interval
+    seconds and when a broadcast is finished.
+    """
+
+    def __init__(self, db, dispatcher, report, batch_size=100, report_interval=60, batch_timeout=600, clock=time.monotonic):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.report = report
+        self.batch_size = batch_size
+        self.report_interval = report_interval
+        # Max. seconds to wait for the results of a batch - missing results count as failed
+        self.batch_timeout = batch_timeout
+        self._clock = clock
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="BroadcastWorker", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Tells the worker that a new broadcast was created"""
+        self._wakeup.set()
+
+    def close(self, timeout=None):
+        """Stops the worker - the current batch is sent again after the next start"""
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+
+            try:
+                for broadcast in self.db.get_unfinished_broadcasts():
+                    if self._stopped.is_set():
+                        break
+
+                    self._send(broadcast)
+            except Exception as e:
+                logger.error("Error while sending a broadcast: {}".format(e))
+
+            self._wakeup.wait(self.report_interval)
+
+    def _wait_for_results(self, results):
+        """Waits for the results of a batch - returns False if the worker was stopped meanwhile"""
+        deadline = self._clock() + self.batch_timeout
+
+        while not results.wait(timeout=1):
+            if self._stopped.is_set():
+                return False
+
+            if self._clock() >= deadline:
+                logger.warning("Results of {} broadcast messages are missing".format(results.size - results.sent - results.failed))
+                break
+
+        return True
+
+    def _send(self, broadcast):
+        """Sends a broadcast to all recipients after its checkpoint and stores the progress after each batch"""
+        logger.info("Sending broadcast {} - {} of {} recipients done".format(broadcast.id, broadcast.sent + broadcast.failed,
+                                                                             broadcast.total))
+        last_report = self._clock()
+
+        while not self._stopped.is_set():
+            recipients = self.db.get_broadcast_recipients(broadcast.last_user_id, self.batch_size)
+            if len(recipients) == 0:
+                self.db.checkpoint_broadcast(broadcast.id, broadcast.last_user_id, 0, 0, finished=True)
+                logger.info("Finished broadcast {}: {} sent, {} failed".format(broadcast.id, broadcast.sent, broadcast.failed))
+                self.report(self.db.get_broadcast(broadcast.id))
+                return
+
+            results = _BatchResults(len(recipients))
+            for user_id in recipients:
+                self.dispatcher.send(user_id, broadcast.text, priority=PRIORITY_BROADCAST, on_result=results.add)
+
+            if not self._wait_for_results(results):
+                return
+
+            failed = results.size - results.sent
+            self.db.checkpoint_broadcast(broadcast.id, recipients[-1], results.sent, failed)
+            broadcast = broadcast._replace(last_user_id=recipients[-1], sent=broadcast.sent + results.sent,
+                                           failed=broadcast.failed + failed)
+
+            if self._clock() - last_report >= self.report_interval:
+                self.report(broadcast)
+                last_report = self._clock()
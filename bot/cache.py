@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""In-process cache for data which is read on every interaction with the bot"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """Thread safe LRU cache whose entries expire ttl seconds after they were stored"""
+
+    def __init__(self, max_entries=10000, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Increased by every invalidation, so that values loaded before an invalidation are not stored afterwards
+        self._version = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._get(key) is not None
+
+    def _get(self, key):
+        """Returns the (value,) tuple of a key or None if it's missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires, value = entry
+        if expires <= self._clock():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return (value,)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key, load):
+        """Returns the cached value of a key or stores and returns the value of load() on a miss. None isn't cached"""
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            version = self._version
+
+        value = load()
+
+        with self._lock:
+            if value is not None and version == self._version:
+                self._store(key, value)
+
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
@@ -1,23 +1,156 @@
 """Core file for the business logic to interact with the backend"""
 # -*- coding: utf-8 -*-
 
+import logging
 import re
+import time
 
+from bot.broadcast import BroadcastWorker
+from bot.cache import TTLCache
+from bot.history import HistoryCache, get_history_period, render_history
+from bot.outbox import OutboxWorker
 from database.db_wrapper import DBwrapper
+from database.db_writer import DBWriter
+from database.update_batch import EntityUpdateBatch
 from geizhals.entities import EntityType, Product, Wishlist
 from util.exceptions import AlreadySubscribedException, WishlistNotFoundException, ProductNotFoundException, \
     InvalidURLException
 
+logger = logging.getLogger(__name__)
+
+# Rendered price histories - popular entities are viewed by many subscribers
+history_cache = HistoryCache()
+# Users and the ids of the entities they subscribed to, keyed by user id - interactive handlers read them on every action
+user_cache = TTLCache()
+subscription_cache = TTLCache()
+# Write-behind queue for the database writes of the price check - None if the writes are done synchronously
+_db_writer = None
+# Delivers the notifications of the outbox - None if no worker was started
+_outbox_worker = None
+# Sends the broadcast jobs - None if no worker was started
+_broadcast_worker = None
+
+
+def start_db_writer(max_queue_size=10000):
+    """Queues the writes of price updates, entity removals and user deletions for a background writer thread"""
+    global _db_writer
+    if _db_writer is None:
+        _db_writer = DBWriter(DBwrapper.get_instance(), max_queue_size=max_queue_size, on_write=_on_queued_write)
+        _db_writer.start()
+
+
+def stop_db_writer(timeout=60):
+    """Writes all queued changes and stops the background writer"""
+    global _db_writer
+    if _db_writer is not None:
+        if not _db_writer.close(timeout):
+            logger.error("The DB writer didn't finish the queued changes within {} seconds".format(timeout))
+        _db_writer = None
+
+
+def start_outbox_worker(dispatcher, render, batch_size=100, max_in_flight=500):
+    """Delivers the notifications of the outbox through the dispatcher in a background thread"""
+    global _outbox_worker
+    if _outbox_worker is None:
+        _outbox_worker = OutboxWorker(DBwrapper.get_instance(), dispatcher, render, batch_size=batch_size,
+                                      max_in_flight=max_in_flight)
+        _outbox_worker.start()
+
+
+def stop_outbox_worker(timeout=None):
+    """Stops the outbox worker - undelivered notifications stay in the outbox for the next start"""
+    global _outbox_worker
+    if _outbox_worker is not None:
+        _outbox_worker.close(timeout)
+        _outbox_worker = None
+
+
+def start_broadcast_worker(dispatcher, report, batch_size=100, report_interval=60):
+    """Sends the broadcast jobs through the dispatcher in a background thread - unfinished ones are resumed"""
+    global _broadcast_worker
+    if _broadcast_worker is None:
+        _broadcast_worker = BroadcastWorker(DBwrapper.get_instance(), dispatcher, report, batch_size=batch_size,
+                                            report_interval=report_interval)
+        _broadcast_worker.start()
+
+
+def stop_broadcast_worker(timeout=None):
+    """Stops the broadcast worker - unfinished broadcasts are resumed after the next start"""
+    global _broadcast_worker
+    if _broadcast_worker is not None:
+        _broadcast_worker.close(timeout)
+        _broadcast_worker = None
+
+
+def create_broadcast(text, admin_id):
+    """Stores a broadcast job to all subscribers and returns it - it's sent by the broadcast worker"""
+    db = DBwrapper.get_instance()
+    broadcast = db.create_broadcast(text, admin_id)
+    if _broadcast_worker is not None:
+        _broadcast_worker.wake()
+
+    return broadcast
+
+
+def _wake_outbox_worker(price_updates):
+    """Price updates might have added notifications to the outbox"""
+    if _outbox_worker is not None and len(price_updates) > 0:
+        _outbox_worker.wake()
+
+
+def configure_cache(max_entries, ttl):
+    """Sets the size and the time to live in seconds of the user and subscription caches"""
+    for cache in (user_cache, subscription_cache):
+        cache.max_entries = max_entries
+        cache.ttl = ttl
+        cache.clear()
+
+
+def _on_queued_write(price_updates, name_updates, removed_entities, deleted_users):
+    """Invalidates the cached data of the changes which the write-behind queue has just written"""
+    _invalidate_histories(price_updates, name_updates)
+    _wake_outbox_worker(price_updates)
+    if len(removed_entities) > 0:
+        # Removing entities also removes the subscriptions of all their subscribers
+        subscription_cache.clear()
+    for user_id in deleted_users:
+        _invalidate_user(user_id)
+
+
+def _invalidate_user(user_id):
+    user_cache.invalidate(user_id)
+    subscription_cache.invalidate(user_id)
+
+
+def _get_subscription_ids(user_id):
+    """Returns the cached ids of the wishlists and products a user subscribed to"""
+    db = DBwrapper.get_instance()
+    return subscription_cache.get_or_load(user_id, lambda: db.get_subscription_ids(user_id))
+
+
+def sync_writes(timeout=30):
+    """Waits until all queued writes are committed, so that the following reads see them"""
+    if _db_writer is not None and not _db_writer.sync(timeout):
+        logger.warning("Queued changes were not written within {} seconds - reading without them".format(timeout))
+
 
 def add_user_if_new(user):
     """Save a user to the database, if the user is not already stored"""
+    if user.id in user_cache:
+        return
+
+    sync_writes()
     db = DBwrapper.get_instance()
     if not db.is_user_saved(user.id):
         db.add_user(user.id, user.first_name, user.username, user.lang_code)
 
+    # The cache is shared with get_user_by_id, so it only holds users as they are stored in the database
+    user_cache.put(user.id, db.get_user(user.id))
+
 
 def add_wishlist_if_new(wishlist):
     """Save a wishlist to the database, if it is not already stored"""
+    sync_writes()
     db = DBwrapper.get_instance()
 
     if not db.is_wishlist_saved(wishlist.id):
@@ -30,6 +163,7 @@ def add_wishlist_if_new(wishlist):
 
 def add_product_if_new(product):
     """Save a product to the database, if it is not already stored"""
+    sync_writes()
     db = DBwrapper.get_instance()
 
     if not db.is_product_saved(product.id):
@@ -40,27 +174,30 @@ def add_product_if_new(product):
 
 def is_user_wishlist_subscriber(user, wishlist):
     """Returns if a user is a wishlist subscriber"""
-    db = DBwrapper.get_instance()
-
-    return db.is_user_wishlist_subscriber(user.id, wishlist.id)
+    wishlist_ids, _ = _get_subscription_ids(user.id)
+    return wishlist.id in wishlist_ids
 
 
 def subscribe_entity(user, entity):
     """Subscribe to an entity as a user"""
+    sync_writes()
     db = DBwrapper.get_instance()
+    wishlist_ids, product_ids = _get_subscription_ids(user.id)
     if entity.TYPE == EntityType.WISHLIST:
-        if not db.is_user_wishlist_subscriber(user.id, entity.id):
+        if entity.id not in wishlist_ids:
             db.subscribe_wishlist(entity.id, user.id)
         else:
             raise AlreadySubscribedException
     elif entity.TYPE == EntityType.PRODUCT:
-        if not db.is_user_product_subscriber(user.id, entity.id):
+        if entity.id not in product_ids:
             db.subscribe_product(entity.id, user.id)
         else:
             raise AlreadySubscribedException
     else:
         raise ValueError("Unknown EntityType")
 
+    subscription_cache.invalidate(user.id)
+
 
 def unsubscribe_entity(user, entity):
     db = DBwrapper.get_instance()
@@ -71,6 +208,8 @@ def unsubscribe_entity(user, entity):
     else:
         raise ValueError("Unknown EntityType")
 
+    subscription_cache.invalidate(user.id)
+
 
 def get_all_entities():
     """Returns all the entities in the database"""
@@ -84,15 +223,22 @@ def get_all_entities():
     return entities
 
 
-def get_all_entities_with_subscribers():
-    """Returns all the entities with subscribers in the database"""
+def iter_entity_keys_with_subscribers(due_before=None):
+    """
+    Generator over the (entity_type, entity_id) keys of the entities with subscribers - optionally only those which
+    are due for a check before due_before
+    """
     db = DBwrapper.get_instance()
-    wishlists = db.get_all_subscribed_wishlists()
-    products = db.get_all_subscribed_products()
+    return db.iter_subscribed_entity_keys(due_before)
 
-    entities = wishlists + products
 
-    return entities
+def get_entities(entity_keys):
+    """Returns the entities of the given (entity_type, entity_id) keys - removed entities are left out"""
+    if len(entity_keys) == 0:
+        return []
+
+    db = DBwrapper.get_instance()
+    return db.get_entities(entity_keys)
 
 
 def get_wishlist(wishlist_id):
@@ -119,92 +265,165 @@ def get_product(product_id):
 
 def get_wishlist_count(user_id):
     """Returns the count of subscribed wishlists for a user"""
-    db = DBwrapper.get_instance()
-    return db.get_subscribed_wishlist_count(user_id)
+    wishlist_ids, _ = _get_subscription_ids(user_id)
+    return len(wishlist_ids)
 
 
 def get_product_count(user_id):
-    db = DBwrapper.get_instance()
-    return db.get_subscribed_product_count(user_id)
+    """Returns the count of subscribed products for a user"""
+    _, product_ids = _get_subscription_ids(user_id)
+    return len(product_ids)
 
 
 def get_wishlists_for_user(user_id):
     """Returns the subscribed wishlists for a certain user"""
+    sync_writes()
     db = DBwrapper.get_instance()
     return db.get_wishlists_for_user(user_id)
 
 
 def get_products_for_user(user_id):
     """Returns the subscribed wishlists for a certain user"""
+    sync_writes()
     db = DBwrapper.get_instance()
     return db.get_products_for_user(user_id)
 
 
 def get_user_by_id(user_id):
     db = DBwrapper.get_instance()
-    return db.get_user(user_id)
+    return user_cache.get_or_load(user_id, lambda: db.get_user(user_id))
 
 
 def get_wl_url(text):
+    """Returns the canonical url of a wishlist"""
+    text = text.strip()
     if re.match(Wishlist.url_pattern, text):
-        return text
+        return Wishlist.canonical_url(text)
     else:
         raise InvalidURLException
 
 
 def get_p_url(text):
+    """Returns the canonical url of a product"""
+    text = text.strip()
     if re.match(Product.url_pattern, text):
-        return text
+        return Product.canonical_url(text)
     else:
         raise InvalidURLException
 
 
-def get_entity_subscribers(entity):
-    """Returns the subscribers of an entity"""
+def get_subscribers_for_entities(entities):
+    """Returns the subscribers of all the given entities with a single query as dict {(entity.TYPE, entity.id): [User]}"""
+    if len(entities) == 0:
+        return {}
+
     db = DBwrapper.get_instance()
-    if entity.TYPE == EntityType.WISHLIST:
-        return db.get_userids_for_wishlist(entity.id)
-    elif entity.TYPE == EntityType.PRODUCT:
-        return db.get_userids_for_product(entity.id)
-    else:
-        raise ValueError("Unknown EntityType")
+    return db.get_subscribers_for_entities([(entity.TYPE, entity.id) for entity in entities])
+
+
+def _invalidate_histories(price_updates, name_updates):
+    history_cache.invalidate((entity_type, entity_id) for entity_type, entity_id, _ in price_updates)
+
+
+def _on_batch_flush(price_updates, name_updates):
+    _invalidate_histories(price_updates, name_updates)
+    _wake_outbox_worker(price_updates)
 
 
-def update_entity_price(entity, price):
-    """Update the price of an entity"""
+def create_update_batch(flush_size=100, flush_interval=30):
+    """Returns a batch which collects price and name updates and writes them in a single transaction"""
+    if _db_writer is not None:
+        # The writer invalidates the histories and wakes the outbox worker itself once the updates are written
+        return EntityUpdateBatch(_db_writer, flush_size=flush_size, flush_interval=flush_interval)
+
+    return EntityUpdateBatch(DBwrapper.get_instance(), flush_size=flush_size, flush_interval=flush_interval,
+                             on_flush=_on_batch_flush)
+
+
+def get_price_history(entity, days):
+    """Returns the rendered price history of an entity for the last days - cached until the entity gets a new price"""
+    now = int(time.time())
+    period = get_history_period(days)
+    key = (entity.TYPE, entity.id, days, now // period)
+
+    history = history_cache.get(key)
+    if history is None:
+        sync_writes()
+        db = DBwrapper.get_instance()
+        rollups = db.get_price_rollups(entity.TYPE, entity.id, period, now - days * 24 * 60 * 60)
+        history = render_history(rollups, days, entity.price, now)
+        history_cache.put(key, history)
+
+    return history
+
+
+def prune_price_history(raw_retention_days, hourly_retention_days=None):
+    """Deletes raw price points and hourly rollups which are older than the given number of days"""
     db = DBwrapper.get_instance()
-    if entity.TYPE == EntityType.WISHLIST:
-        db.update_wishlist_price(entity.id, price)
-    elif entity.TYPE == EntityType.PRODUCT:
-        db.update_product_price(entity.id, price)
-    else:
-        raise ValueError("Unknown EntityType")
+    now = int(time.time())
+    hourly_before = now - hourly_retention_days * 24 * 60 * 60 if hourly_retention_days is not None else None
+    return db.prune_price_history(now - raw_retention_days * 24 * 60 * 60, hourly_before)
 
 
-def update_entity_name(entity, name):
-    """Update the name of an entity"""
+def get_alert_rule(user, entity):
+    """Returns the alert rule of a user's subscription or None if the user didn't subscribe to the entity"""
     db = DBwrapper.get_instance()
-    if entity.TYPE == EntityType.WISHLIST:
-        db.update_wishlist_name(entity.id, name)
-    elif entity.TYPE == EntityType.PRODUCT:
-        db.update_product_name(entity.id, name)
-    else:
-        raise ValueError("Unknown EntityType")
+    return db.get_alert_rule(user.id, entity.TYPE, entity.id)
 
 
-def rm_entity(entity):
+def set_alert_rule(user, entity, rule):
+    """Sets the alert rule of a user's subscription - returns False if the user didn't subscribe to the entity"""
     db = DBwrapper.get_instance()
-    if entity.TYPE == EntityType.WISHLIST:
-        db.rm_wishlist(entity.id)
-    elif entity.TYPE == EntityType.PRODUCT:
-        db.rm_product(entity.id)
-    else:
-        raise ValueError("Unknown EntityType")
+    return db.set_alert_rule(user.id, entity.TYPE, entity.id, rule)
+
+
+def configure_digest(window):
+    """Sets the seconds of the windows in which the price changes for digest users are collected"""
+    db = DBwrapper.get_instance()
+    db.digest_window = window
+
+
+def is_digest_user(user_id):
+    """Returns if a user gets the price changes as digest instead of one message per change"""
+    db = DBwrapper.get_instance()
+    return db.is_digest_user(user_id)
+
+
+def set_digest_user(user_id, digest):
+    db = DBwrapper.get_instance()
+    db.set_digest_user(user_id, digest)
+
+
+def prune_outbox(retention_days):
+    """Deletes the delivered and failed notifications which are older than the given number of days"""
+    db = DBwrapper.get_instance()
+    return db.prune_outbox(int(time.time()) - retention_days * 24 * 60 * 60)
+
+
+def rm_entities(entities):
+    """Removes all the given entities together with their subscriptions"""
+    if len(entities) == 0:
+        return
+
+    if _db_writer is not None:
+        for entity in entities:
+            _db_writer.rm_entity(entity.TYPE, entity.id)
+        return
+
+    db = DBwrapper.get_instance()
+    db.rm_entities([(entity.TYPE, entity.id) for entity in entities])
+    subscription_cache.clear()
 
 
 def delete_user(user_id):
+    _invalidate_user(user_id)
+    if _db_writer is not None:
+        _db_writer.delete_user(user_id)
+        return
+
     db = DBwrapper.get_instance()
     db.delete_user(user_id)
+    _invalidate_user(user_id)
 
 
 def get_all_subscribers():
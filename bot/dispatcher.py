@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Rate limited sending of bot messages, so that notifications don't run into the flood limits of Telegram"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from geizhals.util import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priorities of messages - messages with a lower value are sent first
+PRIORITY_ALERT = 0
+PRIORITY_BROADCAST = 1
+
+
+class OutgoingMessage(object):
+    __slots__ = ("chat_id", "text", "kwargs", "priority", "on_result", "attempts")
+
+    def __init__(self, chat_id, text, kwargs, priority, on_result=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        # Called with True once the message was sent or with False when it was given up
+        self.on_result = on_result
+        self.attempts = 0
+
+
+class MessageDispatcher(object):
+    """
+    Prioritized send queue processed by worker threads. Every message takes a token of the global bucket (Telegram
+    allows about 30 messages per second) and of the bucket of its chat (about 1 message per second). Messages to chats
+    without tokens are deferred instead of blocking a worker, so other chats are served meanwhile.
+    The Telegram errors are passed in as tuples, so that this module doesn't depend on the telegram package:
+    retry_after errors pause all sending for their retry_after seconds, retry errors (e.g. TimedOut) are retried with
+    backoff and unauthorized errors are passed to on_unauthorized(chat_id, error).
+    """
+
+    def __init__(self, send, rate=30, per_chat_rate=1, workers=4, max_retries=3, retry_delay=1, retry_after=(), retry=(),
+                 unauthorized=(), on_unauthorized=None, max_chats=10000, clock=time.monotonic):
+        self._send = send
+        self.per_chat_rate = per_chat_rate
+        self.workers = workers
+        self.max_retries = max_retries
+        # Seconds before the first retry - doubled with every further attempt
+        self.retry_delay = retry_delay
+        self.retry_after_errors = tuple(retry_after)
+        self.retry_errors = tuple(retry)
+        self.unauthorized_errors = tuple(unauthorized)
+        self.on_unauthorized = on_unauthorized
+        # Buckets of the chats which recently got a message - the least recently used bucket is full long ago
+        self.max_chats = max_chats
+        self.sent = 0
+        self.failed = 0
+        self._clock = clock
+        self._global_bucket = TokenBucket(rate, clock=clock)
+        self._chat_buckets = OrderedDict()
+        self._chat_buckets_lock = threading.Lock()
+        # Messages which can be sent right away as (priority, seq, message) and deferred ones as (not_before, seq, message)
+        self._ready = []
+        self._deferred = []
+        self._seq = itertools.count()
+        self._in_progress = 0
+        self._condition = threading.Condition()
+        self._closing = False
+        self._threads = []
+
+    def start(self):
+        if len(self._threads) > 0:
+            return
+
+        self._closing = False
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name="MessageDispatcher-{}".format(number), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def pending(self):
+        """Number of messages which are queued or currently sent"""
+        with self._condition:
+            return len(self._ready) + len(self._deferred) + self._in_progress
+
+    def send(self, chat_id, text, priority=PRIORITY_ALERT, on_result=None, **kwargs):
+        """Queues a message - the keyword arguments are passed to the send function"""
+        self._push(OutgoingMessage(chat_id, text, kwargs, priority, on_result))
+
+    def _push(self, message, not_before=None):
+        with self._condition:
+            if not_before is None:
+                heapq.heappush(self._ready, (message.priority, next(self._seq), message))
+            else:
+                heapq.heappush(self._deferred, (not_before, next(self._seq), message))
+            self._condition.notify()
+
+    def join(self, timeout=None):
+        """Waits until all queued messages were processed. Returns False if the timeout expired"""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._ready) + len(self._deferred) + self._in_progress == 0,
+                                            timeout)
+
+    def close(self, timeout=None):
+        """Sends the queued messages and stops the workers"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _get_chat_bucket(self, chat_id):
+        with self._chat_buckets_lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.per_chat_rate, capacity=1, clock=self._clock)
+                self._chat_buckets[chat_id] = bucket
+                while len(self._chat_buckets) > self.max_chats:
+                    self._chat_buckets.popitem(last=False)
+            else:
+                self._chat_buckets.move_to_end(chat_id)
+
+            return bucket
+
+    def _take(self):
+        """Blocks until a message can be sent and returns it - returns None when the dispatcher is closed and empty"""
+        with self._condition:
+            while True:
+                now = self._clock()
+                while len(self._deferred) > 0 and self._deferred[0][0] <= now:
+                    _, _, message = heapq.heappop(self._deferred)
+                    heapq.heappush(self._ready, (message.priority, next(self._seq), message))
+
+                if len(self._ready) > 0:
+                    self._in_progress += 1
+                    return heapq.heappop(self._ready)[2]
+
+                if len(self._deferred) > 0:
+                    self._condition.wait(self._deferred[0][0] - now)
+                elif self._closing:
+                    return None
+                else:
+                    self._condition.wait()
+
+    def _done(self):
+        with self._condition:
+            self._in_progress -= 1
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            message = self._take()
+            if message is None:
+                return
+
+            try:
+                self._process(message)
+            except Exception as e:
+                logger.error("Unexpected error while sending a message to {}: {}".format(message.chat_id, e))
+            finally:
+                self._done()
+
+    def _process(self, message):
+        chat_bucket = self._get_chat_bucket(message.chat_id)
+        if not chat_bucket.try_acquire():
+            # The chat got a message just now - try again as soon as it has a token again
+            self._push(message, self._clock() + chat_bucket.wait_time())
+            return
+
+        self._global_bucket.acquire()
+        message.attempts += 1
+
+        try:
+            self._send(message.chat_id, message.text, **message.kwargs)
+        except self.retry_after_errors as e:
+            logger.warning("Hit the flood limit of Telegram - pausing all messages for {} seconds".format(e.retry_after))
+            self._global_bucket.pause(e.retry_after)
+            # Flood control is not the message's fault, so it doesn't count as attempt
+            message.attempts -= 1
+            self._push(message, self._clock() + e.retry_after)
+        except self.retry_errors as e:
+            if message.attempts > self.max_retries:
+                logger.error("Giving up sending a message to {} after {} attempts: {}".format(message.chat_id, message.attempts, e))
+                self._finish(message, False)
+                return
+
+            self._push(message, self._clock() + self.retry_delay * 2 ** (message.attempts - 1))
+        except self.unauthorized_errors as e:
+            if self.on_unauthorized is not None:
+                self.on_unauthorized(message.chat_id, e)
+            self._finish(message, False)
+        except Exception as e:
+            logger.error("Couldn't send a message to {}: {}".format(message.chat_id, e))
+            self._finish(message, False)
+        else:
+            self._finish(message, True)
+
+    def _finish(self, message, success):
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+        if message.on_result is not None:
+            message.on_result(success)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Text charts of the price history of entities"""
+import logging
+import threading
+from collections import OrderedDict
+
+from database.price_history import DAILY, HOURLY
+from util.formatter import bold, price, sparkline
+
+logger = logging.getLogger(__name__)
+
+# Selectable ranges of the price history in days and the labels of their buttons
+HISTORY_RANGES = OrderedDict([(7, "7 Tage"), (30, "30 Tage"), (365, "1 Jahr")])
+DEFAULT_HISTORY_RANGE = 30
+# Max. number of characters of a chart
+CHART_WIDTH = 30
+
+
+def get_history_period(days):
+    """Returns the rollup period a range is rendered from - hourly rollups for up to a week, daily ones otherwise"""
+    return HOURLY if days <= 7 else DAILY
+
+
+def build_series(rollups, end, period):
+    """
+    Returns the close price of each period from the first rollup up to the period containing end.
+    Periods without rollup had no price change, so they keep the close price of the period before.
+    """
+    if len(rollups) == 0:
+        return []
+
+    closes = {bucket: close for bucket, _, _, close in rollups}
+    series = []
+    close = None
+
+    for bucket in range(rollups[0][0], end - end % period + 1, period):
+        close = closes.get(bucket, close)
+        series.append(close)
+
+    return series
+
+
+def downsample(series, width):
+    """Reduces the series to at most width values by taking the last value of evenly sized groups"""
+    if len(series) <= width:
+        return series
+
+    return [series[(index + 1) * len(series) // width - 1] for index in range(width)]
+
+
+def render_history(rollups, days, current_price, now):
+    """Renders the chart and the price range of an entity's rollups as html text"""
+    if len(rollups) == 0:
+        return "In den letzten {days} Tagen hat sich der Preis nicht geändert. Er liegt bei {price}.".format(
+            days=days, price=bold(price(current_price, signed=False)))
+
+    period = get_history_period(days)
+    series = downsample(build_series(rollups, now, period), CHART_WIDTH)
+    lowest = min(row[1] for row in rollups)
+    highest = max(row[2] for row in rollups)
+
+    return "Preisverlauf der letzten {days} Tage:\n" \
+           "<code>{chart}</code>\n" \
+           "Tiefstpreis: {lowest}\n" \
+           "Höchstpreis: {highest}\n" \
+           "Aktuell: {current}".format(days=days, chart=sparkline(series), lowest=price(lowest, signed=False),
+                                       highest=price(highest, signed=False), current=bold(price(current_price, signed=False)))
+
+
+class HistoryCache(object):
+    """
+    LRU cache of rendered price histories keyed by (entity_type, entity_id, days, window). The window is the current
+    rollup period, so a chart moves on with time. Entries of an entity are dropped as soon as it gets a new price.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, entities):
+        """Drops the cached histories of the given (entity_type, entity_id) tuples"""
+        entities = set(entities)
+        if len(entities) == 0:
+            return
+
+        with self._lock:
+            for key in [key for key in self._entries if (key[0], key[1]) in entities]:
+                del self._entries[key]
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Delivery of the price change notifications stored in the outbox of the database"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def group_notifications(notifications):
+    """
+    Groups notifications into messages - all digest notifications of a user form one message, every other
+    notification is a message of its own. Returns the groups in the order of their first notification.
+    """
+    groups = []
+    digests = {}
+
+    for notification in notifications:
+        if not notification.digest:
+            groups.append([notification])
+        elif notification.user_id in digests:
+            digests[notification.user_id].append(notification)
+        else:
+            digests[notification.user_id] = [notification]
+            groups.append(digests[notification.user_id])
+
+    return groups
+
+
+def merge_changes(notifications):
+    """
+    Merges the notifications of the same entity into one change from the first old price to the last new price.
+    Entities whose price is back at the old price are left out.
+    """
+    changes = OrderedDict()
+
+    for notification in notifications:
+        key = (notification.entity_type, notification.entity_id)
+        first = changes.get(key, notification)
+        changes[key] = notification._replace(old_price=first.old_price)
+
+    return [change for change in changes.values() if change.old_price != change.new_price]
+
+
+class OutboxWorker(object):
+    """
+    Background thread which claims due notifications from the outbox in batches, renders them with render(notifications)
+    and hands them to the message dispatcher. Digest notifications of a user are rendered into a single message and
+    render returns None if there is nothing left to tell. The results of the dispatcher are written back in batches: sent
+    notifications are marked as sent, failed ones are retried with backoff until max_attempts is reached.
+    At most max_in_flight notifications are handed to the dispatcher at the same time.
+    """
+
+    def __init__(self, db, dispatcher, render, batch_size=100, max_in_flight=500, interval=5, lease=300, max_attempts=5,
+                 retry_delay=60, clock=time.time):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.render = render
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        # Max. seconds between two looks into the outbox - wake() triggers a look right away
+        self.interval = interval
+        # Seconds after which claimed notifications without result are delivered again
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._results = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        # Notifications claimed before a restart never got a result
+        released = self.db.release_notifications()
+        if released > 0:
+            logger.info("Delivering {} notifications of the last run again".format(released))
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="OutboxWorker", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Tells the worker that new notifications might be due"""
+        self._wakeup.set()
+
+    def close(self, timeout=None):
+        """
+        Stops claiming notifications, waits until the dispatcher sent the queued messages and writes their results.
+        Must be called before the dispatcher is closed - otherwise the queued notifications are delivered again.
+        """
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+        if self.in_flight > 0 and not self.dispatcher.join(timeout):
+            logger.warning("{} notifications were not sent before the shutdown".format(self.in_flight))
+
+        try:
+            self._write_results()
+        except Exception as e:
+            logger.error("Couldn't write the results of the outbox: {}".format(e))
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def _on_result(self, notifications, success):
+        with self._lock:
+            self._results.extend((notification, success) for notification in notifications)
+        self._wakeup.set()
+
+    def _write_results(self):
+        """Marks the notifications of the received results as sent, failed or to be retried"""
+        with self._lock:
+            results, self._results = self._results, []
+
+        if len(results) == 0:
+            return
+
+        now = self._clock()
+        sent_ids, failed_ids, retries = [], [], []
+        for notification, success in results:
+            if success:
+                sent_ids.append(notification.id)
+            elif notification.attempts >= self.max_attempts:
+                failed_ids.append(notification.id)
+            else:
+                retries.append((notification.id, now + self.retry_delay * 2 ** (notification.attempts - 1)))
+
+        self.db.complete_notifications(sent_ids, failed_ids, retries)
+
+        with self._lock:
+            self._in_flight.difference_update(notification.id for notification, _ in results)
+
+        if len(failed_ids) > 0:
+            logger.warning("Gave up delivering {} notifications after {} attempts".format(len(failed_ids), self.max_attempts))
+
+    def _deliver(self):
+        """Claims due notifications and queues them at the dispatcher. Returns whether a full batch was claimed"""
+        limit = min(self.batch_size, self.max_in_flight - self.in_flight)
+        if limit <= 0:
+            return False
+
+        notifications = self.db.claim_notifications(self._clock(), limit, self.lease)
+        for group in group_notifications(notifications):
+            with self._lock:
+                # The lease of a notification which is still queued at the dispatcher expired - it's sent only once
+                group = [notification for notification in group if notification.id not in self._in_flight]
+                self._in_flight.update(notification.id for notification in group)
+
+            if len(group) == 0:
+                continue
+
+            try:
+                message = self.render(group)
+            except Exception as e:
+                logger.error("Couldn't render the notifications {}: {}".format([n.id for n in group], e))
+                self._on_result(group, False)
+                continue
+
+            if message is None:
+                self._on_result(group, True)
+                continue
+
+            text, options = message
+            self.dispatcher.send(group[0].user_id, text, on_result=lambda success, g=group: self._on_result(g, success),
+                                 **options)
+
+        if len(notifications) > 0:
+            logger.debug("Queued {} notifications of the outbox".format(len(notifications)))
+
+        return len(notifications) >= limit
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+
+            try:
+                self._write_results()
+                more = self._deliver()
+            except Exception as e:
+                logger.error("Error while delivering the outbox: {}".format(e))
+                more = False
+
+            if not more:
+                self._wakeup.wait(self.interval)
+
+        try:
+            self._write_results()
+        except Exception as e:
+            logger.error("Couldn't write the results of the outbox: {}".format(e))
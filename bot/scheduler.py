@@ -0,0 +1,56 @@
+"""Adaptive scheduling of the price checks of single entities"""
+# -*- coding: utf-8 -*-
+import logging
+import math
+import time
+
+from database.db_wrapper import DBwrapper
+from geizhals.entities import EntityType
+
+logger = logging.getLogger(__name__)
+
+
+class CheckScheduler(object):
+    """
+    Keeps a next-check time per entity. Entities with volatile prices and many subscribers are checked more often,
+    entities whose price didn't change for a long time are checked less often - always within the configured bounds.
+    """
+
+    def __init__(self, min_interval=30 * 60, max_interval=6 * 60 * 60, volatility_window=7 * 24 * 60 * 60):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.volatility_window = volatility_window
+
+    def compute_interval(self, price_changes, subscribers):
+        """Returns the check interval in seconds for an entity with the given number of recent price changes and subscribers"""
+        changes_per_day = price_changes / (self.volatility_window / (24 * 60 * 60))
+        interval = self.max_interval / (1 + 2 * changes_per_day)
+        interval /= 1 + math.log2(max(subscribers, 1)) / 4
+
+        return int(min(self.max_interval, max(self.min_interval, interval)))
+
+    def reschedule(self, entities, now=None):
+        """Computes and stores the next check of the given (just checked) entities"""
+        if len(entities) == 0:
+            return
+
+        now = now or int(time.time())
+        db = DBwrapper.get_instance()
+        since = now - self.volatility_window
+
+        # Only the rows of the rescheduled entities are counted
+        product_ids = [entity.entity_id for entity in entities if entity.TYPE == EntityType.PRODUCT]
+        wishlist_ids = [entity.entity_id for entity in entities if entity.TYPE == EntityType.WISHLIST]
+        price_changes = {EntityType.PRODUCT: db.get_product_price_change_counts(product_ids, since),
+                         EntityType.WISHLIST: db.get_wishlist_price_change_counts(wishlist_ids, since)}
+        subscribers = {EntityType.PRODUCT: db.get_product_subscriber_counts(product_ids),
+                       EntityType.WISHLIST: db.get_wishlist_subscriber_counts(wishlist_ids)}
+
+        entries = []
+        for entity in entities:
+            interval = self.compute_interval(price_changes[entity.TYPE].get(entity.entity_id, 0),
+                                             subscribers[entity.TYPE].get(entity.entity_id, 0))
+            entries.append((entity.entity_id, entity.TYPE.value, now + interval, interval))
+
+        db.update_check_schedule(entries)
+        logger.debug("Rescheduled {} entities".format(len(entries)))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bot.broadcast import BroadcastWorker
+from bot.dispatcher import PRIORITY_BROADCAST
+from database.broadcasts import Broadcast
+
+
+class FakeDB(object):
+
+    def __init__(self, recipients, broadcast):
+        self.recipients = recipients
+        self.broadcast = broadcast
+        self.checkpoints = []
+
+    def get_unfinished_broadcasts(self):
+        return [self.broadcast] if self.broadcast.finished is None else []
+
+    def get_broadcast(self, broadcast_id):
+        return self.broadcast
+
+    def get_broadcast_recipients(self, after_user_id, limit):
+        return [user_id for user_id in self.recipients if user_id > after_user_id][:limit]
+
+    def checkpoint_broadcast(self, broadcast_id, last_user_id, sent, failed, finished=False):
+        self.checkpoints.append((last_user_id, sent, failed, finished))
+        self.broadcast = self.broadcast._replace(last_user_id=last_user_id, sent=self.broadcast.sent + sent,
+                                                 failed=self.broadcast.failed + failed, finished=1 if finished else None)
+
+
+class FakeDispatcher(object):
+    """Reports the result of each message right away - messages to the users in failing are not delivered"""
+
+    def __init__(self):
+        self.messages = []
+        self.failing = set()
+
+    def send(self, chat_id, text, priority=None, on_result=None, **kwargs):
+        self.messages.append((chat_id, text, priority))
+        on_result(chat_id not in self.failing)
+
+
+class BroadcastWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDB([1, 2, 3, 4, 5], Broadcast(7, "Hello", 42, 1000, 0, 5, 0, 0, None))
+        self.dispatcher = FakeDispatcher()
+        self.reports = []
+        self.worker = BroadcastWorker(self.db, self.dispatcher, self.reports.append, batch_size=2, report_interval=0)
+
+    def test_send(self):
+        """Test to check if a broadcast is sent in batches and the progress is stored after each batch"""
+        self.dispatcher.failing = {4}
+        self.worker._send(self.db.broadcast)
+
+        self.assertEqual([(user_id, "Hello", PRIORITY_BROADCAST) for user_id in (1, 2, 3, 4, 5)], self.dispatcher.messages)
+        self.assertEqual([(2, 2, 0, False), (4, 1, 1, False), (5, 1, 0, False), (5, 0, 0, True)], self.db.checkpoints)
+        self.assertEqual([2, 4, 5], [report.sent + report.failed for report in self.reports[:3]])
+        self.assertEqual(1, self.reports[-1].finished)
+        self.assertEqual((4, 1), (self.reports[-1].sent, self.reports[-1].failed))
+
+    def test_resume(self):
+        """Test to check if a broadcast continues after its checkpoint"""
+        self.db.broadcast = self.db.broadcast._replace(last_user_id=3, sent=3)
+        self.worker._send(self.db.broadcast)
+        self.assertEqual([4, 5], [chat_id for chat_id, _, _ in self.dispatcher.messages])
+        self.assertEqual(5, self.db.broadcast.sent)
+
+    def test_stop(self):
+        """Test to check if a batch without results isn't stored as done when the worker is stopped"""
+        self.dispatcher.send = lambda chat_id, text, priority=None, on_result=None: self.worker._stopped.set()
+        self.worker._send(self.db.broadcast)
+        self.assertEqual([], self.db.checkpoints)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bot.cache import TTLCache
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(max_entries=2, ttl=10, clock=self.clock)
+
+    def test_expiry(self):
+        """Test to check if entries expire after ttl seconds"""
+        self.cache.put(1, "user")
+        self.clock.now = 9
+        self.assertEqual("user", self.cache.get(1))
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_lru(self):
+        """Test to check if the least recently used entry is dropped"""
+        self.cache.put(1, "a")
+        self.cache.put(2, "b")
+        self.cache.get(1)
+        self.cache.put(3, "c")
+        self.assertIn(1, self.cache)
+        self.assertNotIn(2, self.cache)
+        self.assertIn(3, self.cache)
+
+    def test_get_or_load(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return "value"
+
+        self.assertEqual("value", self.cache.get_or_load(1, load))
+        self.assertEqual("value", self.cache.get_or_load(1, load))
+        self.assertEqual(1, len(loads))
+
+        # None means 'not found' and is not cached
+        self.assertIsNone(self.cache.get_or_load(2, lambda: None))
+        self.assertNotIn(2, self.cache)
+
+    def test_invalidate_during_load(self):
+        """Test to check if a value loaded before an invalidation is not stored"""
+        def load():
+            self.cache.invalidate(1)
+            return "stale"
+
+        self.assertEqual("stale", self.cache.get_or_load(1, load))
+        self.assertNotIn(1, self.cache)
+
+        self.cache.put(1, "value")
+        self.cache.clear()
+        self.assertNotIn(1, self.cache)
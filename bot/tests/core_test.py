@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from collections import namedtuple
+
+import bot.core as core
+from bot.user import User
+from database.db_wrapper import DBwrapper
+
+# Stand-in for the user object of Telegram, which carries more attributes than the stored user
+TelegramUser = namedtuple("TelegramUser", ["id", "first_name", "username", "lang_code", "is_bot"])
+
+
+class CoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        core.user_cache.clear()
+        core.subscription_cache.clear()
+
+    def tearDown(self):
+        core.user_cache.clear()
+        core.subscription_cache.clear()
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def test_add_user_if_new_caches_stored_user(self):
+        """Test to check if get_user_by_id returns the stored user, no matter which object added the user"""
+        core.add_user_if_new(TelegramUser(1, "Max", "max", "de", False))
+        self.assertTrue(self.db.is_user_saved(1))
+
+        user = core.get_user_by_id(1)
+        self.assertIsInstance(user, User)
+        self.assertEqual("max", user.username)
+
+        # Users who are already stored are neither added again nor replaced in the cache
+        core.add_user_if_new(TelegramUser(1, "Other", "other", "en", False))
+        self.assertIsInstance(core.get_user_by_id(1), User)
+        self.assertEqual("max", core.get_user_by_id(1).username)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from bot.dispatcher import MessageDispatcher, PRIORITY_ALERT, PRIORITY_BROADCAST
+
+
+class FakeRetryAfter(Exception):
+
+    def __init__(self, retry_after):
+        super().__init__("Flood control exceeded")
+        self.retry_after = retry_after
+
+
+class FakeTimedOut(Exception):
+    pass
+
+
+class FakeUnauthorized(Exception):
+    pass
+
+
+class FakeBot(object):
+    """Records the sent messages and raises the queued errors instead of sending"""
+
+    def __init__(self):
+        self.sent = []
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.lock:
+            if len(self.errors) > 0:
+                raise self.errors.pop(0)
+
+            self.sent.append((chat_id, text, kwargs))
+
+
+class MessageDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bot = FakeBot()
+        self.unauthorized = []
+        self.dispatcher = MessageDispatcher(self.bot.send_message, rate=1000, per_chat_rate=20, workers=1, max_retries=1,
+                                            retry_delay=0.01,
+                                            retry_after=(FakeRetryAfter,), retry=(FakeTimedOut,),
+                                            unauthorized=(FakeUnauthorized,),
+                                            on_unauthorized=lambda chat_id, e: self.unauthorized.append(chat_id))
+
+    def tearDown(self):
+        self.dispatcher.close(timeout=5)
+
+    def send_all(self):
+        self.dispatcher.start()
+        self.assertTrue(self.dispatcher.join(timeout=5))
+
+    def test_send(self):
+        self.dispatcher.send(1, "Hello", parse_mode="HTML")
+        self.send_all()
+        self.assertEqual([(1, "Hello", {"parse_mode": "HTML"})], self.bot.sent)
+        self.assertEqual(1, self.dispatcher.sent)
+        self.assertEqual(0, self.dispatcher.pending)
+
+    def test_priority(self):
+        """Test to check if price alerts are sent before broadcasts"""
+        self.dispatcher.send(1, "Broadcast", priority=PRIORITY_BROADCAST)
+        self.dispatcher.send(2, "Alert", priority=PRIORITY_ALERT)
+        self.send_all()
+        self.assertEqual(["Alert", "Broadcast"], [text for _, text, _ in self.bot.sent])
+
+    def test_per_chat_limit(self):
+        """Test to check if other chats are served while a chat has to wait for its next token"""
+        self.dispatcher.send(1, "first")
+        self.dispatcher.send(1, "second")
+        self.dispatcher.send(2, "other")
+        self.send_all()
+        self.assertEqual([(1, "first"), (2, "other"), (1, "second")], [(chat_id, text) for chat_id, text, _ in self.bot.sent])
+
+    def test_retry(self):
+        self.bot.errors = [FakeRetryAfter(0.01), FakeTimedOut()]
+        self.dispatcher.max_retries = 2
+        self.dispatcher.send(1, "Hello")
+        self.send_all()
+        self.assertEqual(1, len(self.bot.sent))
+        self.assertEqual(0, self.dispatcher.failed)
+
+    def test_give_up(self):
+        """Test to check if a message is dropped after max_retries failed retries"""
+        self.dispatcher.max_retries = 0
+        self.bot.errors = [FakeTimedOut()]
+        self.dispatcher.send(1, "Hello")
+        self.send_all()
+        self.assertEqual(0, len(self.bot.sent))
+        self.assertEqual(1, self.dispatcher.failed)
+
+    def test_unauthorized(self):
+        self.bot.errors = [FakeUnauthorized()]
+        self.dispatcher.send(1, "Hello")
+        self.dispatcher.send(2, "Hello")
+        self.send_all()
+        self.assertEqual([1], self.unauthorized)
+        self.assertEqual([2], [chat_id for chat_id, _, _ in self.bot.sent])
+
+    def test_on_result(self):
+        results = []
+        self.bot.errors = [FakeUnauthorized()]
+        self.dispatcher.send(1, "Hello", on_result=lambda success: results.append(("first", success)))
+        self.dispatcher.send(2, "Hello", on_result=lambda success: results.append(("second", success)))
+        self.send_all()
+        self.assertEqual([("first", False), ("second", True)], results)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bot.history import HistoryCache, build_series, downsample, render_history, get_history_period
+from database.price_history import DAILY, HOURLY
+from geizhals.entities import EntityType
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_get_history_period(self):
+        self.assertEqual(HOURLY, get_history_period(7))
+        self.assertEqual(DAILY, get_history_period(30))
+
+    def test_build_series(self):
+        """Test to check if periods without price change keep the last close price"""
+        rollups = [(0, 9.0, 10.0, 10.0), (2 * DAILY, 8.0, 10.0, 8.0)]
+        self.assertEqual([10.0, 10.0, 8.0, 8.0], build_series(rollups, 3 * DAILY + 100, DAILY))
+        self.assertEqual([], build_series([], 3 * DAILY, DAILY))
+
+    def test_downsample(self):
+        self.assertEqual([1, 2, 3], downsample([1, 2, 3], 5))
+        self.assertEqual([2, 4, 6], downsample([1, 2, 3, 4, 5, 6], 3))
+        self.assertEqual(30, len(downsample(list(range(365)), 30)))
+
+    def test_render_history(self):
+        rollups = [(0, 9.0, 10.0, 10.0), (2 * DAILY, 8.0, 10.0, 8.0)]
+        history = render_history(rollups, 30, 8.0, 3 * DAILY)
+        self.assertIn("<code>██▁▁</code>", history)
+        self.assertIn("Tiefstpreis: 8.00 €", history)
+        self.assertIn("Höchstpreis: 10.00 €", history)
+        self.assertIn("Aktuell: <b>8.00 €</b>", history)
+
+        history = render_history([], 7, 12.5, 3 * DAILY)
+        self.assertIn("nicht geändert", history)
+        self.assertIn("12.50 €", history)
+
+
+class HistoryCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        """Test to check if the least recently used entry is dropped first"""
+        cache = HistoryCache(max_entries=2)
+        cache.put((EntityType.PRODUCT, 1, 7, 0), "a")
+        cache.put((EntityType.PRODUCT, 2, 7, 0), "b")
+        self.assertEqual("a", cache.get((EntityType.PRODUCT, 1, 7, 0)))
+
+        cache.put((EntityType.PRODUCT, 3, 7, 0), "c")
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get((EntityType.PRODUCT, 2, 7, 0)))
+        self.assertEqual("a", cache.get((EntityType.PRODUCT, 1, 7, 0)))
+
+    def test_invalidate(self):
+        """Test to check if all ranges of an entity are dropped when it gets a new price"""
+        cache = HistoryCache()
+        cache.put((EntityType.PRODUCT, 1, 7, 0), "a")
+        cache.put((EntityType.PRODUCT, 1, 30, 0), "b")
+        cache.put((EntityType.WISHLIST, 1, 7, 0), "c")
+
+        cache.invalidate([(EntityType.PRODUCT, 1)])
+        self.assertIsNone(cache.get((EntityType.PRODUCT, 1, 7, 0)))
+        self.assertIsNone(cache.get((EntityType.PRODUCT, 1, 30, 0)))
+        self.assertEqual("c", cache.get((EntityType.WISHLIST, 1, 7, 0)))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from bot.outbox import OutboxWorker, group_notifications, merge_changes
+from database.outbox import Notification
+from geizhals.entities import EntityType
+
+
+class FakeDB(object):
+
+    def __init__(self, notifications):
+        self.notifications = notifications
+        self.sent = []
+        self.failed = []
+        self.retries = []
+
+    def release_notifications(self):
+        return 0
+
+    def claim_notifications(self, now, limit, lease):
+        claimed, self.notifications = self.notifications[:limit], self.notifications[limit:]
+        return claimed
+
+    def complete_notifications(self, sent_ids, failed_ids=(), retries=()):
+        self.sent.extend(sent_ids)
+        self.failed.extend(failed_ids)
+        self.retries.extend(retries)
+
+
+class FakeDispatcher(object):
+    """Keeps the messages until their result is reported"""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, chat_id, text, on_result=None, **kwargs):
+        self.messages.append((chat_id, text, kwargs, on_result))
+
+    def join(self, timeout=None):
+        """Sends all kept messages"""
+        for message in self.messages:
+            message[3](True)
+        self.messages = []
+        return True
+
+
+def create_notification(notification_id, attempts=1, user_id=None, entity_id=123456, old_price=10.0, new_price=8.5,
+                        digest=False):
+    return Notification(notification_id, user_id or 100 + notification_id, EntityType.PRODUCT, entity_id, "Product",
+                        "https://geizhals.de/a{}".format(entity_id), old_price, new_price, 1000, attempts, digest)
+
+
+class DigestTest(unittest.TestCase):
+
+    def test_group_notifications(self):
+        """Test to check if only the digest notifications of a user are grouped into one message"""
+        notifications = [create_notification(1, user_id=1, digest=True), create_notification(2, user_id=2),
+                         create_notification(3, user_id=1, digest=True), create_notification(4, user_id=2),
+                         create_notification(5, user_id=3, digest=True)]
+        self.assertEqual([[1, 3], [2], [4], [5]], [[n.id for n in group] for group in group_notifications(notifications)])
+
+    def test_merge_changes(self):
+        """Test to check if several changes of an entity are merged and reverted changes are dropped"""
+        changes = merge_changes([create_notification(1, entity_id=1, old_price=10.0, new_price=9.0),
+                                 create_notification(2, entity_id=2, old_price=5.0, new_price=6.0),
+                                 create_notification(3, entity_id=1, old_price=9.0, new_price=8.0),
+                                 create_notification(4, entity_id=2, old_price=6.0, new_price=5.0)])
+        self.assertEqual(1, len(changes))
+        self.assertEqual((1, 10.0, 8.0), (changes[0].entity_id, changes[0].old_price, changes[0].new_price))
+
+
+class OutboxWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDB([create_notification(1), create_notification(2), create_notification(3, attempts=3)])
+        self.dispatcher = FakeDispatcher()
+        self.worker = OutboxWorker(self.db, self.dispatcher, lambda group: ("{} €".format(group[-1].new_price), {"parse_mode": "HTML"}),
+                                   batch_size=2, max_in_flight=2, max_attempts=3, retry_delay=10, clock=lambda: 1000)
+
+    def test_deliver(self):
+        """Test to check if at most max_in_flight notifications are handed to the dispatcher"""
+        self.assertTrue(self.worker._deliver())
+        self.assertEqual([(101, "8.5 €", {"parse_mode": "HTML"}), (102, "8.5 €", {"parse_mode": "HTML"})],
+                         [message[:3] for message in self.dispatcher.messages])
+        self.assertEqual(2, self.worker.in_flight)
+        self.assertFalse(self.worker._deliver())
+        self.assertEqual(2, len(self.dispatcher.messages))
+
+        # Reported results free the slots
+        self.dispatcher.messages[0][3](True)
+        self.worker._write_results()
+        self.assertEqual([1], self.db.sent)
+        self.assertEqual(1, self.worker.in_flight)
+        self.worker._deliver()
+        self.assertEqual(3, len(self.dispatcher.messages))
+
+    def test_failure(self):
+        """Test to check if failed notifications are retried with backoff until max_attempts is reached"""
+        self.worker.batch_size = self.worker.max_in_flight = 3
+        self.worker._deliver()
+        self.dispatcher.messages[1][3](False)
+        self.dispatcher.messages[2][3](False)
+        self.worker._write_results()
+
+        self.assertEqual([(2, 1010)], self.db.retries)
+        self.assertEqual([3], self.db.failed)
+        self.assertEqual(1, self.worker.in_flight)
+
+    def test_render_error(self):
+        self.worker.render = lambda n: 1 / 0
+        self.worker._deliver()
+        self.worker._write_results()
+        self.assertEqual(0, len(self.dispatcher.messages))
+        self.assertEqual(2, len(self.db.retries))
+
+    def test_digest(self):
+        """Test to check if the digest of a user is sent as one message and its result applies to all notifications"""
+        self.db.notifications = [create_notification(1, user_id=1, digest=True), create_notification(2, user_id=1, digest=True)]
+        self.worker._deliver()
+        self.assertEqual(1, len(self.dispatcher.messages))
+        self.dispatcher.messages[0][3](True)
+        self.worker._write_results()
+        self.assertEqual([1, 2], self.db.sent)
+
+    def test_nothing_to_tell(self):
+        """Test to check if notifications without message are marked as sent"""
+        self.worker.render = lambda group: None
+        self.worker._deliver()
+        self.worker._write_results()
+        self.assertEqual(0, len(self.dispatcher.messages))
+        self.assertEqual([1, 2], self.db.sent)
+
+    def test_close(self):
+        """Test to check if close waits for the queued messages and writes their results"""
+        self.worker.start()
+        self.worker.wake()
+        deadline = time.time() + 5
+        while len(self.dispatcher.messages) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.worker.close(timeout=5)
+        self.assertEqual([1, 2], sorted(self.db.sent))
+        self.assertEqual(0, self.worker.in_flight)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from bot.scheduler import CheckScheduler
+from database.db_wrapper import DBwrapper
+from geizhals.entities import Product, Wishlist
+
+
+class CheckSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        self.scheduler = CheckScheduler(min_interval=30 * 60, max_interval=6 * 60 * 60, volatility_window=7 * 24 * 60 * 60)
+
+        self.wl = Wishlist(123456, "Wishlist", "https://geizhals.de/?cat=WL-123456", 123.45)
+        self.p = Product(123456, "Product", "https://geizhals.de/a123456.html", 123.45)
+        self.p2 = Product(654321, "Product 2", "https://geizhals.de/a654321.html", 99.99)
+
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_product(self.p2.entity_id, self.p2.name, self.p2.price, self.p2.url)
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def get_check_schedule(self):
+        self.db.cursor.execute("SELECT entity_type, entity_id, next_check FROM check_schedule;")
+        return {(entity_type, entity_id): next_check for entity_type, entity_id, next_check in self.db.cursor.fetchall()}
+
+    def test_compute_interval(self):
+        """Test to check if volatile and popular entities get shorter intervals within the bounds"""
+        self.assertEqual(6 * 60 * 60, self.scheduler.compute_interval(price_changes=0, subscribers=1))
+
+        volatile = self.scheduler.compute_interval(price_changes=14, subscribers=1)
+        popular = self.scheduler.compute_interval(price_changes=0, subscribers=16)
+        self.assertLess(volatile, 6 * 60 * 60)
+        self.assertLess(popular, 6 * 60 * 60)
+        self.assertLess(self.scheduler.compute_interval(price_changes=14, subscribers=16), volatile)
+
+        self.assertEqual(30 * 60, self.scheduler.compute_interval(price_changes=1000, subscribers=1000))
+
+    def test_reschedule(self):
+        """Test to check if the next check is based on the price history and the subscribers"""
+        now = 10000000
+        self.db.add_user(1, "John", "Doe")
+        self.db.add_user(2, "Jane", "Doe")
+        self.db.subscribe_product(self.p.entity_id, 1)
+        self.db.subscribe_product(self.p.entity_id, 2)
+
+        for i in range(10):
+            self.db.cursor.execute("INSERT INTO product_prices VALUES (?, ?, ?)", [self.p.entity_id, 100 + i, now - i * 3600])
+        # Old price changes are ignored
+        self.db.cursor.execute("INSERT INTO product_prices VALUES (?, ?, ?)", [self.p2.entity_id, 1, now - 30 * 24 * 3600])
+        self.db.connection.commit()
+
+        self.scheduler.reschedule([self.p, self.p2], now)
+        schedule = self.get_check_schedule()
+
+        self.assertEqual(now + self.scheduler.compute_interval(10, 2), schedule[(self.p.TYPE.value, self.p.entity_id)])
+        self.assertEqual(now + 6 * 60 * 60, schedule[(self.p2.TYPE.value, self.p2.entity_id)])
+        self.assertNotIn((self.wl.TYPE.value, self.wl.entity_id), schedule)
+
+        # Rescheduling nothing doesn't touch the schedule and other entities are not counted
+        self.scheduler.reschedule([], now + 60)
+        self.assertEqual(schedule, self.get_check_schedule())
+        self.assertEqual({self.p.entity_id: 2}, self.db.get_product_subscriber_counts([self.p.entity_id, self.p2.entity_id]))
+        self.assertEqual({}, self.db.get_product_price_change_counts([self.p2.entity_id], now - 60))
+
+        # Removing an entity removes its schedule
+        self.db.rm_product(self.p.entity_id)
+        self.assertNotIn((self.p.TYPE.value, self.p.entity_id), self.get_check_schedule())
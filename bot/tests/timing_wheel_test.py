@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bot.timing_wheel import TimingWheel
+
+
+class TimingWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimingWheel(interval=600, slots=10)
+
+    def test_spread(self):
+        """Test to check if the items are spread evenly over the whole interval"""
+        items = list(range(100))
+        self.assertEqual([], self.wheel.start_cycle(items, now=0))
+        self.assertEqual(100, self.wheel.pending)
+
+        dispatched = []
+        for now in range(0, 600, 60):
+            due = self.wheel.pop_due(now)
+            # Each slot holds roughly a tenth of the items
+            self.assertGreaterEqual(len(due), 8)
+            self.assertLessEqual(len(due), 12)
+            dispatched.extend(due)
+            self.assertEqual(0, self.wheel.lag)
+
+        # Every item is dispatched exactly once
+        self.assertEqual(items, sorted(dispatched))
+        self.assertEqual(0, self.wheel.pending)
+        self.assertEqual([], self.wheel.pop_due(599))
+
+    def test_lag(self):
+        """Test to check if the wheel reports how far it is behind schedule and catches up"""
+        self.wheel.start_cycle(list(range(10)), now=0)
+        self.assertEqual(1, len(self.wheel.pop_due(10)))
+
+        # Slots 1 to 4 are overdue when dispatching at 290 seconds
+        due = self.wheel.pop_due(290)
+        self.assertEqual(4, len(due))
+        self.assertEqual(290 - 60 - 60, self.wheel.lag)
+
+    def test_cycle(self):
+        """Test to check if items of an unfinished cycle are handed out when the next cycle starts"""
+        self.assertTrue(self.wheel.is_cycle_finished(0))
+        self.wheel.start_cycle(["a", "b", "c", "d", "e"], now=0)
+        self.assertFalse(self.wheel.is_cycle_finished(599))
+        self.assertTrue(self.wheel.is_cycle_finished(600))
+
+        dispatched = self.wheel.pop_due(300)
+        leftover = self.wheel.start_cycle(["f"], now=600)
+        self.assertEqual(["a", "b", "c", "d", "e"], sorted(dispatched + leftover))
+        self.assertEqual(1, self.wheel.pending)
+
+        with self.assertRaises(ValueError):
+            TimingWheel(interval=600, slots=0)
@@ -0,0 +1,83 @@
+"""Timing wheel which spreads the entity checks of a cycle evenly over the whole interval"""
+# -*- coding: utf-8 -*-
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+class TimingWheel(object):
+    """
+    Distributes items evenly (with random jitter) over the slots of a cycle. Each slot is dispatched once its time has
+    come. Items which were not dispatched until the end of a cycle are handed out when the next cycle starts, so
+    every item of a cycle gets dispatched exactly once.
+    """
+
+    def __init__(self, interval, slots, jitter=1.0):
+        if slots < 1:
+            raise ValueError("A timing wheel needs at least one slot!")
+
+        self.interval = interval
+        self.slots = slots
+        self.slot_length = interval / slots
+        self.jitter = jitter
+        self.lag = 0
+        self._buckets = [[] for _ in range(slots)]
+        self._cycle_start = None
+        self._position = 0
+
+    @property
+    def pending(self):
+        """Number of items which are planned but not yet dispatched"""
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def is_cycle_finished(self, now):
+        return self._cycle_start is None or now >= self._cycle_start + self.interval
+
+    def start_cycle(self, items, now):
+        """
+        Plans the given items over the next interval. Returns the items of the previous cycle which were not
+        dispatched yet - they are overdue and should be handled right away.
+        """
+        leftover = self._take_slots(self.slots)
+        if len(leftover) > 0:
+            logger.warning("{} items of the last cycle were not dispatched in time!".format(len(leftover)))
+
+        self._cycle_start = now
+        self._position = 0
+
+        item_count = len(items)
+        for index, item in enumerate(items):
+            offset = (index + random.uniform(0, self.jitter)) * self.interval / item_count
+            slot = min(int(offset / self.slot_length), self.slots - 1)
+            self._buckets[slot].append(item)
+
+        logger.info("Planned {} items in {} slots of {:.0f} seconds".format(item_count, self.slots, self.slot_length))
+        return leftover
+
+    def pop_due(self, now):
+        """Returns the items of all slots whose time has come and updates how far behind schedule the wheel is"""
+        if self._cycle_start is None:
+            return []
+
+        due_slot = min(int((now - self._cycle_start) / self.slot_length), self.slots - 1)
+        if due_slot < self._position:
+            return []
+
+        # The oldest slot which gets dispatched now determines how late we are
+        scheduled_time = self._cycle_start + self._position * self.slot_length
+        self.lag = max(0, now - scheduled_time - self.slot_length)
+        if self.lag > 0:
+            logger.warning("Timing wheel is {:.0f} seconds behind schedule!".format(self.lag))
+
+        return self._take_slots(due_slot + 1)
+
+    def _take_slots(self, end):
+        """Removes and returns the items of all slots from the current position up to (excluding) end"""
+        items = []
+        while self._position < end:
+            items.extend(self._buckets[self._position])
+            self._buckets[self._position] = []
+            self._position += 1
+
+        return items
@@ -11,3 +11,7 @@ class User(object):
         self.first_name = first_name
         self.username = username
         self.lang_code = lang_code or "de-DE"
+
+    @property
+    def id(self):
+        return self.user_id
@@ -6,3 +6,65 @@ CERTPATH = "/etc/certs/example.com/fullchain.cer"
 USE_PROXIES = True
 PROXY_LIST = ""
 ADMIN_IDs = [1234, 4321]
+
+# Number of entities which are checked concurrently and the max. number of parallel requests per domain/proxy
+MAX_CONCURRENT_CHECKS = 8
+MAX_REQUESTS_PER_DOMAIN = 4
+MAX_REQUESTS_PER_PROXY = 2
+# Max. number of pages which are downloaded or parsed at the same time - bounds the memory used by the price check
+MAX_PAGES_IN_FLIGHT = 16
+
+# Max. number of keep-alive connections per (proxy, host) pair
+SESSION_POOL_SIZE = 10
+
+# Stop downloading entity pages as soon as name and price were received
+STREAMING_DOWNLOADS = True
+
+# Backend for extracting names and prices from pages - either "pyquery" or the faster "regex" (falls back to pyquery)
+EXTRACTOR = "regex"
+
+# Initial and max. request rate per Geizhals host - the rate adapts itself when Geizhals starts blocking requests
+REQUESTS_PER_SECOND = 5.0
+MAX_REQUESTS_PER_SECOND = 20.0
+
+# Bounds of the check interval per entity and the length of the time slots the checks are spread over (all in minutes)
+MIN_CHECK_INTERVAL = 30
+MAX_CHECK_INTERVAL = 360
+CHECK_TICK = 1
+
+# Price and name changes of a check cycle are written in batches - max. number of changes and seconds per transaction
+DB_BATCH_SIZE = 100
+DB_BATCH_INTERVAL = 30
+
+# Days to keep raw price changes and hourly price rollups - daily rollups are kept forever.
+# The raw retention should be longer than the 7 days used to rate the price volatility of an entity
+PRICE_HISTORY_RETENTION = 90
+HOURLY_HISTORY_RETENTION = 30
+
+# Write the price updates of the checks in a background thread - the checks only wait if more writes are queued
+ASYNC_DB_WRITES = True
+DB_WRITE_QUEUE_SIZE = 10000
+
+# Max. number of users and subscription lists cached in memory and seconds until a cached entry is read again
+CACHE_SIZE = 10000
+CACHE_TTL = 300
+
+# Telegram allows about 30 messages per second overall and one message per second to the same chat. Notifications and
+# broadcasts are sent by this many background workers within these limits
+MESSAGES_PER_SECOND = 30
+MESSAGES_PER_CHAT_PER_SECOND = 1
+MESSAGE_WORKERS = 4
+
+# Price change notifications are stored in an outbox and delivered in batches - max. number of notifications claimed at
+# once and handed to the message workers at the same time, and days to keep delivered notifications
+NOTIFICATION_BATCH_SIZE = 100
+MAX_NOTIFICATIONS_IN_FLIGHT = 500
+OUTBOX_RETENTION = 7
+
+# Users can choose to get the price changes as digest (/digest) - minutes in which the changes of a digest are collected
+DIGEST_WINDOW = 60
+
+# Broadcasts are sent in the background in batches of this many users and resumed after a restart - the admins get a
+# progress report every BROADCAST_REPORT_INTERVAL seconds
+BROADCAST_BATCH_SIZE = 100
+BROADCAST_REPORT_INTERVAL = 60
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Alert rules of the subscriptions. A subscriber without rules is notified of every price change, otherwise only of
+changes matching at least one rule: the price drops to or below a target price, the price drops by at least a
+percentage or the price is lower than ever before. The rules are stored in the subscriber tables.
+"""
+import logging
+from collections import namedtuple
+
+from geizhals.entities import EntityType
+
+logger = logging.getLogger(__name__)
+
+AlertRule = namedtuple("AlertRule", ["target_price", "min_drop_percent", "all_time_low"])
+
+# Rule of subscriptions which are notified of every price change
+EVERY_CHANGE = AlertRule(None, None, False)
+
+# Condition matching the subscriptions 's' whose rules match the price change 'c' - both are aliases of the query
+# using it. Comparisons with unset (NULL) rules are never true
+RULE_MATCHES = "((s.target_price IS NULL AND s.min_drop_percent IS NULL AND s.all_time_low = 0) " \
+               "OR (c.new_price <= s.target_price AND c.new_price < c.old_price) " \
+               "OR ((c.old_price - c.new_price) * 100 >= s.min_drop_percent * c.old_price) " \
+               "OR (s.all_time_low = 1 AND c.all_time_low = 1))"
+
+# Subscriber table and id column per entity type
+_tables = {
+    EntityType.PRODUCT: ("product_subscribers", "product_id"),
+    EntityType.WISHLIST: ("wishlist_subscribers", "wishlist_id"),
+}
+
+
+def _get_table(entity_type):
+    try:
+        return _tables[entity_type]
+    except KeyError:
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+
+def get_rule(cursor, user_id, entity_type, entity_id):
+    """Returns the alert rule of a subscription or None if the user didn't subscribe to the entity"""
+    table, id_column = _get_table(entity_type)
+    cursor.execute("SELECT target_price, min_drop_percent, all_time_low FROM {table} WHERE user_id=? AND {id_column}=?;".format(
+        table=table, id_column=id_column), [str(user_id), str(entity_id)])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    return AlertRule(row[0], row[1], bool(row[2]))
+
+
+def set_rule(cursor, user_id, entity_type, entity_id, rule):
+    """Replaces the alert rule of a subscription. Does not commit"""
+    table, id_column = _get_table(entity_type)
+    cursor.execute("UPDATE {table} SET target_price=?, min_drop_percent=?, all_time_low=? WHERE user_id=? AND {id_column}=?;".format(
+        table=table, id_column=id_column), [rule.target_price, rule.min_drop_percent, int(rule.all_time_low), str(user_id), str(entity_id)])
+    return cursor.rowcount > 0
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Broadcast jobs of the admins. The recipients of a broadcast are processed in the order of their user ids and the last
+processed user id is stored as checkpoint, so an interrupted broadcast continues after it instead of starting over.
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Broadcast = namedtuple("Broadcast", ["id", "text", "admin_id", "created", "last_user_id", "total", "sent", "failed", "finished"])
+
+# All users subscribed to at least one entity - the same user id might be in both tables
+_recipients = "SELECT user_id FROM wishlist_subscribers UNION SELECT user_id FROM product_subscribers"
+
+
+def create_table(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS broadcasts "
+                   "(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "text TEXT NOT NULL, "
+                   "admin_id INTEGER NOT NULL, "
+                   "created INTEGER NOT NULL, "
+                   "last_user_id INTEGER NOT NULL DEFAULT 0, "
+                   "total INTEGER NOT NULL DEFAULT 0, "
+                   "sent INTEGER NOT NULL DEFAULT 0, "
+                   "failed INTEGER NOT NULL DEFAULT 0, "
+                   "finished INTEGER);")
+
+
+def _to_broadcast(row):
+    return Broadcast(*row)
+
+
+def create(cursor, text, admin_id, timestamp):
+    """Adds a broadcast to all current subscribers and returns it. Does not commit"""
+    cursor.execute("SELECT COUNT(*) FROM ({});".format(_recipients))
+    total = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO broadcasts (text, admin_id, created, total) VALUES (?, ?, ?, ?);",
+                   [str(text), int(admin_id), int(timestamp), total])
+    return get(cursor, cursor.lastrowid)
+
+
+def get(cursor, broadcast_id):
+    cursor.execute("SELECT id, text, admin_id, created, last_user_id, total, sent, failed, finished FROM broadcasts WHERE id=?;",
+                   [int(broadcast_id)])
+    row = cursor.fetchone()
+    return _to_broadcast(row) if row is not None else None
+
+
+def get_unfinished(cursor):
+    """Returns all broadcasts which are not finished yet, oldest first"""
+    cursor.execute("SELECT id, text, admin_id, created, last_user_id, total, sent, failed, finished FROM broadcasts "
+                   "WHERE finished IS NULL ORDER BY id;")
+    return [_to_broadcast(row) for row in cursor.fetchall()]
+
+
+def get_recipients(cursor, after_user_id, limit):
+    """Returns the next limit recipient user ids after the given one in ascending order"""
+    cursor.execute("SELECT user_id FROM ({}) WHERE user_id>? ORDER BY user_id LIMIT ?;".format(_recipients),
+                   [int(after_user_id), int(limit)])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def checkpoint(cursor, broadcast_id, last_user_id, sent, failed):
+    """Stores the last processed recipient and adds the numbers of sent and failed messages. Does not commit"""
+    cursor.execute("UPDATE broadcasts SET last_user_id=?, sent=sent + ?, failed=failed + ? WHERE id=?;",
+                   [int(last_user_id), int(sent), int(failed), int(broadcast_id)])
+
+
+def finish(cursor, broadcast_id, timestamp):
+    cursor.execute("UPDATE broadcasts SET finished=? WHERE id=?;", [int(timestamp), int(broadcast_id)])
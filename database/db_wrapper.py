@@ -2,10 +2,13 @@
 import logging
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 from bot.user import User
-from geizhals.entities import Product, Wishlist
+from database import alert_rules, broadcasts, migrations, outbox, price_history
+from geizhals.entities import EntityType, Product, Wishlist
 
 __author__ = 'Rico'
 
@@ -14,19 +17,33 @@ class DBwrapper(object):
     class __DBwrapper(object):
         dir_path = os.path.dirname(os.path.abspath(__file__))
         logger = logging.getLogger(__name__)
+        # Seconds a connection waits for a lock held by another connection before raising an error
+        busy_timeout = 10
+        # Max. number of ids passed to a single query - SQLite allows 999 parameters per statement in older versions
+        max_query_params = 400
+        # Seconds of the windows in which the price changes for digest users are collected
+        digest_window = 60 * 60
 
         def __init__(self, db_name="users.db"):
             database_path = os.path.join(self.dir_path, db_name)
 
-            self.connection = None
-            self.cursor = None
+            self.database_path = None
+            self._local = threading.local()
+            self._connections = []
+            self._connections_lock = threading.Lock()
+            self._generation = 0
 
             self.create_database(database_path)
             self.setup_connection(database_path)
             self.create_tables()
+            self.migrate()
 
         def delete_all_tables(self):
             self.logger.info("Dropping all tables!")
+            self.cursor.execute("DROP TABLE IF EXISTS broadcasts;")
+            self.cursor.execute("DROP TABLE IF EXISTS outbox;")
+            self.cursor.execute("DROP TABLE IF EXISTS check_schedule;")
+            self.cursor.execute("DROP TABLE IF EXISTS price_rollups;")
             self.cursor.execute("DROP TABLE IF EXISTS wishlist_subscribers;")
             self.cursor.execute("DROP TABLE IF EXISTS product_subscribers;")
             self.cursor.execute("DROP TABLE IF EXISTS wishlist_prices;")
@@ -34,6 +51,7 @@ class DBwrapper(object):
             self.cursor.execute("DROP TABLE IF EXISTS wishlists;")
             self.cursor.execute("DROP TABLE IF EXISTS products;")
             self.cursor.execute("DROP TABLE IF EXISTS users;")
+            self.cursor.execute("PRAGMA user_version = 0;")
             self.connection.commit()
             self.logger.info("Dropping complete!")
 
@@ -93,11 +111,67 @@ class DBwrapper(object):
                                        FOREIGN KEY('wishlist_id') REFERENCES wishlists(wishlist_id) ON DELETE CASCADE ON UPDATE CASCADE, \
                                        FOREIGN KEY('user_id') REFERENCES users(user_id) ON DELETE CASCADE);")
 
+            self.cursor.execute("CREATE TABLE IF NOT EXISTS 'check_schedule' \
+                                       ('entity_id' INTEGER NOT NULL, \
+                                       'entity_type' INTEGER NOT NULL, \
+                                       'next_check' INTEGER NOT NULL DEFAULT 0, \
+                                       'interval' INTEGER NOT NULL DEFAULT 0, \
+                                       PRIMARY KEY('entity_id', 'entity_type'));")
+
+        def migrate(self):
+            """Upgrades the tables created by create_tables to the current schema version"""
+            return migrations.migrate(self.connection)
+
         def setup_connection(self, database_path):
-            self.connection = sqlite3.connect(database_path, check_same_thread=False)
-            self.connection.execute("PRAGMA foreign_keys = ON;")
-            self.connection.text_factory = lambda x: str(x, 'utf-8', "ignore")
-            self.cursor = self.connection.cursor()
+            """Use the given database - each thread opens its own connection to it when it first accesses the db"""
+            with self._connections_lock:
+                self.database_path = database_path
+                self._generation += 1
+
+            # Open the connection of the current thread right away to switch the database to WAL mode
+            self.connection.execute("PRAGMA journal_mode = WAL;")
+
+        def _connect(self):
+            connection = sqlite3.connect(self.database_path, timeout=self.busy_timeout, check_same_thread=False)
+            connection.execute("PRAGMA foreign_keys = ON;")
+            # With WAL the data is safe after a crash of the bot, only a power loss might lose the last transactions
+            connection.execute("PRAGMA synchronous = NORMAL;")
+            connection.execute("PRAGMA busy_timeout = {};".format(self.busy_timeout * 1000))
+            connection.text_factory = lambda x: str(x, 'utf-8', "ignore")
+            outbox.create_temp_tables(connection)
+
+            with self._connections_lock:
+                self._connections.append(connection)
+
+            return connection
+
+        @property
+        def connection(self):
+            """Returns the connection of the current thread and opens a new one if necessary"""
+            if getattr(self._local, "generation", None) != self._generation:
+                self._local.connection = self._connect()
+                self._local.cursor = self._local.connection.cursor()
+                self._local.generation = self._generation
+
+            return self._local.connection
+
+        @property
+        def cursor(self):
+            """Returns the cursor of the current thread's connection"""
+            # Accessing the connection makes sure that the current thread has one
+            self.connection
+            return self._local.cursor
+
+        @contextmanager
+        def transaction(self):
+            """Context manager for a unit of work - commits on success and rolls back on errors"""
+            connection = self.connection
+            try:
+                yield connection.cursor()
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
 
         def get_subscribed_wishlist_count(self, user_id):
             self.cursor.execute("SELECT COUNT(*) "
@@ -153,6 +227,59 @@ class DBwrapper(object):
 
             return products
 
+        def iter_subscribed_entity_keys(self, due_before=None, batch_size=500):
+            """
+            Generator over the (entity_type, entity_id) keys of all wishlists and products with subscribers. With
+            due_before only the entities whose next check is scheduled before that timestamp (or which were never
+            scheduled) are returned. The rows are fetched in batches on a dedicated cursor, so other queries can be run
+            while iterating.
+            """
+            cursor = self.connection.cursor()
+            try:
+                for entity_type, table, id_column, subscriber_table in ((EntityType.WISHLIST, "wishlists", "wishlist_id", "wishlist_subscribers"),
+                                                                        (EntityType.PRODUCT, "products", "product_id", "product_subscribers")):
+                    query = "SELECT e.{id_column} FROM {table} e " \
+                            "LEFT JOIN check_schedule cs ON cs.entity_id=e.{id_column} AND cs.entity_type=? " \
+                            "WHERE EXISTS (SELECT 1 FROM {subscriber_table} s WHERE s.{id_column}=e.{id_column})".format(
+                                id_column=id_column, table=table, subscriber_table=subscriber_table)
+                    params = [entity_type.value]
+
+                    if due_before is not None:
+                        query += " AND (cs.next_check IS NULL OR cs.next_check<=?)"
+                        params.append(int(due_before))
+
+                    cursor.execute(query + ";", params)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+
+                        for row in rows:
+                            yield entity_type, row[0]
+            finally:
+                cursor.close()
+
+        def get_entities(self, entity_keys):
+            """
+            Returns the products and wishlists of the given (entity_type, entity_id) keys in their order, loaded in one
+            query per chunk of ids. Entities which don't exist anymore are left out.
+            """
+            entities = {}
+
+            for entity_class, table, id_column in ((Wishlist, "wishlists", "wishlist_id"), (Product, "products", "product_id")):
+                ids = [str(entity_id) for entity_type, entity_id in entity_keys if entity_type == entity_class.TYPE]
+
+                # SQLite limits the number of parameters of a statement
+                for start in range(0, len(ids), self.max_query_params):
+                    chunk = ids[start:start + self.max_query_params]
+                    self.cursor.execute("SELECT {id_column}, name, price, url FROM {table} WHERE {id_column} IN ({params});".format(
+                        id_column=id_column, table=table, params=", ".join("?" * len(chunk))), chunk)
+
+                    for entity_id, name, price, url in self.cursor.fetchall():
+                        entities[(entity_class.TYPE, entity_id)] = entity_class(entity_id=entity_id, name=name, price=price, url=url)
+
+            return [entities[key] for key in entity_keys if key in entities]
+
         def get_wishlist_info(self, wishlist_id):
             self.cursor.execute("SELECT wishlist_id, name, price, url FROM wishlists WHERE wishlist_id=?;", [str(wishlist_id)])
             wishlist = self.cursor.fetchone()
@@ -194,18 +321,22 @@ class DBwrapper(object):
 
         def rm_wishlist(self, wishlist_id):
             self.cursor.execute("DELETE FROM wishlists WHERE wishlists.wishlist_id=?", [str(wishlist_id)])
+            self.cursor.execute("DELETE FROM check_schedule WHERE entity_id=? AND entity_type=?", [str(wishlist_id), Wishlist.TYPE.value])
+            price_history.delete_rollups(self.cursor, Wishlist.TYPE, wishlist_id)
             self.connection.commit()
 
         def rm_product(self, product_id):
             self.cursor.execute("DELETE FROM products WHERE products.product_id=?", [str(product_id)])
+            self.cursor.execute("DELETE FROM check_schedule WHERE entity_id=? AND entity_type=?", [str(product_id), Product.TYPE.value])
+            price_history.delete_rollups(self.cursor, Product.TYPE, product_id)
             self.connection.commit()
 
         def subscribe_wishlist(self, wishlist_id, user_id):
-            self.cursor.execute("INSERT INTO wishlist_subscribers VALUES (?, ?);", [str(wishlist_id), str(user_id)])
+            self.cursor.execute("INSERT OR IGNORE INTO wishlist_subscribers (wishlist_id, user_id) VALUES (?, ?);", [str(wishlist_id), str(user_id)])
             self.connection.commit()
 
         def subscribe_product(self, product_id, user_id):
-            self.cursor.execute("INSERT INTO product_subscribers VALUES (?, ?);", [str(product_id), str(user_id)])
+            self.cursor.execute("INSERT OR IGNORE INTO product_subscribers (product_id, user_id) VALUES (?, ?);", [str(product_id), str(user_id)])
             self.connection.commit()
 
         def unsubscribe_wishlist(self, user_id, wishlist_id):
@@ -250,6 +381,55 @@ class DBwrapper(object):
 
             return user_ids
 
+        def get_subscribers_for_entities(self, entity_keys):
+            """
+            Returns the subscribers of many products and wishlists, given as (entity_type, entity_id) tuples, with their
+            user info in one query per chunk of ids. The result is a dict {(entity_type, entity_id): [User, ...]}.
+            """
+            product_ids = [str(entity_id) for entity_type, entity_id in entity_keys if entity_type == EntityType.PRODUCT]
+            wishlist_ids = [str(entity_id) for entity_type, entity_id in entity_keys if entity_type == EntityType.WISHLIST]
+            subscribers = {}
+
+            # SQLite limits the number of parameters of a statement
+            for start in range(0, max(len(product_ids), len(wishlist_ids)), self.max_query_params):
+                p_chunk = product_ids[start:start + self.max_query_params]
+                wl_chunk = wishlist_ids[start:start + self.max_query_params]
+                self.cursor.execute("SELECT ?, ps.product_id, u.user_id, u.first_name, u.username, u.lang_code "
+                                    "FROM product_subscribers ps INNER JOIN users u ON u.user_id=ps.user_id "
+                                    "WHERE ps.product_id IN ({p_params}) "
+                                    "UNION ALL "
+                                    "SELECT ?, ws.wishlist_id, u.user_id, u.first_name, u.username, u.lang_code "
+                                    "FROM wishlist_subscribers ws INNER JOIN users u ON u.user_id=ws.user_id "
+                                    "WHERE ws.wishlist_id IN ({wl_params});".format(p_params=", ".join("?" * len(p_chunk)),
+                                                                                   wl_params=", ".join("?" * len(wl_chunk))),
+                                    [EntityType.PRODUCT.value] + p_chunk + [EntityType.WISHLIST.value] + wl_chunk)
+
+                for type_value, entity_id, user_id, first_name, username, lang_code in self.cursor.fetchall():
+                    user = User(user_id=user_id, first_name=first_name, username=username, lang_code=lang_code)
+                    subscribers.setdefault((EntityType(type_value), entity_id), []).append(user)
+
+            return subscribers
+
+        def rm_entities(self, entity_keys):
+            """Removes many products and wishlists, given as (entity_type, entity_id) tuples, and all of their subscriptions"""
+            with self.transaction() as cursor:
+                for entity_type, entity_id in entity_keys:
+                    self._rm_entity(cursor, entity_type, entity_id)
+
+        def _rm_entity(self, cursor, entity_type, entity_id):
+            """Deletes an entity with its subscriptions, schedule and price history without committing"""
+            if entity_type == EntityType.PRODUCT:
+                cursor.execute("DELETE FROM product_subscribers WHERE product_id=?;", [str(entity_id)])
+                cursor.execute("DELETE FROM products WHERE product_id=?;", [str(entity_id)])
+            elif entity_type == EntityType.WISHLIST:
+                cursor.execute("DELETE FROM wishlist_subscribers WHERE wishlist_id=?;", [str(entity_id)])
+                cursor.execute("DELETE FROM wishlists WHERE wishlist_id=?;", [str(entity_id)])
+            else:
+                raise ValueError("The given type {} is unknown!".format(entity_type))
+
+            cursor.execute("DELETE FROM check_schedule WHERE entity_id=? AND entity_type=?", [str(entity_id), entity_type.value])
+            price_history.delete_rollups(cursor, entity_type, entity_id)
+
         def get_wishlists_for_user(self, user_id):
             """Return all wishlists a user subscribed to"""
             self.cursor.execute(
@@ -285,6 +465,23 @@ class DBwrapper(object):
             result = self.cursor.fetchone()
             return result and len(result) > 0
 
+        def get_subscription_ids(self, user_id):
+            """Returns the ids of the wishlists and the ids of the products a user subscribed to as two sets"""
+            self.cursor.execute("SELECT ?, wishlist_id FROM wishlist_subscribers WHERE user_id=? "
+                                "UNION ALL "
+                                "SELECT ?, product_id FROM product_subscribers WHERE user_id=?;",
+                                [EntityType.WISHLIST.value, str(user_id), EntityType.PRODUCT.value, str(user_id)])
+            wishlist_ids = set()
+            product_ids = set()
+
+            for type_value, entity_id in self.cursor.fetchall():
+                if type_value == EntityType.WISHLIST.value:
+                    wishlist_ids.add(entity_id)
+                else:
+                    product_ids.add(entity_id)
+
+            return wishlist_ids, product_ids
+
         def is_user_product_subscriber(self, user_id, product_id):
             self.cursor.execute("SELECT * FROM product_subscribers AS ps WHERE ps.user_id=? AND ps.product_id=?;", [str(user_id), str(product_id)])
             result = self.cursor.fetchone()
@@ -299,23 +496,164 @@ class DBwrapper(object):
             self.connection.commit()
 
         def update_wishlist_price(self, wishlist_id, price):
-            """Update the price of a wishlist in the database and add a price entry in the wishlist_prices table"""
-            self.cursor.execute("UPDATE wishlists SET price=? WHERE wishlist_id=?;", [str(price), str(wishlist_id)])
-            try:
-                utc_timestamp_now = int(datetime.utcnow().timestamp())
-                self.cursor.execute("INSERT INTO wishlist_prices VALUES (?, ?, ?)", [str(wishlist_id), str(price), str(utc_timestamp_now)])
-            except sqlite3.IntegrityError:
-                self.logger.error("Insert into wishlist_prices not possible: {}, {}".format(wishlist_id, price))
-            self.connection.commit()
+            """Update the price of a wishlist - see update_entities"""
+            self.update_entities([(EntityType.WISHLIST, wishlist_id, price)], [])
 
         def update_product_price(self, product_id, price):
-            """Update the price of a product in the database and add a price entry in the product_prices table"""
-            self.cursor.execute("UPDATE products SET price=? WHERE product_id=?;", [str(price), str(product_id)])
-            try:
-                utc_timestamp_now = int(datetime.utcnow().timestamp())
-                self.cursor.execute("INSERT INTO product_prices VALUES (?, ?, ?)", [str(product_id), str(price), str(utc_timestamp_now)])
-            except sqlite3.IntegrityError:
-                self.logger.error("Insert into product_prices not possible: {}, {}".format(product_id, price))
+            """Update the price of a product - see update_entities"""
+            self.update_entities([(EntityType.PRODUCT, product_id, price)], [])
+
+        def update_entities(self, price_updates, name_updates, removed_entities=(), deleted_users=()):
+            """
+            Applies many price and name updates in a single transaction. Updates are (entity_type, entity_id, value)
+            tuples. Each actual price change also adds an entry to the price history of the entity and a notification
+            for each of its subscribers whose alert rules match the change to the outbox.
+            Afterwards the given (entity_type, entity_id) entities and users are deleted in the same transaction.
+            """
+            utc_timestamp_now = int(datetime.utcnow().timestamp())
+            product_names = [(str(name), str(entity_id)) for entity_type, entity_id, name in name_updates if entity_type == EntityType.PRODUCT]
+            wishlist_names = [(str(name), str(entity_id)) for entity_type, entity_id, name in name_updates if entity_type == EntityType.WISHLIST]
+
+            with self.transaction() as cursor:
+                changes = []
+                for entity_type, entity_id, price in price_updates:
+                    if entity_type == EntityType.PRODUCT:
+                        cursor.execute("SELECT price FROM products WHERE product_id=?;", [str(entity_id)])
+                        old_price = cursor.fetchone()
+                        cursor.execute("UPDATE products SET price=? WHERE product_id=?;", [str(price), str(entity_id)])
+                    elif entity_type == EntityType.WISHLIST:
+                        cursor.execute("SELECT price FROM wishlists WHERE wishlist_id=?;", [str(entity_id)])
+                        old_price = cursor.fetchone()
+                        cursor.execute("UPDATE wishlists SET price=? WHERE wishlist_id=?;", [str(price), str(entity_id)])
+                    else:
+                        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+                    # Entities which were removed in the meantime must not break the whole batch
+                    if old_price is None:
+                        continue
+
+                    # The lowest price must be read before the new price is part of the history
+                    lowest_price = price_history.get_lowest_price(cursor, entity_type, entity_id)
+                    lowest_price = old_price[0] if lowest_price is None else min(lowest_price, old_price[0])
+                    price_history.record_price(cursor, entity_type, entity_id, price, utc_timestamp_now)
+                    if old_price[0] != float(price):
+                        changes.append((entity_type, entity_id, old_price[0], price, float(price) < lowest_price))
+
+                # The alert rules of the subscribers of all changed entities are evaluated at once
+                outbox.add_price_changes(cursor, changes, utc_timestamp_now, self.digest_window)
+
+                cursor.executemany("UPDATE products SET name=? WHERE product_id=?;", product_names)
+                cursor.executemany("UPDATE wishlists SET name=? WHERE wishlist_id=?;", wishlist_names)
+
+                for entity_type, entity_id in removed_entities:
+                    self._rm_entity(cursor, entity_type, entity_id)
+
+                cursor.executemany("DELETE FROM users WHERE user_id=?;", [[str(user_id)] for user_id in deleted_users])
+
+        def get_price_rollups(self, entity_type, entity_id, period, since):
+            """Returns the (bucket, min_price, max_price, close_price) rollups of an entity since the given timestamp"""
+            return price_history.get_rollups(self.cursor, entity_type, entity_id, period, since)
+
+        def prune_price_history(self, raw_before, hourly_before=None):
+            """Deletes old raw price points and hourly rollups - see price_history.prune"""
+            with self.transaction() as cursor:
+                deleted = price_history.prune(cursor, raw_before, hourly_before)
+
+            self.logger.info("Pruned {} raw price points".format(deleted))
+            return deleted
+
+        def get_alert_rule(self, user_id, entity_type, entity_id):
+            """Returns the alert rule of a subscription or None if the user didn't subscribe to the entity"""
+            return alert_rules.get_rule(self.cursor, user_id, entity_type, entity_id)
+
+        def set_alert_rule(self, user_id, entity_type, entity_id, rule):
+            """Replaces the alert rule of a subscription - returns False if the user didn't subscribe to the entity"""
+            with self.transaction() as cursor:
+                return alert_rules.set_rule(cursor, user_id, entity_type, entity_id, rule)
+
+        def claim_notifications(self, now, limit, lease):
+            """Returns up to limit due notifications of the outbox and claims them for lease seconds"""
+            with self.transaction() as cursor:
+                return outbox.claim(cursor, now, limit, lease)
+
+        def release_notifications(self):
+            """Makes all claimed notifications of the outbox due again"""
+            with self.transaction() as cursor:
+                return outbox.release_claims(cursor)
+
+        def complete_notifications(self, sent_ids, failed_ids=(), retries=()):
+            """Marks notifications as sent or failed and reschedules the (notification_id, next_attempt) retries"""
+            with self.transaction() as cursor:
+                outbox.mark_sent(cursor, sent_ids)
+                outbox.mark_failed(cursor, failed_ids)
+                outbox.retry(cursor, retries)
+
+        def prune_outbox(self, before):
+            """Deletes the delivered and failed notifications created before the given timestamp"""
+            with self.transaction() as cursor:
+                deleted = outbox.prune(cursor, before)
+
+            self.logger.info("Pruned {} notifications from the outbox".format(deleted))
+            return deleted
+
+        def create_broadcast(self, text, admin_id):
+            """Adds a broadcast job to all current subscribers and returns it"""
+            with self.transaction() as cursor:
+                return broadcasts.create(cursor, text, admin_id, int(datetime.utcnow().timestamp()))
+
+        def get_broadcast(self, broadcast_id):
+            return broadcasts.get(self.cursor, broadcast_id)
+
+        def get_unfinished_broadcasts(self):
+            return broadcasts.get_unfinished(self.cursor)
+
+        def get_broadcast_recipients(self, after_user_id, limit):
+            """Returns the next limit recipients of broadcasts after the given user id"""
+            return broadcasts.get_recipients(self.cursor, after_user_id, limit)
+
+        def checkpoint_broadcast(self, broadcast_id, last_user_id, sent, failed, finished=False):
+            """Stores the progress of a broadcast and marks it as finished if requested"""
+            with self.transaction() as cursor:
+                broadcasts.checkpoint(cursor, broadcast_id, last_user_id, sent, failed)
+                if finished:
+                    broadcasts.finish(cursor, broadcast_id, int(datetime.utcnow().timestamp()))
+
+        def _count_per_id(self, table, id_column, ids, condition=None, params=()):
+            """Returns the number of rows of the table per given id which match the condition - ids without rows are left out"""
+            ids = [str(entity_id) for entity_id in ids]
+            condition = " AND {}".format(condition) if condition else ""
+            counts = {}
+
+            # SQLite limits the number of parameters of a statement
+            for start in range(0, len(ids), self.max_query_params):
+                chunk = ids[start:start + self.max_query_params]
+                self.cursor.execute("SELECT {id_column}, COUNT(*) FROM {table} WHERE {id_column} IN ({params}){condition} "
+                                    "GROUP BY {id_column};".format(table=table, id_column=id_column, condition=condition,
+                                                                   params=", ".join("?" * len(chunk))),
+                                    chunk + list(params))
+                counts.update(self.cursor.fetchall())
+
+            return counts
+
+        def get_product_price_change_counts(self, product_ids, since):
+            """Returns the number of recorded price changes of the given products since the given timestamp"""
+            return self._count_per_id("product_prices", "product_id", product_ids, "timestamp>=?", [str(since)])
+
+        def get_wishlist_price_change_counts(self, wishlist_ids, since):
+            """Returns the number of recorded price changes of the given wishlists since the given timestamp"""
+            return self._count_per_id("wishlist_prices", "wishlist_id", wishlist_ids, "timestamp>=?", [str(since)])
+
+        def get_product_subscriber_counts(self, product_ids):
+            """Returns the number of subscribers of the given products"""
+            return self._count_per_id("product_subscribers", "product_id", product_ids)
+
+        def get_wishlist_subscriber_counts(self, wishlist_ids):
+            """Returns the number of subscribers of the given wishlists"""
+            return self._count_per_id("wishlist_subscribers", "wishlist_id", wishlist_ids)
+
+        def update_check_schedule(self, entries):
+            """Stores the next check of entities - entries are (entity_id, entity_type, next_check, interval) tuples"""
+            self.cursor.executemany("INSERT OR REPLACE INTO check_schedule (entity_id, entity_type, next_check, interval) VALUES (?, ?, ?, ?);", entries)
             self.connection.commit()
 
         def get_all_users(self):
@@ -351,7 +689,7 @@ class DBwrapper(object):
         def add_user(self, user_id, first_name, username, lang_code="de-DE"):
             lang_code = lang_code or "de-DE"
             try:
-                self.cursor.execute("INSERT INTO users VALUES (?, ?, ?, ?);", (str(user_id), str(first_name), str(username), str(lang_code)))
+                self.cursor.execute("INSERT INTO users (user_id, first_name, username, lang_code) VALUES (?, ?, ?, ?);", (str(user_id), str(first_name), str(username), str(lang_code)))
                 self.connection.commit()
             except sqlite3.IntegrityError:
                 # print("User already exists")
@@ -365,17 +703,28 @@ class DBwrapper(object):
             except Exception as e:
                 logging.error(e)
 
-        def is_user_saved(self, user_id):
-            self.cursor.execute("SELECT rowid, * FROM users WHERE user_id=?;", [str(user_id)])
-            result = self.cursor.fetchall()
+        def is_digest_user(self, user_id):
+            """Returns if a user gets the price changes as digest instead of one message per change"""
+            self.cursor.execute("SELECT digest FROM users WHERE user_id=?;", [str(user_id)])
+            result = self.cursor.fetchone()
+            return result is not None and bool(result[0])
 
-            if len(result) > 0:
-                return True
+        def set_digest_user(self, user_id, digest):
+            self.cursor.execute("UPDATE users SET digest=? WHERE user_id=?;", [int(digest), str(user_id)])
+            self.connection.commit()
 
-            return False
+        def is_user_saved(self, user_id):
+            self.cursor.execute("SELECT 1 FROM users WHERE user_id=? LIMIT 1;", [str(user_id)])
+            return self.cursor.fetchone() is not None
 
         def close_conn(self):
-            self.connection.close()
+            """Closes the connections of all threads"""
+            with self._connections_lock:
+                for connection in self._connections:
+                    connection.close()
+
+                self._connections = []
+                self._generation += 1
 
     instance = None
 
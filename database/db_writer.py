@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DBWriter(object):
+    """
+    Write-behind queue for database mutations. A single writer thread takes the queued writes, coalesces them - only
+    the last price and name of an entity is written - and applies them in one transaction via db.update_entities.
+    Callers are only blocked when the queue is full. sync() waits until everything queued before has been written.
+    A batch whose transaction failed is retried with backoff. After max_attempts failed attempts it is logged and
+    dropped, so that a batch which can never be written doesn't block the writes queued after it.
+    """
+
+    def __init__(self, db, max_queue_size=10000, max_batch_size=500, on_write=None, retry_delay=1, max_retry_delay=60,
+                 max_attempts=5):
+        self.db = db
+        self.max_batch_size = max_batch_size
+        # Seconds before a failed batch is written again - doubled with every failed attempt up to max_retry_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        # Number of queued writes which were dropped after max_attempts
+        self.dropped = 0
+        # Called from the writer thread with the price updates, name updates, removed entities and deleted users of
+        # each committed transaction
+        self.on_write = on_write
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._condition = threading.Condition()
+        self._submitted = 0
+        self._completed = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="DBWriter", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """Number of writes which are queued but not committed yet"""
+        with self._condition:
+            return self._submitted - self._completed
+
+    def _put(self, write):
+        if self._thread is None:
+            raise RuntimeError("The DBWriter was not started or is already closed!")
+
+        # The counter must be increased before the write becomes visible to the writer thread
+        with self._condition:
+            self._submitted += 1
+
+        if self._queue.full():
+            logger.warning("DB write queue is full - waiting for the writer!")
+        self._queue.put(write)
+
+    def update_price(self, entity_type, entity_id, price):
+        self._put(("price", (entity_type, entity_id), price))
+
+    def update_name(self, entity_type, entity_id, name):
+        self._put(("name", (entity_type, entity_id), name))
+
+    def update_entities(self, price_updates, name_updates):
+        """Queues (entity_type, entity_id, value) updates - same interface as DBwrapper.update_entities"""
+        for entity_type, entity_id, price in price_updates:
+            self.update_price(entity_type, entity_id, price)
+        for entity_type, entity_id, name in name_updates:
+            self.update_name(entity_type, entity_id, name)
+
+    def rm_entity(self, entity_type, entity_id):
+        self._put(("rm", (entity_type, entity_id), None))
+
+    def delete_user(self, user_id):
+        self._put(("delete_user", user_id, None))
+
+    def sync(self, timeout=None):
+        """Waits until all writes queued before this call are committed. Returns False if the timeout expired"""
+        with self._condition:
+            target = self._submitted
+            return self._condition.wait_for(lambda: self._completed >= target, timeout)
+
+    def close(self, timeout=None):
+        """Writes all queued writes and stops the writer thread. Returns False if the timeout expired"""
+        if self._thread is None:
+            return True
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        stopped = not self._thread.is_alive()
+        self._thread = None
+        return stopped
+
+    def _take_batch(self):
+        """Blocks until a write is queued and returns it together with all writes queued meanwhile"""
+        batch = [self._queue.get()]
+
+        while len(batch) < self.max_batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        stopped = False
+
+        while not stopped:
+            batch = self._take_batch()
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopped = True
+
+            if len(batch) > 0:
+                self._write_with_retries(batch)
+
+            with self._condition:
+                self._completed += len(batch)
+                self._condition.notify_all()
+
+    def _write_with_retries(self, batch):
+        """Writes a batch and retries it until its transaction was committed or max_attempts is reached"""
+        delay = self.retry_delay
+
+        for attempt in range(1, self.max_attempts + 1):
+            if self._write(batch):
+                return
+
+            if attempt < self.max_attempts:
+                logger.warning("Writing the {} queued changes again in {} seconds".format(len(batch), delay))
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+        self.dropped += len(batch)
+        logger.error("Dropped {} queued changes after {} failed attempts: {}".format(len(batch), self.max_attempts, batch))
+
+    def _write(self, batch):
+        """Coalesces the writes of a batch and applies them in a single transaction. Returns whether it was committed"""
+        prices = OrderedDict()
+        names = OrderedDict()
+        removed = OrderedDict()
+        deleted_users = OrderedDict()
+
+        for kind, key, value in batch:
+            if kind == "price":
+                prices[key] = value
+            elif kind == "name":
+                names[key] = value
+            elif kind == "rm":
+                # Updates of removed entities don't need to be written anymore
+                prices.pop(key, None)
+                names.pop(key, None)
+                removed[key] = None
+            elif kind == "delete_user":
+                deleted_users[key] = None
+
+        price_updates = [(entity_type, entity_id, price) for (entity_type, entity_id), price in prices.items()]
+        name_updates = [(entity_type, entity_id, name) for (entity_type, entity_id), name in names.items()]
+        removed_entities = list(removed)
+        deleted_users = list(deleted_users)
+
+        try:
+            self.db.update_entities(price_updates, name_updates, removed_entities, deleted_users)
+        except Exception as e:
+            logger.error("Couldn't write {} queued changes to the database: {}".format(len(batch), e))
+            return False
+
+        logger.debug("Wrote {} queued changes in one transaction".format(len(batch)))
+        if self.on_write is not None:
+            try:
+                self.on_write(price_updates, name_updates, removed_entities, deleted_users)
+            except Exception as e:
+                logger.error("Error in the write callback: {}".format(e))
+
+        return True
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Versioned schema migrations - the version of a database file is stored in its 'user_version' pragma"""
+import logging
+
+from database import broadcasts, outbox, price_history
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column(cursor, table, column, definition):
+    """Adds a column to a table if it doesn't exist yet - SQLite has no 'ADD COLUMN IF NOT EXISTS'"""
+    cursor.execute("PRAGMA table_info({});".format(table))
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE {} ADD COLUMN {} {};".format(table, column, definition))
+
+
+def _add_indexes_and_unique_subscriptions(cursor):
+    """Adds the indexes used by the subscriber and price history queries and prevents duplicate subscriptions"""
+    for entity in ("product", "wishlist"):
+        # Old databases might contain duplicate subscriptions which would violate the unique index
+        cursor.execute("DELETE FROM {entity}_subscribers WHERE rowid NOT IN "
+                       "(SELECT MIN(rowid) FROM {entity}_subscribers GROUP BY {entity}_id, user_id);".format(entity=entity))
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_{entity}_subscribers_entity_user "
+                       "ON {entity}_subscribers ({entity}_id, user_id);".format(entity=entity))
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_{entity}_subscribers_user "
+                       "ON {entity}_subscribers (user_id);".format(entity=entity))
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_{entity}_prices_entity_timestamp "
+                       "ON {entity}_prices ({entity}_id, timestamp);".format(entity=entity))
+
+
+def _add_price_rollups(cursor):
+    """Adds hourly and daily price rollups and reduces the price history to actual price changes"""
+    price_history.create_rollups(cursor)
+
+
+def _add_outbox(cursor):
+    """Adds the outbox table of the price change notifications"""
+    outbox.create_table(cursor)
+
+
+def _add_digest_delivery(cursor):
+    """Adds the choice between immediate and digest delivery of the notifications of a user"""
+    _add_column(cursor, "users", "digest", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(cursor, "outbox", "digest", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _add_alert_rules(cursor):
+    """Adds the alert rules to the subscriber tables"""
+    for table in ("product_subscribers", "wishlist_subscribers"):
+        _add_column(cursor, table, "target_price", "REAL")
+        _add_column(cursor, table, "min_drop_percent", "REAL")
+        _add_column(cursor, table, "all_time_low", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _add_broadcasts(cursor):
+    """Adds the table of the resumable broadcast jobs"""
+    broadcasts.create_table(cursor)
+
+
+# The migration at index i upgrades the schema to version i + 1. Never change or reorder existing migrations, only
+# append new ones - their statements should be idempotent, so an interrupted migration can simply be run again.
+MIGRATIONS = [
+    _add_indexes_and_unique_subscriptions,
+    _add_price_rollups,
+    _add_outbox,
+    _add_digest_delivery,
+    _add_alert_rules,
+    _add_broadcasts,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection):
+    return connection.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(connection):
+    """Applies all migrations the database doesn't have yet, each one in its own transaction"""
+    version = get_schema_version(connection)
+
+    if version > SCHEMA_VERSION:
+        raise RuntimeError("Database schema version {} is newer than the supported version {}!".format(version, SCHEMA_VERSION))
+
+    for new_version in range(version + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS[new_version - 1]
+        logger.info("Migrating database to schema version {}: {}".format(new_version, migration.__doc__))
+
+        cursor = connection.cursor()
+        try:
+            migration(cursor)
+            cursor.execute("PRAGMA user_version = {};".format(new_version))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    return SCHEMA_VERSION
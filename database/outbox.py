@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Outbox of price change notifications. The notifications of a price change are stored in the same transaction as the
+new price, so they survive a crash between the update and the delivery. Rows are claimed by the delivery worker for a
+lease time and marked as sent afterwards - rows of a worker which died are delivered again after the lease expired.
+"""
+import logging
+from collections import namedtuple
+
+from database import alert_rules
+from geizhals.entities import EntityType
+
+logger = logging.getLogger(__name__)
+
+PENDING = 0
+CLAIMED = 1
+SENT = 2
+FAILED = 3
+
+# Notifications of digest users are collected and delivered together at the end of a time window
+Notification = namedtuple("Notification", ["id", "user_id", "entity_type", "entity_id", "name", "url", "old_price",
+                                           "new_price", "created", "attempts", "digest"])
+
+# Entity table, subscriber table and id column per entity type
+_tables = {
+    EntityType.PRODUCT: ("products", "product_subscribers", "product_id"),
+    EntityType.WISHLIST: ("wishlists", "wishlist_subscribers", "wishlist_id"),
+}
+
+
+def create_table(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS outbox "
+                   "(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "user_id INTEGER NOT NULL, "
+                   "entity_type INTEGER NOT NULL, "
+                   "entity_id INTEGER NOT NULL, "
+                   "name TEXT NOT NULL, "
+                   "url TEXT NOT NULL, "
+                   "old_price REAL NOT NULL, "
+                   "new_price REAL NOT NULL, "
+                   "created INTEGER NOT NULL, "
+                   "status INTEGER NOT NULL DEFAULT 0, "
+                   "attempts INTEGER NOT NULL DEFAULT 0, "
+                   "next_attempt INTEGER NOT NULL DEFAULT 0, "
+                   "FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE);")
+    # Only the undelivered rows are queried by the worker
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt) "
+                   "WHERE status IN ({pending}, {claimed});".format(pending=PENDING, claimed=CLAIMED))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_user ON outbox (user_id);")
+
+
+def get_digest_due(timestamp, digest_window):
+    """Returns the end of the digest window containing the timestamp - all changes of a window are delivered then"""
+    timestamp = int(timestamp)
+    return timestamp - timestamp % digest_window + digest_window
+
+
+def create_temp_tables(connection):
+    """Creates the connection local table the price changes of a transaction are collected in"""
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS price_changes "
+                       "(entity_type INTEGER NOT NULL, "
+                       "entity_id INTEGER NOT NULL, "
+                       "old_price REAL NOT NULL, "
+                       "new_price REAL NOT NULL, "
+                       "all_time_low INTEGER NOT NULL);")
+
+
+def add_price_changes(cursor, changes, timestamp, digest_window=60 * 60):
+    """
+    Adds a notification for each subscriber whose alert rules match one of the given (entity_type, entity_id,
+    old_price, new_price, all_time_low) changes and returns their number. The rules of all subscribers are evaluated
+    in one statement per entity type. Notifications of users who chose the digest delivery are due at the end of the
+    current digest window. Does not commit.
+    """
+    if len(changes) == 0:
+        return 0
+
+    cursor.execute("DELETE FROM temp.price_changes;")
+    cursor.executemany("INSERT INTO temp.price_changes (entity_type, entity_id, old_price, new_price, all_time_low) "
+                       "VALUES (?, ?, ?, ?, ?);",
+                       [(entity_type.value, entity_id, float(old_price), float(new_price), int(all_time_low))
+                        for entity_type, entity_id, old_price, new_price, all_time_low in changes])
+
+    added = 0
+    for entity_type, (entity_table, subscriber_table, id_column) in _tables.items():
+        cursor.execute("INSERT INTO outbox (user_id, entity_type, entity_id, name, url, old_price, new_price, created, digest, next_attempt) "
+                       "SELECT s.user_id, c.entity_type, c.entity_id, e.name, e.url, c.old_price, c.new_price, ?, u.digest, "
+                       "CASE WHEN u.digest THEN ? ELSE 0 END "
+                       "FROM temp.price_changes c "
+                       "JOIN {subscriber_table} s ON s.{id_column} = c.entity_id "
+                       "JOIN {entity_table} e ON e.{id_column} = c.entity_id "
+                       "JOIN users u ON u.user_id = s.user_id "
+                       "WHERE c.entity_type=? AND {rule_matches} "
+                       "ORDER BY c.rowid, s.rowid;".format(entity_table=entity_table, subscriber_table=subscriber_table,
+                                                          id_column=id_column, rule_matches=alert_rules.RULE_MATCHES),
+                       [int(timestamp), get_digest_due(timestamp, digest_window), entity_type.value])
+        added += cursor.rowcount
+
+    cursor.execute("DELETE FROM temp.price_changes;")
+    return added
+
+
+_columns = "id, user_id, entity_type, entity_id, name, url, old_price, new_price, created, attempts, digest"
+
+
+def _to_notification(row):
+    return Notification(row[0], row[1], EntityType(row[2]), row[3], row[4], row[5], row[6], row[7], row[8], row[9] + 1,
+                        bool(row[10]))
+
+
+def claim(cursor, now, limit, lease):
+    """
+    Returns up to limit due notifications, oldest first, and claims them until now + lease. The due digest
+    notifications of a user are never split, so the limit might be exceeded by them. Does not commit.
+    """
+    # The status values are part of the statement, otherwise SQLite can't use the partial index
+    due = "status IN ({pending}, {claimed}) AND next_attempt<=?".format(pending=PENDING, claimed=CLAIMED)
+    cursor.execute("SELECT {columns} FROM outbox WHERE {due} ORDER BY id LIMIT ?;".format(columns=_columns, due=due),
+                   [int(now), int(limit)])
+    notifications = [_to_notification(row) for row in cursor.fetchall()]
+
+    # Claim the rest of the digest of the last user as well, if the limit cut it off
+    if len(notifications) == limit and notifications[-1].digest:
+        cursor.execute("SELECT {columns} FROM outbox WHERE {due} AND user_id=? AND digest=1 AND id>? ORDER BY id;".format(
+            columns=_columns, due=due), [int(now), notifications[-1].user_id, notifications[-1].id])
+        notifications.extend(_to_notification(row) for row in cursor.fetchall())
+
+    cursor.executemany("UPDATE outbox SET status=?, attempts=attempts + 1, next_attempt=? WHERE id=?;",
+                       [(CLAIMED, int(now + lease), notification.id) for notification in notifications])
+    return notifications
+
+
+def release_claims(cursor):
+    """Makes the claimed notifications due again - the worker which claimed them is gone. Does not commit"""
+    cursor.execute("UPDATE outbox SET status=?, next_attempt=0 WHERE status=?;", [PENDING, CLAIMED])
+    return cursor.rowcount
+
+
+def mark_sent(cursor, ids):
+    cursor.executemany("UPDATE outbox SET status=? WHERE id=?;", [(SENT, notification_id) for notification_id in ids])
+
+
+def mark_failed(cursor, ids):
+    cursor.executemany("UPDATE outbox SET status=? WHERE id=?;", [(FAILED, notification_id) for notification_id in ids])
+
+
+def retry(cursor, retries):
+    """Makes notifications due again at a later time - retries are (notification_id, next_attempt) tuples"""
+    cursor.executemany("UPDATE outbox SET status=?, next_attempt=? WHERE id=?;",
+                       [(PENDING, int(next_attempt), notification_id) for notification_id, next_attempt in retries])
+
+
+def prune(cursor, before):
+    """Deletes the sent and failed notifications created before the given timestamp and returns their number"""
+    cursor.execute("DELETE FROM outbox WHERE status IN (?, ?) AND created<?;", [SENT, FAILED, int(before)])
+    return cursor.rowcount
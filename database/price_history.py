@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Price history of the entities. Raw points are only stored when the price actually changes. Hourly and daily
+min/max/close rollups are updated with each new point, so that long ranges can be queried without the raw points.
+"""
+import logging
+
+from geizhals.entities import EntityType
+
+logger = logging.getLogger(__name__)
+
+HOURLY = 60 * 60
+DAILY = 24 * 60 * 60
+ROLLUP_PERIODS = (HOURLY, DAILY)
+
+# Raw price table and id column per entity type
+_raw_tables = {
+    EntityType.PRODUCT: ("product_prices", "product_id"),
+    EntityType.WISHLIST: ("wishlist_prices", "wishlist_id"),
+}
+
+
+def _get_raw_table(entity_type):
+    try:
+        return _raw_tables[entity_type]
+    except KeyError:
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+
+def get_last_price(cursor, entity_type, entity_id):
+    """Returns the last recorded price of an entity or None if there is no history yet"""
+    table, id_column = _get_raw_table(entity_type)
+    cursor.execute("SELECT price FROM {table} WHERE {id_column}=? ORDER BY timestamp DESC, rowid DESC LIMIT 1;".format(
+        table=table, id_column=id_column), [str(entity_id)])
+    row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+def record_price(cursor, entity_type, entity_id, price, timestamp):
+    """
+    Adds a price point to the history of an entity if the price differs from the last recorded one and updates the
+    rollups of the point's hour and day. Returns whether a point was added. Does not commit.
+    """
+    table, id_column = _get_raw_table(entity_type)
+    price = float(price)
+    last_price = get_last_price(cursor, entity_type, entity_id)
+
+    if last_price == price:
+        return False
+
+    cursor.execute("INSERT INTO {table} ({id_column}, price, timestamp) VALUES (?, ?, ?);".format(
+        table=table, id_column=id_column), [str(entity_id), price, int(timestamp)])
+
+    for period in ROLLUP_PERIODS:
+        bucket = int(timestamp) - int(timestamp) % period
+        # A new bucket starts with the price which was valid before this point
+        opening_price = last_price if last_price is not None else price
+        cursor.execute("INSERT OR IGNORE INTO price_rollups "
+                       "(entity_type, entity_id, period, bucket, min_price, max_price, close_price) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                       [entity_type.value, str(entity_id), period, bucket, opening_price, opening_price, opening_price])
+        cursor.execute("UPDATE price_rollups SET min_price=MIN(min_price, ?), max_price=MAX(max_price, ?), close_price=? "
+                       "WHERE entity_type=? AND entity_id=? AND period=? AND bucket=?;",
+                       [price, price, price, entity_type.value, str(entity_id), period, bucket])
+
+    return True
+
+
+def delete_rollups(cursor, entity_type, entity_id):
+    """Deletes the rollups of a removed entity - its raw points are deleted together with the entity. Does not commit"""
+    _get_raw_table(entity_type)
+    cursor.execute("DELETE FROM price_rollups WHERE entity_type=? AND entity_id=?;", [entity_type.value, str(entity_id)])
+
+
+def get_lowest_price(cursor, entity_type, entity_id):
+    """Returns the lowest price an entity ever had according to its daily rollups or None if there is no history"""
+    cursor.execute("SELECT MIN(min_price) FROM price_rollups WHERE entity_type=? AND entity_id=? AND period=?;",
+                   [entity_type.value, str(entity_id), DAILY])
+    return cursor.fetchone()[0]
+
+
+def get_rollups(cursor, entity_type, entity_id, period, since):
+    """Returns the (bucket, min_price, max_price, close_price) rollups of an entity since the given timestamp"""
+    if period not in ROLLUP_PERIODS:
+        raise ValueError("There are no rollups for a period of {} seconds!".format(period))
+
+    cursor.execute("SELECT bucket, min_price, max_price, close_price FROM price_rollups "
+                   "WHERE entity_type=? AND entity_id=? AND period=? AND bucket>=? ORDER BY bucket;",
+                   [entity_type.value, str(entity_id), period, int(since) - int(since) % period])
+    return cursor.fetchall()
+
+
+def prune(cursor, raw_before, hourly_before=None):
+    """
+    Deletes raw price points older than raw_before - except the last point of each entity, which is needed to detect
+    the next change - and optionally hourly rollups older than hourly_before. Daily rollups are kept forever.
+    Returns the number of deleted raw points. Does not commit.
+    """
+    deleted = 0
+    for table, id_column in _raw_tables.values():
+        cursor.execute("DELETE FROM {table} WHERE timestamp<? AND rowid NOT IN "
+                       "(SELECT MAX(rowid) FROM {table} GROUP BY {id_column});".format(table=table, id_column=id_column),
+                       [int(raw_before)])
+        deleted += cursor.rowcount
+
+    if hourly_before is not None:
+        cursor.execute("DELETE FROM price_rollups WHERE period=? AND bucket<?;", [HOURLY, int(hourly_before)])
+
+    return deleted
+
+
+def create_rollups(cursor):
+    """Creates the rollup table and fills it from the already recorded raw price points"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS 'price_rollups' \
+                               ('entity_type' INTEGER NOT NULL, \
+                               'entity_id' INTEGER NOT NULL, \
+                               'period' INTEGER NOT NULL, \
+                               'bucket' INTEGER NOT NULL, \
+                               'min_price' REAL NOT NULL, \
+                               'max_price' REAL NOT NULL, \
+                               'close_price' REAL NOT NULL, \
+                               PRIMARY KEY('entity_type', 'entity_id', 'period', 'bucket'));")
+    cursor.execute("DELETE FROM price_rollups;")
+
+    for entity_type, (table, id_column) in _raw_tables.items():
+        cursor.execute("SELECT {id_column}, price, timestamp FROM {table} ORDER BY {id_column}, timestamp, rowid;".format(
+            table=table, id_column=id_column))
+        points = cursor.fetchall()
+
+        # Old databases may contain repeated prices - only the changes are kept
+        cursor.execute("DELETE FROM {table};".format(table=table))
+        for entity_id, price, timestamp in points:
+            record_price(cursor, entity_type, entity_id, price, timestamp)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from database.alert_rules import AlertRule, EVERY_CHANGE
+from database.db_wrapper import DBwrapper
+from geizhals.entities import EntityType, Product, Wishlist
+
+
+class AlertRulesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        self.p = Product(123456, "Product", "https://geizhals.de/a123456", 100.0)
+        self.wl = Wishlist(123456, "Wishlist", "https://geizhals.de/?cat=WL-123456", 100.0)
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+
+        # User 1 wants every change, user 2 a target price, user 3 a price drop and user 4 new all-time lows
+        for user_id in (1, 2, 3, 4):
+            self.db.add_user(user_id, "User", "user{}".format(user_id), "de")
+            self.db.subscribe_product(self.p.entity_id, user_id)
+            self.db.subscribe_wishlist(self.wl.entity_id, user_id)
+
+        for entity_type, entity_id in ((EntityType.PRODUCT, self.p.entity_id), (EntityType.WISHLIST, self.wl.entity_id)):
+            self.db.set_alert_rule(2, entity_type, entity_id, AlertRule(90.0, None, False))
+            self.db.set_alert_rule(3, entity_type, entity_id, AlertRule(None, 10, False))
+            self.db.set_alert_rule(4, entity_type, entity_id, AlertRule(None, None, True))
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def get_notified(self, entity_type=EntityType.PRODUCT):
+        """Returns the ids of the users notified of the last price change of an entity and removes their notifications"""
+        users = self.db.cursor.execute("SELECT user_id FROM outbox WHERE entity_type=? ORDER BY user_id;", [entity_type.value]).fetchall()
+        self.db.cursor.execute("DELETE FROM outbox WHERE entity_type=?;", [entity_type.value])
+        self.db.connection.commit()
+        return [row[0] for row in users]
+
+    def update_price(self, new_price):
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, new_price)], [])
+
+    def test_get_set_rule(self):
+        self.assertEqual(EVERY_CHANGE, self.db.get_alert_rule(1, EntityType.PRODUCT, self.p.entity_id))
+        self.assertEqual(AlertRule(90.0, None, False), self.db.get_alert_rule(2, EntityType.PRODUCT, self.p.entity_id))
+        self.assertIsNone(self.db.get_alert_rule(5, EntityType.PRODUCT, self.p.entity_id))
+        self.assertFalse(self.db.set_alert_rule(5, EntityType.PRODUCT, self.p.entity_id, EVERY_CHANGE))
+
+    def test_rules(self):
+        """Test to check if only the subscribers whose rules match a change are notified"""
+        # A small drop is a new all-time low
+        self.update_price(99.0)
+        self.assertEqual([1, 4], self.get_notified())
+
+        # Rising prices only notify subscribers without rules
+        self.update_price(101.0)
+        self.assertEqual([1], self.get_notified())
+
+        # A drop of 10.9 % below the target price, but not below the lowest price of 99 €
+        self.update_price(90.0)
+        self.assertEqual([1, 2, 3, 4], self.get_notified())
+
+        self.update_price(95.0)
+        self.assertEqual([1], self.get_notified())
+
+        # Small drop below the target price but not to a new low
+        self.update_price(91.0)
+        self.assertEqual([1], self.get_notified())
+        self.update_price(89.0)
+        self.assertEqual([1, 2, 4], self.get_notified())
+
+    def test_bulk_evaluation(self):
+        """Test to check if the rules of changes of both entity types in one transaction are evaluated separately"""
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 101.0), (EntityType.WISHLIST, self.wl.entity_id, 80.0)], [])
+        self.assertEqual([1, 2, 3, 4], self.get_notified(EntityType.WISHLIST))
+        self.assertEqual([1], self.get_notified(EntityType.PRODUCT))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from database.db_wrapper import DBwrapper
+from geizhals.entities import Product, Wishlist
+
+
+class BroadcastsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        p = Product(123456, "Product", "https://geizhals.de/a123456", 10.0)
+        wl = Wishlist(123456, "Wishlist", "https://geizhals.de/?cat=WL-123456", 20.0)
+        self.db.add_product(p.entity_id, p.name, p.price, p.url)
+        self.db.add_wishlist(wl.entity_id, wl.name, wl.price, wl.url)
+
+        # User 4 has no subscriptions and user 2 subscribed to both entities
+        for user_id in (1, 2, 3, 4):
+            self.db.add_user(user_id, "User", "user{}".format(user_id), "de")
+        self.db.subscribe_product(p.entity_id, 1)
+        self.db.subscribe_product(p.entity_id, 2)
+        self.db.subscribe_wishlist(wl.entity_id, 2)
+        self.db.subscribe_wishlist(wl.entity_id, 3)
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def test_create(self):
+        broadcast = self.db.create_broadcast("Hello", 42)
+        self.assertEqual("Hello", broadcast.text)
+        self.assertEqual(42, broadcast.admin_id)
+        self.assertEqual(3, broadcast.total)
+        self.assertEqual((0, 0, 0), (broadcast.last_user_id, broadcast.sent, broadcast.failed))
+        self.assertIsNone(broadcast.finished)
+        self.assertEqual([broadcast], self.db.get_unfinished_broadcasts())
+
+    def test_get_recipients(self):
+        """Test to check if the recipients are paged by user id without duplicates"""
+        self.assertEqual([1, 2], self.db.get_broadcast_recipients(0, 2))
+        self.assertEqual([3], self.db.get_broadcast_recipients(2, 2))
+        self.assertEqual([], self.db.get_broadcast_recipients(3, 2))
+
+    def test_checkpoint(self):
+        broadcast = self.db.create_broadcast("Hello", 42)
+        self.db.checkpoint_broadcast(broadcast.id, 2, 1, 1)
+        self.db.checkpoint_broadcast(broadcast.id, 3, 1, 0)
+        broadcast = self.db.get_broadcast(broadcast.id)
+        self.assertEqual((3, 2, 1), (broadcast.last_user_id, broadcast.sent, broadcast.failed))
+        self.assertEqual([broadcast], self.db.get_unfinished_broadcasts())
+
+        self.db.checkpoint_broadcast(broadcast.id, 3, 0, 0, finished=True)
+        self.assertIsNotNone(self.db.get_broadcast(broadcast.id).finished)
+        self.assertEqual([], self.db.get_unfinished_broadcasts())
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import os
+import threading
 import unittest
 
 from database.db_wrapper import DBwrapper
-from geizhals.entities import Product, Wishlist
+from geizhals.entities import EntityType, Product, Wishlist
 
 
 class DBWrapperTest(unittest.TestCase):
@@ -48,7 +49,8 @@ class DBWrapperTest(unittest.TestCase):
 
     def test_create_tables(self):
         """Test for checking if the database tables are created correctly"""
-        table_names = ["users", "products", "wishlists", "product_prices", "wishlist_prices", "product_subscribers", "wishlist_subscribers"]
+        table_names = ["users", "products", "wishlists", "product_prices", "wishlist_prices", "product_subscribers", "wishlist_subscribers",
+                       "check_schedule"]
 
         # Use another path, since we want to check that method independendly from the initialization
         path = self.db.dir_path
@@ -824,3 +826,172 @@ class DBWrapperTest(unittest.TestCase):
         self.db.add_user(user.get("user_id"), user.get("first_name"), user.get("username"), user.get("lang_code"))
 
         self.assertTrue(self.db.is_user_saved(user.get("user_id")))
+
+    def test_thread_connections(self):
+        """Test to check if each thread uses its own connection in WAL mode"""
+        self.assertEqual("wal", self.db.cursor.execute("PRAGMA journal_mode;").fetchone()[0])
+        self.assertIs(self.db.connection, self.db.connection)
+
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        results = {}
+
+        def worker(index):
+            results[index] = (self.db.connection, self.db.get_product_info(self.p.entity_id))
+            self.db.update_product_price(self.p.entity_id, 100 + index)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        connections = {id(connection) for connection, _ in results.values()}
+        self.assertEqual(4, len(connections))
+        self.assertNotIn(id(self.db.connection), connections)
+
+        for _, product in results.values():
+            self.assertEqual(self.p.entity_id, product.entity_id)
+
+        price_entries = self.db.cursor.execute("SELECT count(*) FROM product_prices;").fetchone()[0]
+        self.assertEqual(4, price_entries)
+
+    def test_transaction(self):
+        """Test to check if a transaction is rolled back on errors"""
+        with self.db.transaction() as cursor:
+            cursor.execute("INSERT INTO products (product_id, name, price, url) VALUES (1, 'Test', 1, 'url');")
+
+        with self.assertRaises(ValueError):
+            with self.db.transaction() as cursor:
+                cursor.execute("INSERT INTO products (product_id, name, price, url) VALUES (2, 'Test', 1, 'url');")
+                raise ValueError("Test")
+
+        self.assertTrue(self.db.is_product_saved(1))
+        self.assertFalse(self.db.is_product_saved(2))
+
+    def test_update_entities(self):
+        """Test to check if price and name updates of many entities are written at once"""
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+
+        self.db.update_entities(price_updates=[(self.p.TYPE, self.p.entity_id, 99.99), (self.wl.TYPE, self.wl.entity_id, 11.11),
+                                               (self.p.TYPE, 999, 1.0)],
+                                name_updates=[(self.p.TYPE, self.p.entity_id, "New Product")])
+
+        self.assertEqual(99.99, self.db.get_product_info(self.p.entity_id).price)
+        self.assertEqual("New Product", self.db.get_product_info(self.p.entity_id).name)
+        self.assertEqual(11.11, self.db.get_wishlist_info(self.wl.entity_id).price)
+        self.assertEqual(self.wl.name, self.db.get_wishlist_info(self.wl.entity_id).name)
+
+        # The price history of entities which are not (or no longer) stored is not updated
+        self.assertEqual(1, self.db.cursor.execute("SELECT count(*) FROM product_prices;").fetchone()[0])
+        self.assertEqual(1, self.db.cursor.execute("SELECT count(*) FROM wishlist_prices;").fetchone()[0])
+
+    def test_get_subscription_ids(self):
+        """Test to check if the ids of all subscribed wishlists and products of a user are returned"""
+        user_id = 415641
+        p2 = Product(654321, "Product2", "https://geizhals.de/a654321", 1.23)
+        self.assertEqual((set(), set()), self.db.get_subscription_ids(user_id))
+
+        self.db.add_user(user_id, "Peter", "jkopsdfjk", "en_US")
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_product(p2.entity_id, p2.name, p2.price, p2.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+        self.db.subscribe_product(self.p.entity_id, user_id)
+        self.db.subscribe_product(p2.entity_id, user_id)
+        self.db.subscribe_wishlist(self.wl.entity_id, user_id)
+
+        self.assertEqual(({self.wl.entity_id}, {self.p.entity_id, p2.entity_id}), self.db.get_subscription_ids(user_id))
+
+    def test_get_subscribers_for_entities(self):
+        """Test to check if the subscribers of many entities of both types are returned at once"""
+        user = {"user_id": 415641, "first_name": "Peter", "username": "jkopsdfjk", "lang_code": "en_US"}
+        user2 = {"user_id": 123456, "first_name": "John", "username": "ölyjsdf", "lang_code": "de"}
+        p2 = Product(654321, "Product2", "https://geizhals.de/a654321", 1.23)
+
+        self.db.add_user(user.get("user_id"), user.get("first_name"), user.get("username"), user.get("lang_code"))
+        self.db.add_user(user2.get("user_id"), user2.get("first_name"), user2.get("username"), user2.get("lang_code"))
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_product(p2.entity_id, p2.name, p2.price, p2.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+
+        self.db.subscribe_product(self.p.entity_id, user.get("user_id"))
+        self.db.subscribe_product(self.p.entity_id, user2.get("user_id"))
+        self.db.subscribe_product(p2.entity_id, user2.get("user_id"))
+        self.db.subscribe_wishlist(self.wl.entity_id, user.get("user_id"))
+
+        # The wishlist and the product share the same id, but must not be mixed up
+        subscribers = self.db.get_subscribers_for_entities([(self.p.TYPE, self.p.entity_id), (self.wl.TYPE, self.wl.entity_id)])
+        self.assertEqual(2, len(subscribers))
+        self.assertEqual({user.get("user_id"), user2.get("user_id")}, {u.user_id for u in subscribers[(self.p.TYPE, self.p.entity_id)]})
+        wl_subscribers = subscribers[(self.wl.TYPE, self.wl.entity_id)]
+        self.assertEqual(1, len(wl_subscribers))
+        self.assertEqual(user.get("user_id"), wl_subscribers[0].user_id)
+        self.assertEqual(user.get("first_name"), wl_subscribers[0].first_name)
+        self.assertEqual(user.get("lang_code"), wl_subscribers[0].lang_code)
+
+        # Queries with more ids than parameters per statement are split into chunks
+        self.db.max_query_params = 1
+        subscribers = self.db.get_subscribers_for_entities([(self.p.TYPE, self.p.entity_id), (p2.TYPE, p2.entity_id), (p2.TYPE, 999)])
+        self.assertEqual(2, len(subscribers[(self.p.TYPE, self.p.entity_id)]))
+        self.assertEqual(1, len(subscribers[(p2.TYPE, p2.entity_id)]))
+        self.assertNotIn((p2.TYPE, 999), subscribers)
+
+        self.assertEqual({}, self.db.get_subscribers_for_entities([]))
+
+    def test_rm_entities(self):
+        """Test to check if many entities are removed together with their subscriptions"""
+        self.db.add_user(415641, "Peter", "jkopsdfjk", "en_US")
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+        self.db.subscribe_product(self.p.entity_id, 415641)
+        self.db.subscribe_wishlist(self.wl.entity_id, 415641)
+
+        self.db.rm_entities([(self.p.TYPE, self.p.entity_id), (self.wl.TYPE, self.wl.entity_id)])
+
+        self.assertFalse(self.db.is_product_saved(self.p.entity_id))
+        self.assertFalse(self.db.is_wishlist_saved(self.wl.entity_id))
+        self.assertEqual(0, self.db.get_subscribed_product_count(415641))
+        self.assertEqual(0, self.db.cursor.execute("SELECT count(*) FROM wishlist_subscribers;").fetchone()[0])
+
+    def test_iter_subscribed_entity_keys(self):
+        """Test to check if the keys of the subscribed entities can be iterated in batches while running other queries"""
+        self.db.add_user(415641, "Peter", "jkopsdfjk", "en_US")
+        products = [Product(i, "Product {}".format(i), "https://geizhals.de/a{}.html".format(i), i) for i in range(1, 6)]
+        for p in products:
+            self.db.add_product(p.entity_id, p.name, p.price, p.url)
+            self.db.subscribe_product(p.entity_id, 415641)
+        self.db.add_product(100, "Unsubscribed", 1.0, "https://geizhals.de/a100.html")
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+        self.db.subscribe_wishlist(self.wl.entity_id, 415641)
+
+        keys = []
+        for key in self.db.iter_subscribed_entity_keys(batch_size=2):
+            # Queries on the shared cursor must not disturb the iteration
+            self.assertTrue(self.db.is_user_saved(415641))
+            keys.append(key)
+
+        self.assertEqual([(self.wl.TYPE, self.wl.entity_id)] + [(p.TYPE, p.entity_id) for p in products], keys)
+
+        # Only entities which are due (or were never scheduled) are returned
+        self.db.update_check_schedule([(1, Product.TYPE.value, 1000, 60), (2, Product.TYPE.value, 3000, 60)])
+        due = [entity_id for entity_type, entity_id in self.db.iter_subscribed_entity_keys(due_before=2000)
+               if entity_type == EntityType.PRODUCT]
+        self.assertEqual([1, 3, 4, 5], sorted(due))
+
+    def test_get_entities(self):
+        """Test to check if entities are loaded in the order of their keys and missing ones are left out"""
+        self.db.max_query_params = 2
+        products = [Product(i, "Product {}".format(i), "https://geizhals.de/a{}.html".format(i), i) for i in range(1, 6)]
+        for p in products:
+            self.db.add_product(p.entity_id, p.name, p.price, p.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+
+        keys = [(EntityType.PRODUCT, 5), (self.wl.TYPE, self.wl.entity_id), (EntityType.PRODUCT, 100), (EntityType.PRODUCT, 1),
+                (EntityType.PRODUCT, 3)]
+        entities = self.db.get_entities(keys)
+
+        self.assertEqual([(EntityType.PRODUCT, 5), (self.wl.TYPE, self.wl.entity_id), (EntityType.PRODUCT, 1), (EntityType.PRODUCT, 3)],
+                         [(entity.TYPE, entity.entity_id) for entity in entities])
+        self.assertIsInstance(entities[1], Wishlist)
+        self.assertEqual("Product 5", entities[0].name)
+        self.assertEqual(5.0, entities[0].price)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+import unittest
+
+from database.db_wrapper import DBwrapper
+from database.db_writer import DBWriter
+from geizhals.entities import EntityType, Product, Wishlist
+
+
+class FakeDB(object):
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.writing = threading.Event()
+        self.failures = 0
+
+    def update_entities(self, price_updates, name_updates, removed_entities=(), deleted_users=()):
+        self.writing.set()
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise sqlite3.OperationalError("database is locked")
+            self.calls.append((price_updates, name_updates, removed_entities, deleted_users))
+
+
+class DBWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_db = FakeDB()
+
+    def test_coalesce(self):
+        """Test to check if only the last update of an entity is written and updates of removed entities are dropped"""
+        writer = DBWriter(self.fake_db)
+        # Hold the lock, so the writer thread blocks on the first write and the others queue up
+        self.fake_db.lock.acquire()
+        writer.start()
+        writer.update_price(EntityType.PRODUCT, 1, 1.0)
+        self.assertTrue(self.fake_db.writing.wait(5))
+
+        writer.update_price(EntityType.PRODUCT, 2, 1.0)
+        writer.update_price(EntityType.PRODUCT, 2, 2.0)
+        writer.update_name(EntityType.PRODUCT, 2, "Name")
+        writer.update_price(EntityType.WISHLIST, 3, 3.0)
+        writer.rm_entity(EntityType.WISHLIST, 3)
+        writer.delete_user(42)
+        self.fake_db.lock.release()
+
+        self.assertTrue(writer.sync(timeout=5))
+        self.assertEqual(0, writer.pending)
+        writer.close()
+
+        self.assertEqual(2, len(self.fake_db.calls))
+        self.assertEqual(([(EntityType.PRODUCT, 1, 1.0)], [], [], []), self.fake_db.calls[0])
+        self.assertEqual(([(EntityType.PRODUCT, 2, 2.0)], [(EntityType.PRODUCT, 2, "Name")], [(EntityType.WISHLIST, 3)], [42]),
+                         self.fake_db.calls[1])
+
+    def test_close_flushes(self):
+        """Test to check if all queued writes are written when the writer is closed"""
+        written = []
+        writer = DBWriter(self.fake_db, on_write=lambda prices, names, removed, users: written.extend(prices))
+        writer.start()
+        for i in range(100):
+            writer.update_price(EntityType.PRODUCT, i, float(i))
+        writer.close()
+
+        self.assertEqual(100, len(written))
+        self.assertEqual(100, sum(len(call[0]) for call in self.fake_db.calls))
+
+        with self.assertRaises(RuntimeError):
+            writer.update_price(EntityType.PRODUCT, 1, 1.0)
+
+    def test_retry_failed_batch(self):
+        """Test to check if a batch whose transaction failed is written again and only then counts as completed"""
+        self.fake_db.failures = 2
+        writer = DBWriter(self.fake_db, retry_delay=0.01)
+        writer.start()
+        writer.update_price(EntityType.PRODUCT, 1, 1.0)
+        writer.rm_entity(EntityType.WISHLIST, 3)
+        writer.delete_user(42)
+
+        self.assertTrue(writer.sync(timeout=5))
+        self.assertEqual(0, self.fake_db.failures)
+        writer.close()
+
+        calls = self.fake_db.calls
+        self.assertEqual([(EntityType.PRODUCT, 1, 1.0)], [update for call in calls for update in call[0]])
+        self.assertEqual([(EntityType.WISHLIST, 3)], [entity for call in calls for entity in call[2]])
+        self.assertEqual([42], [user_id for call in calls for user_id in call[3]])
+
+    def test_drop_failing_batch(self):
+        """Test to check if a batch which can't be written is dropped after max_attempts and later writes go on"""
+        self.fake_db.failures = 3
+        writer = DBWriter(self.fake_db, retry_delay=0.01, max_attempts=3)
+        writer.start()
+        writer.update_price(EntityType.PRODUCT, 1, 1.0)
+        self.assertTrue(writer.sync(timeout=5))
+        self.assertEqual(1, writer.dropped)
+        self.assertEqual([], self.fake_db.calls)
+
+        writer.update_price(EntityType.PRODUCT, 2, 2.0)
+        self.assertTrue(writer.close(timeout=5))
+        self.assertEqual([([(EntityType.PRODUCT, 2, 2.0)], [], [], [])], self.fake_db.calls)
+
+    def test_backpressure(self):
+        """Test to check if writes block while the queue is full"""
+        writer = DBWriter(self.fake_db, max_queue_size=1)
+        self.fake_db.lock.acquire()
+        writer.start()
+        writer.update_price(EntityType.PRODUCT, 1, 1.0)
+
+        # Wait until the writer took the first write and blocks on the database
+        self.assertTrue(self.fake_db.writing.wait(5))
+        writer.update_price(EntityType.PRODUCT, 2, 1.0)
+
+        blocked = threading.Thread(target=writer.update_price, args=(EntityType.PRODUCT, 3, 1.0))
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive())
+        self.assertFalse(writer.sync(timeout=0.1))
+
+        self.fake_db.lock.release()
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        writer.close()
+        self.assertEqual(3, sum(len(call[0]) for call in self.fake_db.calls))
+
+
+class DBWriterIntegrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        self.p = Product(123456, "Product", "https://geizhals.de/a123456", 123.45)
+        self.wl = Wishlist(123456, "Wishlist", "https://geizhals.de/?cat=WL-123456", 123.45)
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def test_read_your_writes(self):
+        """Test to check if the writes are visible to other threads after sync"""
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+        self.db.add_user(1, "John", "john")
+
+        writer = DBWriter(self.db)
+        writer.start()
+        writer.update_price(EntityType.PRODUCT, self.p.entity_id, 99.0)
+        writer.update_name(EntityType.PRODUCT, self.p.entity_id, "New Product")
+        writer.rm_entity(EntityType.WISHLIST, self.wl.entity_id)
+        writer.delete_user(1)
+        self.assertTrue(writer.sync(timeout=5))
+
+        product = self.db.get_product_info(self.p.entity_id)
+        self.assertEqual(99.0, product.price)
+        self.assertEqual("New Product", product.name)
+        self.assertFalse(self.db.is_wishlist_saved(self.wl.entity_id))
+        self.assertFalse(self.db.is_user_saved(1))
+        writer.close()
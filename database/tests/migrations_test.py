@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from database import migrations
+from database.db_wrapper import DBwrapper
+
+
+class MigrationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def get_indexes(self):
+        self.db.cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%';")
+        return {row[0] for row in self.db.cursor.fetchall()}
+
+    def test_new_database(self):
+        """Test to check if a new database is created with the current schema version"""
+        self.assertEqual(migrations.SCHEMA_VERSION, migrations.get_schema_version(self.db.connection))
+        self.assertIn("idx_product_subscribers_entity_user", self.get_indexes())
+        self.assertIn("idx_wishlist_prices_entity_timestamp", self.get_indexes())
+
+    def test_upgrade_old_database(self):
+        """Test to check if an existing database without indexes is upgraded in place"""
+        for index in self.get_indexes():
+            self.db.cursor.execute("DROP INDEX {};".format(index))
+        self.db.cursor.execute("PRAGMA user_version = 0;")
+
+        self.db.add_user(1, "John", "john")
+        self.db.add_product(1, "Product", 1.0, "https://geizhals.de/a1")
+        self.db.cursor.executemany("INSERT INTO product_subscribers (product_id, user_id) VALUES (?, ?);", [(1, 1), (1, 1), (1, 1)])
+        self.db.connection.commit()
+
+        self.assertEqual(migrations.SCHEMA_VERSION, self.db.migrate())
+        self.assertEqual(migrations.SCHEMA_VERSION, migrations.get_schema_version(self.db.connection))
+        self.assertEqual(1, self.db.cursor.execute("SELECT count(*) FROM product_subscribers;").fetchone()[0])
+        self.assertEqual({"idx_product_subscribers_entity_user", "idx_product_subscribers_user", "idx_product_prices_entity_timestamp",
+                          "idx_wishlist_subscribers_entity_user", "idx_wishlist_subscribers_user", "idx_wishlist_prices_entity_timestamp",
+                          "idx_outbox_due", "idx_outbox_user"},
+                         self.get_indexes())
+
+        # Subscribing twice does not create a duplicate anymore
+        self.db.subscribe_product(1, 1)
+        self.assertEqual(1, self.db.cursor.execute("SELECT count(*) FROM product_subscribers;").fetchone()[0])
+
+    def test_newer_database(self):
+        """Test to check if a database of a newer version is rejected"""
+        self.db.cursor.execute("PRAGMA user_version = {};".format(migrations.SCHEMA_VERSION + 1))
+
+        with self.assertRaises(RuntimeError):
+            self.db.migrate()
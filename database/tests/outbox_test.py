@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from database import outbox
+from database.db_wrapper import DBwrapper
+from geizhals.entities import EntityType, Product, Wishlist
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        self.p = Product(123456, "Product", "https://geizhals.de/a123456", 10.0)
+        self.wl = Wishlist(123456, "Wishlist", "https://geizhals.de/?cat=WL-123456", 20.0)
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        self.db.add_wishlist(self.wl.entity_id, self.wl.name, self.wl.price, self.wl.url)
+
+        for user_id in (1, 2):
+            self.db.add_user(user_id, "User", "user{}".format(user_id), "de")
+            self.db.subscribe_product(self.p.entity_id, user_id)
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def get_status(self):
+        return dict(self.db.cursor.execute("SELECT id, status FROM outbox;").fetchall())
+
+    def test_price_update(self):
+        """Test to check if a price change adds a notification for every subscriber in the same transaction"""
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5), (EntityType.WISHLIST, self.wl.entity_id, 15.0)], [])
+
+        notifications = self.db.claim_notifications(now=2000000000, limit=10, lease=60)
+        self.assertEqual({1, 2}, {notification.user_id for notification in notifications})
+        notification = notifications[0]
+        self.assertEqual(EntityType.PRODUCT, notification.entity_type)
+        self.assertEqual(self.p.entity_id, notification.entity_id)
+        self.assertEqual(self.p.name, notification.name)
+        self.assertEqual(self.p.url, notification.url)
+        self.assertEqual(10.0, notification.old_price)
+        self.assertEqual(8.5, notification.new_price)
+        self.assertEqual(1, notification.attempts)
+
+        # An unchanged price doesn't notify anybody
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [])
+        self.assertEqual(2, len(self.get_status()))
+
+    def test_single_price_update(self):
+        """Test to check if the single price updates add notifications to the outbox as well"""
+        self.db.subscribe_wishlist(self.wl.entity_id, 1)
+        self.db.update_product_price(self.p.entity_id, 8.5)
+        self.db.update_wishlist_price(self.wl.entity_id, 15.0)
+
+        notifications = self.db.claim_notifications(now=2000000000, limit=10, lease=60)
+        self.assertEqual({(EntityType.PRODUCT, 1), (EntityType.PRODUCT, 2), (EntityType.WISHLIST, 1)},
+                         {(notification.entity_type, notification.user_id) for notification in notifications})
+
+    def test_digest(self):
+        """Test to check if the notifications of digest users are due at the end of the digest window"""
+        self.assertFalse(self.db.is_digest_user(1))
+        self.db.set_digest_user(1, True)
+        self.assertTrue(self.db.is_digest_user(1))
+        self.db.digest_window = 1000
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [])
+        created = self.db.cursor.execute("SELECT created FROM outbox LIMIT 1;").fetchone()[0]
+        window_end = created - created % 1000 + 1000
+
+        notifications = self.db.claim_notifications(window_end - 1, 10, 60)
+        self.assertEqual([(2, False)], [(n.user_id, n.digest) for n in notifications])
+        notifications = self.db.claim_notifications(window_end, 10, 60)
+        self.assertEqual([(1, True)], [(n.user_id, n.digest) for n in notifications])
+
+    def test_claim_whole_digest(self):
+        """Test to check if the limit doesn't split the digest of a user"""
+        self.db.set_digest_user(1, True)
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [])
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 7.5)], [])
+        self.db.cursor.execute("UPDATE outbox SET next_attempt=0;")
+        self.db.connection.commit()
+
+        notifications = self.db.claim_notifications(1000, 1, 60)
+        self.assertEqual([1, 1], [n.user_id for n in notifications])
+
+    def test_claim(self):
+        """Test to check if claimed notifications are only due again after their lease"""
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [])
+
+        self.assertEqual(1, len(self.db.claim_notifications(now=1000, limit=1, lease=60)))
+        self.assertEqual(1, len(self.db.claim_notifications(now=1000, limit=10, lease=60)))
+        self.assertEqual(0, len(self.db.claim_notifications(now=1059, limit=10, lease=60)))
+
+        notifications = self.db.claim_notifications(now=1060, limit=10, lease=60)
+        self.assertEqual(2, len(notifications))
+        self.assertEqual([2, 2], [notification.attempts for notification in notifications])
+
+        self.assertEqual(2, self.db.release_notifications())
+        self.assertEqual(2, len(self.db.claim_notifications(now=1061, limit=10, lease=60)))
+
+    def test_complete(self):
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [])
+        self.db.add_user(3, "User", "user3", "de")
+        self.db.subscribe_product(self.p.entity_id, 3)
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 9.5)], [])
+        first, second, third = [notification.id for notification in self.db.claim_notifications(1000, 10, 60)][:3]
+
+        self.db.complete_notifications([first], [second], [(third, 1100)])
+        status = self.get_status()
+        self.assertEqual(outbox.SENT, status[first])
+        self.assertEqual(outbox.FAILED, status[second])
+        self.assertEqual(outbox.PENDING, status[third])
+
+        self.assertNotIn(third, [n.id for n in self.db.claim_notifications(1099, 10, 60)])
+        self.assertIn(third, [n.id for n in self.db.claim_notifications(1100, 10, 60)])
+
+    def test_delete_user(self):
+        """Test to check if the notifications of deleted users are removed"""
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [], deleted_users=[1])
+        self.assertEqual([2], [notification.user_id for notification in self.db.claim_notifications(1000, 10, 60)])
+
+        self.db.delete_user(2)
+        self.assertEqual(0, len(self.get_status()))
+
+    def test_prune(self):
+        """Test to check if only delivered and failed notifications are pruned"""
+        self.db.update_entities([(EntityType.PRODUCT, self.p.entity_id, 8.5)], [])
+        first, second = [notification.id for notification in self.db.claim_notifications(1000, 10, 60)]
+        self.db.complete_notifications([first], [])
+
+        self.assertEqual(0, self.db.prune_outbox(0))
+        self.assertEqual(1, self.db.prune_outbox(2 ** 40))
+        self.assertEqual([second], list(self.get_status()))
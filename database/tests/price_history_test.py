@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from database import price_history
+from database.db_wrapper import DBwrapper
+from geizhals.entities import EntityType, Product
+
+
+class PriceHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_name = "test.db"
+        self.db = DBwrapper.get_instance(self.db_name)
+        self.p = Product(123456, "Product", "https://geizhals.de/a123456", 10.0)
+        self.db.add_product(self.p.entity_id, self.p.name, self.p.price, self.p.url)
+        # Start of a day
+        self.day = 1500000000 - 1500000000 % price_history.DAILY
+
+    def tearDown(self):
+        self.db.delete_all_tables()
+        self.db.close_conn()
+        try:
+            os.remove(os.path.join(self.db.dir_path, self.db_name))
+        except OSError:
+            pass
+
+        DBwrapper.instance = None
+
+    def record(self, price, timestamp):
+        recorded = price_history.record_price(self.db.cursor, EntityType.PRODUCT, self.p.entity_id, price, timestamp)
+        self.db.connection.commit()
+        return recorded
+
+    def count_raw_points(self):
+        return self.db.cursor.execute("SELECT count(*) FROM product_prices;").fetchone()[0]
+
+    def test_record_changes_only(self):
+        """Test to check if only actual price changes are stored"""
+        self.assertTrue(self.record(10.0, self.day))
+        self.assertFalse(self.record(10.0, self.day + 60))
+        self.assertTrue(self.record(12.0, self.day + 120))
+        self.assertFalse(self.record("12.0", self.day + 180))
+
+        self.assertEqual(2, self.count_raw_points())
+        self.assertEqual(12.0, price_history.get_last_price(self.db.cursor, EntityType.PRODUCT, self.p.entity_id))
+
+    def test_rollups(self):
+        """Test to check if the hourly and daily rollups are updated with each change"""
+        self.record(10.0, self.day + 60)
+        self.record(8.0, self.day + 120)
+        self.record(15.0, self.day + 3600 + 60)
+        self.record(11.0, self.day + 3600 + 120)
+
+        hourly = self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, price_history.HOURLY, self.day)
+        self.assertEqual([(self.day, 8.0, 10.0, 8.0), (self.day + 3600, 8.0, 15.0, 11.0)], hourly)
+
+        daily = self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, price_history.DAILY, self.day + 5000)
+        self.assertEqual([(self.day, 8.0, 15.0, 11.0)], daily)
+
+        with self.assertRaises(ValueError):
+            self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, 60, self.day)
+
+    def test_prune(self):
+        """Test to check if old raw points are deleted except the last one of each entity"""
+        self.record(10.0, self.day)
+        self.record(11.0, self.day + 3600)
+        self.record(12.0, self.day + 2 * 3600)
+
+        self.assertEqual(2, self.db.prune_price_history(self.day + 3 * 3600, hourly_before=self.day + 3600))
+        self.assertEqual(1, self.count_raw_points())
+        self.assertEqual(12.0, price_history.get_last_price(self.db.cursor, EntityType.PRODUCT, self.p.entity_id))
+
+        # Rollups are not affected by pruning raw points
+        hourly = self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, price_history.HOURLY, self.day)
+        self.assertEqual([self.day + 3600, self.day + 2 * 3600], [row[0] for row in hourly])
+        daily = self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, price_history.DAILY, self.day)
+        self.assertEqual([(self.day, 10.0, 12.0, 12.0)], daily)
+
+    def test_rm_entity(self):
+        """Test to check if removing an entity removes its rollups as well"""
+        p2 = Product(654321, "Product 2", "https://geizhals.de/a654321", 20.0)
+        self.db.add_product(p2.entity_id, p2.name, p2.price, p2.url)
+        self.record(10.0, self.day)
+        price_history.record_price(self.db.cursor, EntityType.PRODUCT, p2.entity_id, 20.0, self.day)
+        self.db.connection.commit()
+
+        self.db.rm_entities([(EntityType.PRODUCT, self.p.entity_id)])
+        self.assertEqual([], self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, price_history.DAILY, self.day))
+        self.assertEqual(1, len(self.db.get_price_rollups(EntityType.PRODUCT, p2.entity_id, price_history.DAILY, self.day)))
+
+        self.db.rm_product(p2.entity_id)
+        self.assertEqual(0, self.db.cursor.execute("SELECT count(*) FROM price_rollups;").fetchone()[0])
+
+    def test_migrate_existing_history(self):
+        """Test to check if the rollups are created from an existing history with repeated prices"""
+        self.db.cursor.executemany("INSERT INTO product_prices VALUES (?, ?, ?);",
+                                   [(self.p.entity_id, 10.0, self.day), (self.p.entity_id, 10.0, self.day + 60),
+                                    (self.p.entity_id, 9.0, self.day + 120)])
+        price_history.create_rollups(self.db.cursor)
+        self.db.connection.commit()
+
+        self.assertEqual(2, self.count_raw_points())
+        daily = self.db.get_price_rollups(EntityType.PRODUCT, self.p.entity_id, price_history.DAILY, self.day)
+        self.assertEqual([(self.day, 9.0, 10.0, 9.0)], daily)
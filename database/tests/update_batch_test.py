@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from database.update_batch import EntityUpdateBatch
+from geizhals.entities import EntityType, Product, Wishlist
+
+
+class FakeDB(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def update_entities(self, price_updates, name_updates):
+        self.calls.append((price_updates, name_updates))
+
+
+class EntityUpdateBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDB()
+        self.time = 0
+        self.p = Product(123456, "Product", "https://geizhals.de/a123456", 123.45)
+        self.wl = Wishlist(654321, "Wishlist", "https://geizhals.de/?cat=WL-654321", 12.34)
+
+    def clock(self):
+        return self.time
+
+    def test_flush_on_exit(self):
+        """Test to check if pending updates are written when leaving the context"""
+        with EntityUpdateBatch(self.db, flush_size=10, flush_interval=30, clock=self.clock) as batch:
+            batch.add_price(self.p, 99.99)
+            batch.add_name(self.wl, "New Wishlist")
+            self.assertEqual(2, len(batch))
+            self.assertEqual([], self.db.calls)
+
+        self.assertEqual([([(EntityType.PRODUCT, 123456, 99.99)], [(EntityType.WISHLIST, 654321, "New Wishlist")])], self.db.calls)
+        self.assertEqual(0, len(batch))
+
+    def test_flush_size(self):
+        """Test to check if the batch is written as soon as it is full"""
+        batch = EntityUpdateBatch(self.db, flush_size=2, flush_interval=30, clock=self.clock)
+        batch.add_price(self.p, 1.0)
+        self.assertEqual(0, len(self.db.calls))
+        batch.add_price(self.wl, 2.0)
+        self.assertEqual(1, len(self.db.calls))
+        self.assertEqual(0, len(batch))
+
+    def test_flush_interval(self):
+        """Test to check if the batch is written when the oldest update waited too long"""
+        batch = EntityUpdateBatch(self.db, flush_size=100, flush_interval=30, clock=self.clock)
+        batch.add_price(self.p, 1.0)
+        self.time = 29
+        batch.add_price(self.wl, 2.0)
+        self.assertEqual(0, len(self.db.calls))
+        self.time = 30
+        batch.add_name(self.p, "Name")
+        self.assertEqual(1, len(self.db.calls))
+
+    def test_flush_empty(self):
+        """Test to check if an empty batch doesn't touch the database"""
+        EntityUpdateBatch(self.db).flush()
+        self.assertEqual([], self.db.calls)
+
+    def test_on_flush(self):
+        """Test to check if the callback receives the written updates"""
+        flushed = []
+        batch = EntityUpdateBatch(self.db, on_flush=lambda prices, names: flushed.append((prices, names)))
+        batch.add_price(self.p, 1.0)
+        self.assertEqual([], flushed)
+
+        batch.flush()
+        self.assertEqual([([(EntityType.PRODUCT, 123456, 1.0)], [])], flushed)
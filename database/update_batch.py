@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EntityUpdateBatch(object):
+    """
+    Collects the price and name changes of a check cycle and writes them to the database in a single transaction
+    as soon as flush_size updates are pending or flush_interval seconds have passed since the first pending update.
+    After each write, on_flush is called with the written price and name updates.
+    """
+
+    def __init__(self, db, flush_size=100, flush_interval=30, clock=time.monotonic, on_flush=None):
+        self.db = db
+        self.on_flush = on_flush
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._price_updates = []
+        self._name_updates = []
+        self._first_update = None
+
+    def __len__(self):
+        return len(self._price_updates) + len(self._name_updates)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def add_price(self, entity, price):
+        self._add(self._price_updates, (entity.TYPE, entity.entity_id, price))
+
+    def add_name(self, entity, name):
+        self._add(self._name_updates, (entity.TYPE, entity.entity_id, name))
+
+    def _add(self, updates, update):
+        if self._first_update is None:
+            self._first_update = self._clock()
+
+        updates.append(update)
+
+        if len(self) >= self.flush_size or self._clock() - self._first_update >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all pending updates to the database"""
+        if len(self) == 0:
+            return
+
+        logger.debug("Writing {} price and {} name updates".format(len(self._price_updates), len(self._name_updates)))
+        price_updates, name_updates = self._price_updates, self._name_updates
+        self.db.update_entities(price_updates, name_updates)
+        self._price_updates = []
+        self._name_updates = []
+        self._first_update = None
+
+        if self.on_flush is not None:
+            self.on_flush(price_updates, name_updates)
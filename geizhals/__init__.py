@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from .state_handler import GeizhalsStateHandler
+from .price_checker import PriceChecker
 
-__all__ = ["GeizhalsStateHandler"]
+__all__ = ["GeizhalsStateHandler", "PriceChecker"]
@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
+import codecs
 import html
 import logging
+import re
+import time
+from collections import namedtuple
+from enum import Enum
+from urllib.parse import urlparse
 
-import requests
 from pyquery import PyQuery
-from requests.exceptions import ProxyError
+from requests.exceptions import ProxyError, RequestException
 
+from geizhals import fast_extractor
 from geizhals.entities import EntityType
 from geizhals.exceptions import HTTPLimitedException
+from geizhals.rate_limiter import parse_retry_after
 from geizhals.state_handler import GeizhalsStateHandler
 
 logger = logging.getLogger(__name__)
@@ -16,54 +23,157 @@ useragent = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) " \
             "Safari/537.36"
 
 
-def send_request(url):
+class ExtractionStatus(Enum):
+    OK = 0
+    NAME_MISSING = 1
+    PRICE_MISSING = 2
+
+
+EntityData = namedtuple("EntityData", ["name", "price", "status"])
+
+EXTRACTOR_PYQUERY = "pyquery"
+EXTRACTOR_REGEX = "regex"
+
+
+# Html fragments which have to be received (in this order) before the download of an entity page can be stopped
+STREAM_END_MARKERS = {
+    EntityType.WISHLIST: [re.compile(r'class="wishlist_sum_area"'),
+                          re.compile(r'<span class="gh_price">[^<]*</span>')],
+    EntityType.PRODUCT: [re.compile(r'id="offer__price-0"'),
+                         re.compile(r'<span class="gh_price">[^<]*</span>')],
+}
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _send_request(url, read_response, stream=False):
+    """Downloads a site via the next proxy and returns whatever read_response returns for the successful response"""
     logger.debug("Requesting url '{}'!".format(url))
     statehandler = GeizhalsStateHandler()
 
+    host = urlparse(url).netloc
+    headers = {'User-Agent': useragent, 'Accept-Encoding': 'gzip, deflate'}
     successful_connection = False
-    r = None
+    content = None
 
     for i in range(3):
         logger.debug("Trying to download site {}/3".format(i + 1))
         if statehandler.use_proxies:
             proxy = statehandler.get_next_proxy()
             logger.debug("Using proxy: '{}'".format(proxy))
-            proxies = dict(http=proxy, https=proxy)
         else:
             proxy = None
-            proxies = None
+
+        session = statehandler.get_session(proxy, host)
+        statehandler.rate_limiter.acquire(host)
 
         try:
-            r = requests.get(url, headers={'User-Agent': useragent}, proxies=proxies, timeout=4)
+            with statehandler.proxy_slot(proxy):
+                start_time = time.monotonic()
+                r = session.get(url, headers=headers, timeout=4, stream=stream)
+                if r.status_code == 200:
+                    content = read_response(r)
+                r.close()
+                latency = time.monotonic() - start_time
         except ProxyError as e:
             logger.warning("An error using the proxy '{}' occurred: {}. Trying another proxy if possible!".format(proxy, e))
+            statehandler.report_failure(proxy)
             continue
+        except RequestException:
+            statehandler.report_failure(proxy)
+            raise
 
         if r.status_code == 429:
             logger.error("Geizhals blocked us from sending that many requests (HTTP 429)!")
-            if statehandler.use_proxies:
-                proxy = statehandler.get_next_proxy()
-                logger.info("Switching proxy to '{}".format(proxy))
+            statehandler.report_rate_limited(proxy)
+            statehandler.rate_limiter.on_rate_limited(host, parse_retry_after(r.headers.get("Retry-After")))
             continue
         elif r.status_code == 200:
+            statehandler.report_success(proxy, latency)
+            statehandler.rate_limiter.on_success(host)
             successful_connection = True
             break
 
     if not successful_connection:
         raise HTTPLimitedException("Geizhals blocked us temporarily!")
 
-    html_str = r.text
-    logger.debug("HTML content length: {} - status code: {}".format(len(html_str), r.status_code))
+    return content
+
+
+def send_request(url):
+    html_str = _send_request(url, lambda r: r.text)
+    logger.debug("HTML content length: {}".format(len(html_str)))
     html_str = html.unescape(html_str)
     return html_str
 
 
+def read_until_markers(chunks, end_markers, encoding="utf-8"):
+    """
+    Decodes byte chunks until all the end markers were found one after another.
+    Returns the decoded text and whether the reading was stopped before all chunks were consumed.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    text = ""
+    marker_index = 0
+    search_pos = 0
+
+    for chunk in chunks:
+        text += decoder.decode(chunk)
+
+        while marker_index < len(end_markers):
+            match = end_markers[marker_index].search(text, search_pos)
+            if match is None:
+                # Markers might be split across chunks, so the next search starts a bit before the end of the text
+                search_pos = max(search_pos, len(text) - 256)
+                break
+
+            search_pos = match.end()
+            marker_index += 1
+
+        if marker_index == len(end_markers):
+            return text, True
+
+    return text + decoder.decode(b"", final=True), False
+
+
+def send_streaming_request(url, end_markers):
+    """
+    Downloads a site incrementally and stops as soon as all the end markers were received.
+    Returns the (possibly truncated) html and whether the download was stopped early.
+    """
+
+    def read_response(r):
+        return read_until_markers(r.iter_content(chunk_size=STREAM_CHUNK_SIZE), end_markers, r.encoding or "utf-8")
+
+    html_str, truncated = _send_request(url, read_response, stream=True)
+    logger.debug("HTML content length: {} - truncated: {}".format(len(html_str), truncated))
+    html_str = html.unescape(html_str)
+    return html_str, truncated
+
+
+def fetch_entity_data(url, entity_type):
+    """
+    Downloads and parses the page of an entity. When streaming is enabled, the download stops as soon as the parts
+    needed for the extraction were received. If these parts turn out to be incomplete, the whole page is downloaded.
+    """
+    if GeizhalsStateHandler().streaming:
+        html_str, truncated = send_streaming_request(url, STREAM_END_MARKERS[entity_type])
+        data = extract_entity_data(html_str, entity_type)
+
+        if data.status == ExtractionStatus.OK or not truncated:
+            return data
+
+        logger.info("Couldn't parse truncated page '{}' - downloading the full page!".format(url))
+
+    return extract_entity_data(send_request(url), entity_type)
+
+
 def parse_html(html_str, selector):
     pq = PyQuery(html_str)
     return pq(selector).text()
 
 
-def parse_entity_price(html_str, entity_type):
+def _select_entity_price(pq, entity_type):
+    """Returns the price string of an entity from an already parsed page"""
     if entity_type == EntityType.WISHLIST:
         selector = "div.wishlist_sum_area span.gh_price span.gh_price > span.gh_price"
     elif entity_type == EntityType.PRODUCT:
@@ -71,13 +181,14 @@ def parse_entity_price(html_str, entity_type):
     else:
         raise ValueError("The given type {} is unknown!".format(entity_type))
 
-    price = parse_html(html_str, selector)
+    price = pq(selector).text()
     price = price[2:]  # Cut off the '€ ' before the real price
     price = price.replace(',', '.')
     return price
 
 
-def parse_entity_name(html_str, entity_type):
+def _select_entity_name(pq, entity_type):
+    """Returns the name of an entity from an already parsed page or an empty string if it can't be found"""
     if entity_type == EntityType.WISHLIST:
         selector = "h1.gh_listtitle"
     elif entity_type == EntityType.PRODUCT:
@@ -85,14 +196,100 @@ def parse_entity_name(html_str, entity_type):
     else:
         raise ValueError("The given type {} is unknown!".format(entity_type))
 
-    name = parse_html(html_str, selector)
+    name = pq(selector).text()
 
     # Temporary fix for new Geizhals pages such as https://geizhals.de/sony-ht-rt3-schwarz-a1400003.html
     if name == "" and entity_type == EntityType.PRODUCT:
-        name = parse_html(html_str, "#productpage__headline")
+        name = pq("#productpage__headline").text()
+
+    return name
 
-    # If name is still empty, raise error
+
+def parse_entity_price(html_str, entity_type):
+    if entity_type not in (EntityType.WISHLIST, EntityType.PRODUCT):
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+    return _select_entity_price(PyQuery(html_str), entity_type)
+
+
+def parse_entity_name(html_str, entity_type):
+    if entity_type not in (EntityType.WISHLIST, EntityType.PRODUCT):
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+    name = _select_entity_name(PyQuery(html_str), entity_type)
+
+    # If name is empty, raise error
     if name == "":
         raise ValueError("Name cannot be parsed!")
 
     return name
+
+
+def parse_price_value(price):
+    """Converts a parsed price string such as '199.65' or '199.--' to a float"""
+    # Parse price so that it's a proper comma value (no `,--`)
+    pattern = r"([0-9]+)\.([0-9]+|[-]+)"
+    pattern_dash = r"([0-9]+)\.([-]+)"
+
+    if re.match(pattern, price):
+        if re.match(pattern_dash, price):
+            price = float(re.search(pattern_dash, price).group(1))
+    else:
+        raise ValueError("Couldn't parse price '{}'!".format(price))
+
+    return float(price)
+
+
+def _extract_entity_data_regex(html_str, entity_type):
+    """Extracts name and price of an entity without building a DOM - returns None if anything can't be matched"""
+    name = fast_extractor.extract_name(html_str, entity_type)
+    price = fast_extractor.extract_price(html_str, entity_type)
+
+    if name is None or price is None:
+        return None
+
+    try:
+        price = parse_price_value(price)
+    except ValueError:
+        return None
+
+    return EntityData(name=name, price=price, status=ExtractionStatus.OK)
+
+
+def extract_entity_data(html_str, entity_type, extractor=None):
+    """
+    Parses the html of an entity page a single time and returns its name, price and the extraction status.
+    The extractor defaults to the one configured in the GeizhalsStateHandler. The regex extractor falls back to
+    PyQuery if it can't find name or price.
+    """
+    if entity_type not in (EntityType.WISHLIST, EntityType.PRODUCT):
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+    if extractor is None:
+        extractor = GeizhalsStateHandler().extractor
+
+    if extractor == EXTRACTOR_REGEX:
+        data = _extract_entity_data_regex(html_str, entity_type)
+        if data is not None:
+            return data
+
+        logger.debug("Regex extractor couldn't parse the page - falling back to PyQuery!")
+    elif extractor != EXTRACTOR_PYQUERY:
+        raise ValueError("The given extractor {} is unknown!".format(extractor))
+
+    pq = PyQuery(html_str)
+    name = _select_entity_name(pq, entity_type)
+
+    try:
+        price = parse_price_value(_select_entity_price(pq, entity_type))
+    except ValueError:
+        price = None
+
+    if name == "":
+        status = ExtractionStatus.NAME_MISSING
+    elif price is None:
+        status = ExtractionStatus.PRICE_MISSING
+    else:
+        status = ExtractionStatus.OK
+
+    return EntityData(name=name, price=price, status=status)
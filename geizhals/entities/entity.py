@@ -1,46 +1,60 @@
 # -*- coding: utf-8 -*-
-import re
-
 import geizhals.core
 
 
 class Entity(object):
     TYPE = None
+    url_pattern = None
+    # Entities are created for every tracked product and wishlist, so they don't carry a per-instance __dict__
+    __slots__ = ("__html", "__data", "entity_id", "name", "url", "price")
 
     def __init__(self, entity_id: int, name: str, url: str, price: float):
         self.__html = None
+        self.__data = None
         self.entity_id = int(entity_id)
         self.name = str(name)
         self.url = str(url)
         self.price = float(price)
 
+    @property
+    def id(self):
+        return self.entity_id
+
     def get_html(self):
         """Check if html for entity is already downloaded - if not download html and save in self.__html"""
         if not self.__html:
             self.__html = geizhals.core.send_request(self.url)
 
+    def get_current_data(self):
+        """
+        Get the current name, price and extraction status of an entity - the page is only parsed once and its html is
+        released right after the extraction
+        """
+        if self.__data is None:
+            if self.__html:
+                self.__data = geizhals.core.extract_entity_data(self.__html, self.TYPE)
+                self.__html = None
+            else:
+                self.__data = geizhals.core.fetch_entity_data(self.url, self.TYPE)
+
+        return self.__data
+
     def get_current_name(self):
         """Get the current name of an entity from Geizhals"""
-        self.get_html()
+        data = self.get_current_data()
 
-        name = geizhals.core.parse_entity_name(self.__html, self.TYPE)
+        if data.status == geizhals.core.ExtractionStatus.NAME_MISSING:
+            raise ValueError("Name cannot be parsed!")
 
-        return name
+        return data.name
 
     def get_current_price(self):
-        """Get the current price of a wishlist from Geizhals"""
-        self.get_html()
-        self.get_current_name()
-        price = geizhals.core.parse_entity_price(self.__html, self.TYPE)
-
-        # Parse price so that it's a proper comma value (no `,--`)
-        pattern = r"([0-9]+)\.([0-9]+|[-]+)"
-        pattern_dash = r"([0-9]+)\.([-]+)"
-
-        if re.match(pattern, price):
-            if re.match(pattern_dash, price):
-                price = float(re.search(pattern_dash, price).group(1))
-        else:
-            raise ValueError("Couldn't parse price '{}' for entity '{}'!".format(price, self.url))
-
-        return float(price)
+        """Get the current price of an entity from Geizhals"""
+        data = self.get_current_data()
+
+        if data.status == geizhals.core.ExtractionStatus.NAME_MISSING:
+            raise ValueError("Name cannot be parsed!")
+        elif data.status == geizhals.core.ExtractionStatus.PRICE_MISSING:
+            raise ValueError("Couldn't parse price for entity '{}'!".format(self.url))
+
+        return data.price
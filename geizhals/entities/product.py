@@ -14,13 +14,24 @@ class Product(Entity):
     url_pattern = r"https:\/\/geizhals\.(de|at|eu)\/[0-9a-zA-Z\-]*a([0-9]+).html"
     ENTITY_NAME = "Produkt"
     TYPE = EntityType.PRODUCT
+    __slots__ = ()
+
+    @classmethod
+    def canonical_url(cls, url):
+        """Strips query strings, fragments and other url variants - the slug is kept to not cause a redirect"""
+        match = re.match(Product.url_pattern, url.strip())
+        if not match:
+            return url
+
+        path = match.group(0).split("/", 3)[3]
+        return "https://geizhals.{region}/{path}".format(region=match.group(1), path=path)
 
     @staticmethod
     def from_url(url):
         if not re.match(Product.url_pattern, url):
             raise geizhals.exceptions.InvalidWishlistURLException
 
-        p = Product(entity_id=0, name="", url=url, price=0)
+        p = Product(entity_id=0, name="", url=Product.canonical_url(url), price=0)
         p.price = p.get_current_price()
         p.name = p.get_current_name()
         p.entity_id = int(re.search(Product.url_pattern, url).group(2))
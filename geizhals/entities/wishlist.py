@@ -11,6 +11,16 @@ class Wishlist(Entity):
     url_pattern = r"https:\/\/geizhals\.(de|at|eu)\/\?cat=WL-([0-9]+)"
     ENTITY_NAME = "Wunschliste"
     TYPE = EntityType.WISHLIST
+    __slots__ = ()
+
+    @classmethod
+    def canonical_url(cls, url):
+        """Removes all the url parameters except for the wishlist id"""
+        match = re.match(Wishlist.url_pattern, url.strip())
+        if not match:
+            return url
+
+        return "https://geizhals.{region}/?cat=WL-{id}".format(region=match.group(1), id=match.group(2))
 
     @staticmethod
     def from_url(url):
@@ -18,7 +28,7 @@ class Wishlist(Entity):
         if not re.match(Wishlist.url_pattern, url):
             raise geizhals.exceptions.InvalidWishlistURLException
 
-        wl = Wishlist(entity_id=0, name="", url=url, price=0)
+        wl = Wishlist(entity_id=0, name="", url=Wishlist.canonical_url(url), price=0)
         wl.price = wl.get_current_price()
         wl.name = wl.get_current_name()
         wl.entity_id = int(re.search(Wishlist.url_pattern, url).group(2))
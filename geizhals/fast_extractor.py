@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Extraction of entity names and prices by scanning the raw html without building a DOM"""
+import html
+import re
+
+from geizhals.entities import EntityType
+
+_tag_pattern = re.compile(r"<[^>]*>")
+_div_tag_pattern = re.compile(r"<(/?)div\b", re.IGNORECASE)
+
+_wishlist_name_pattern = re.compile(r"<h1\s[^>]*class=\"[^\"]*\bgh_listtitle\b[^\"]*\"[^>]*>(.*?)</h1>", re.DOTALL)
+_wishlist_price_area_pattern = re.compile(r"<div\s[^>]*class=\"[^\"]*\bwishlist_sum_area\b")
+_wishlist_price_pattern = re.compile(r"<span class=\"gh_price\">\s*([^<\s][^<]*)</span>")
+
+_product_name_area_pattern = re.compile(r"<div\s[^>]*id=\"gh_artbox\"")
+_product_name_pattern = re.compile(r"<span\s[^>]*itemprop=[\"']name[\"'][^>]*>(.*?)</span>", re.DOTALL)
+_product_headline_pattern = re.compile(r"<(\w+)\s[^>]*id=\"productpage__headline\"[^>]*>(.*?)</\1>", re.DOTALL)
+_product_price_area_pattern = re.compile(r"<div\s[^>]*id=\"offer__price-0\"")
+_product_price_pattern = re.compile(r"<span class=\"gh_price\">([^<]*)</span>")
+
+
+def _clean_text(fragment):
+    """Strips the tags of a html fragment and normalizes its whitespace like PyQuery's text() does"""
+    text = html.unescape(_tag_pattern.sub(" ", fragment))
+    return " ".join(text.split())
+
+
+def _search_in_div(area_pattern, pattern, html_str):
+    """Searches the pattern only inside the div matched by the area pattern"""
+    area = area_pattern.search(html_str)
+    if area is None:
+        return None
+
+    # The div ends at the closing tag which brings the nesting depth back to zero
+    end = len(html_str)
+    depth = 1
+    for tag in _div_tag_pattern.finditer(html_str, area.end()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            end = tag.start()
+            break
+
+    return pattern.search(html_str, area.end(), end)
+
+
+def extract_name(html_str, entity_type):
+    """Returns the name of an entity or None if it can't be found"""
+    if entity_type == EntityType.WISHLIST:
+        match = _wishlist_name_pattern.search(html_str)
+        name = _clean_text(match.group(1)) if match else ""
+    elif entity_type == EntityType.PRODUCT:
+        match = _search_in_div(_product_name_area_pattern, _product_name_pattern, html_str)
+        name = _clean_text(match.group(1)) if match else ""
+
+        if name == "":
+            match = _product_headline_pattern.search(html_str)
+            name = _clean_text(match.group(2)) if match else ""
+    else:
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+    return name or None
+
+
+def extract_price(html_str, entity_type):
+    """Returns the price string (e.g. '199.65') of an entity or None if it can't be found"""
+    if entity_type == EntityType.WISHLIST:
+        match = _search_in_div(_wishlist_price_area_pattern, _wishlist_price_pattern, html_str)
+    elif entity_type == EntityType.PRODUCT:
+        match = _search_in_div(_product_price_area_pattern, _product_price_pattern, html_str)
+    else:
+        raise ValueError("The given type {} is unknown!".format(entity_type))
+
+    if match is None:
+        return None
+
+    price = _clean_text(match.group(1))
+    price = price[2:]  # Cut off the '€ ' before the real price
+    price = price.replace(',', '.')
+    return price or None
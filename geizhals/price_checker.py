@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+from geizhals.core import ExtractionStatus
+
+logger = logging.getLogger(__name__)
+
+
+class PriceChecker(object):
+    """Fetches and parses the current price and name of many entities in parallel"""
+
+    def __init__(self, max_workers=8, max_requests_per_domain=4, max_in_flight=None):
+        self.max_workers = max_workers
+        self.max_requests_per_domain = max_requests_per_domain
+        # Max. number of pages which are downloaded or parsed at the same time - bounds the memory used by pages
+        self.max_in_flight = max_in_flight or 2 * max_workers
+        # Highest number of pages which were in flight at the same time during the last check
+        self.peak_in_flight = 0
+        self._domain_semaphores = {}
+        self._domain_semaphores_lock = threading.Lock()
+
+    def _get_domain_semaphore(self, url):
+        """Returns the semaphore limiting the concurrent requests to the domain of the given url"""
+        domain = urlparse(url).netloc
+
+        with self._domain_semaphores_lock:
+            semaphore = self._domain_semaphores.get(domain)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_requests_per_domain)
+                self._domain_semaphores[domain] = semaphore
+
+        return semaphore
+
+    def _check_entity(self, entity):
+        """Downloads and parses the page of an entity and returns its current data"""
+        with self._get_domain_semaphore(entity.url):
+            logger.debug("URL is '{}'".format(entity.url))
+            data = entity.get_current_data()
+
+        if data.status != ExtractionStatus.OK:
+            raise ValueError("Couldn't parse entity '{}': {}".format(entity.url, data.status.name))
+
+        return data
+
+    def check(self, entities):
+        """
+        Checks the given entities concurrently and yields (entity, future) tuples as soon as a check finishes.
+        Calling future.result() either returns the EntityData or raises the exception of the check.
+        The entities are consumed lazily and at most max_in_flight checks are submitted at the same time.
+        """
+        entities = iter(entities)
+        in_flight = {}
+        self.peak_in_flight = 0
+        checked = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # Fill the window of in-flight checks
+                for entity in entities:
+                    in_flight[executor.submit(self._check_entity, entity)] = entity
+                    if len(in_flight) >= self.max_in_flight:
+                        break
+
+                self.peak_in_flight = max(self.peak_in_flight, len(in_flight))
+
+                if len(in_flight) == 0:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    checked += 1
+                    yield in_flight.pop(future), future
+
+        logger.info("Checked {} entities with {} workers - max. {} pages in flight".format(
+            checked, self.max_workers, self.peak_in_flight))
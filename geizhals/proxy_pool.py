@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyStats(object):
+    """Health statistics of a single proxy"""
+    # Latency assumed for proxies which were not used yet
+    DEFAULT_LATENCY = 1.0
+    # Weight of new latency measurements in the moving average
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.quarantine_count = 0
+        self.quarantined_until = 0
+
+    @property
+    def success_rate(self):
+        """Success rate of the proxy - smoothed so that new proxies start at 50 %"""
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def health(self):
+        """Score used as weight when choosing a proxy - higher is better"""
+        latency = self.latency if self.latency is not None else self.DEFAULT_LATENCY
+        return self.success_rate / max(latency, 0.05)
+
+    def add_latency(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = (1 - self.LATENCY_SMOOTHING) * self.latency + self.LATENCY_SMOOTHING * latency
+
+    def to_dict(self, now):
+        return {"successes": self.successes,
+                "failures": self.failures,
+                "rate_limited": self.rate_limited,
+                "success_rate": self.success_rate,
+                "latency": self.latency,
+                "health": self.health,
+                "quarantined": self.quarantined_until > now,
+                "quarantine_remaining": max(0, self.quarantined_until - now)}
+
+
+class ProxyPool(object):
+    """Pool of proxies which chooses proxies weighted by their health and quarantines failing proxies"""
+
+    def __init__(self, proxies, failure_threshold=3, base_cooldown=30, max_cooldown=3600, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats = {}
+
+        for proxy in proxies:
+            self._stats[proxy] = ProxyStats(proxy)
+
+    def get_proxy(self):
+        """Returns a proxy chosen randomly weighted by health. Quarantined proxies are only used if there is no other"""
+        with self._lock:
+            if len(self._stats) == 0:
+                logger.error("Proxy pool is empty. Returning None!")
+                return None
+
+            now = self._clock()
+            available = [stats for stats in self._stats.values() if stats.quarantined_until <= now]
+
+            if len(available) == 0:
+                stats = min(self._stats.values(), key=lambda s: s.quarantined_until)
+                logger.warning("All proxies are quarantined, using '{}' which is released first!".format(stats.proxy))
+                return stats.proxy
+
+            weights = [stats.health for stats in available]
+            choice = random.uniform(0, sum(weights))
+
+            cumulative = 0
+            for stats, weight in zip(available, weights):
+                cumulative += weight
+                if choice <= cumulative:
+                    return stats.proxy
+
+            return available[-1].proxy
+
+    def report_success(self, proxy, latency):
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            stats.quarantine_count = 0
+            stats.add_latency(latency)
+
+    def report_failure(self, proxy):
+        """Report that a proxy could not be used because of an error. Returns True if the proxy got quarantined"""
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return False
+
+            stats.failures += 1
+            return self._register_failure(stats)
+
+    def report_rate_limited(self, proxy):
+        """Report that Geizhals blocked a request sent via the proxy. Returns True if the proxy got quarantined"""
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return False
+
+            stats.failures += 1
+            stats.rate_limited += 1
+            return self._register_failure(stats)
+
+    def _register_failure(self, stats):
+        """Quarantine a proxy with an exponentially growing cooldown after too many consecutive failures"""
+        stats.consecutive_failures += 1
+        if stats.consecutive_failures < self.failure_threshold:
+            return False
+
+        cooldown = min(self.base_cooldown * (2 ** stats.quarantine_count), self.max_cooldown)
+        stats.quarantined_until = self._clock() + cooldown
+        stats.quarantine_count += 1
+        stats.consecutive_failures = 0
+        logger.warning("Quarantining proxy '{}' for {} seconds!".format(stats.proxy, cooldown))
+        return True
+
+    def get_stats(self):
+        """Returns the health statistics of all proxies as dict"""
+        with self._lock:
+            now = self._clock()
+            return {proxy: stats.to_dict(now) for proxy, stats in self._stats.items()}
+
+    def __len__(self):
+        return len(self._stats)
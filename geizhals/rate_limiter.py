@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from .util import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value, now=None):
+    """Parses the value of a Retry-After header (seconds or http date) and returns the seconds to wait or None"""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logger.warning("Could not parse Retry-After header '{}'".format(value))
+        return None
+
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+
+    now = now or datetime.now(timezone.utc)
+    return max(0, (retry_date - now).total_seconds())
+
+
+class HostRateLimiter(object):
+    """
+    Adaptive token bucket per host. The rate gets reduced multiplicatively when a host answers with HTTP 429
+    and increases additively with every successful request.
+    """
+
+    def __init__(self, rate=5.0, min_rate=0.2, max_rate=20.0, increase=0.05, decrease_factor=0.5,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _get_bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.initial_rate, clock=self._clock, sleep=self._sleep)
+                self._buckets[host] = bucket
+
+            return bucket
+
+    def acquire(self, host):
+        """Blocks until a request to the given host may be sent"""
+        self._get_bucket(host).acquire()
+
+    def on_success(self, host):
+        bucket = self._get_bucket(host)
+        if bucket.rate < self.max_rate:
+            bucket.set_rate(min(self.max_rate, bucket.rate + self.increase))
+
+    def on_rate_limited(self, host, retry_after=None):
+        """Slows down the requests to a host after it blocked us and pauses them if it sent a Retry-After header"""
+        bucket = self._get_bucket(host)
+        new_rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+        bucket.set_rate(new_rate)
+        logger.warning("Reduced request rate for '{}' to {:.2f} requests/s".format(host, new_rate))
+
+        if retry_after:
+            logger.warning("Pausing requests to '{}' for {} seconds (Retry-After)".format(host, retry_after))
+            bucket.pause(retry_after)
+
+    def get_rates(self):
+        """Returns the current request rates (requests per second) of all hosts"""
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool(object):
+    """Keeps one keep-alive session (with its own connection pool) per (proxy, host) pair"""
+
+    def __init__(self, pool_size=10, max_sessions=None):
+        self.pool_size = pool_size
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create_session(self, proxy):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        if proxy is not None:
+            session.proxies = dict(http=proxy, https=proxy)
+
+        return session
+
+    def get_session(self, proxy, host):
+        """Returns the session for a (proxy, host) pair and creates a new one if there is none yet"""
+        key = (proxy, host)
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+
+            logger.debug("Creating new session for proxy '{}' and host '{}'".format(proxy, host))
+            session = self._create_session(proxy)
+            self._sessions[key] = session
+
+            # Close the least recently used sessions if there are too many open
+            while self.max_sessions is not None and len(self._sessions) > self.max_sessions:
+                _, old_session = self._sessions.popitem(last=False)
+                old_session.close()
+
+        return session
+
+    def close_proxy(self, proxy):
+        """Close all the sessions which use the given proxy"""
+        with self._lock:
+            keys = [key for key in self._sessions if key[0] == proxy]
+            for key in keys:
+                self._sessions.pop(key).close()
+
+        if keys:
+            logger.debug("Closed {} session(s) of proxy '{}'".format(len(keys), proxy))
+
+    def close_all(self):
+        """Close all the sessions in the pool"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
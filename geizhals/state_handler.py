@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import logging
-import random
+import threading
+from contextlib import contextmanager
 
-from .util import Ringbuffer
+from .proxy_pool import ProxyPool
+from .rate_limiter import HostRateLimiter
+from .session_pool import SessionPool
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +19,23 @@ class GeizhalsStateHandler(object):
             cls._instance = super(GeizhalsStateHandler, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, use_proxies=False, proxies=None):
+    def __init__(self, use_proxies=False, proxies=None, max_requests_per_proxy=None, pool_size=10, streaming=False,
+                 extractor="pyquery", requests_per_second=5.0, max_requests_per_second=20.0):
         # Make sure that the object does not get overwritten each time the constructor get's called
         if GeizhalsStateHandler._initialized:
             return
 
         self.use_proxies = use_proxies
+        self.streaming = streaming
+        self.extractor = extractor
+        self.max_requests_per_proxy = max_requests_per_proxy
+        self._proxy_semaphores = {}
+        self._proxy_semaphores_lock = threading.Lock()
+        self.session_pool = SessionPool(pool_size=pool_size)
+        self.rate_limiter = HostRateLimiter(rate=requests_per_second, max_rate=max_requests_per_second)
 
         if use_proxies:
-            # Randomize order of proxies in the list
-            random.shuffle(proxies)
-            self.proxies = Ringbuffer(proxies)
+            self.proxies = ProxyPool(proxies)
 
             self.selected_proxy = self.get_next_proxy()
 
@@ -38,9 +47,56 @@ class GeizhalsStateHandler(object):
         if self.use_proxies and self.proxies is not None:
             if len(self.proxies) <= 1:
                 logger.warning("Less than two proxies configured, using the same proxy again!")
-            proxy = self.proxies.next()
+            proxy = self.proxies.get_proxy()
             logger.debug("Selected '{}' as new proxy".format(proxy))
             return proxy
         else:
             logger.warning("No proxies configured!")
             return None
+
+    def report_success(self, proxy, latency):
+        """Report a successful request via a proxy and its latency in seconds"""
+        if self.use_proxies:
+            self.proxies.report_success(proxy, latency)
+
+    def report_failure(self, proxy):
+        """Report a failed connection via a proxy - quarantined proxies are rotated out"""
+        if self.use_proxies and self.proxies.report_failure(proxy):
+            self.retire_proxy(proxy)
+
+    def report_rate_limited(self, proxy):
+        """Report a request via a proxy which got blocked by Geizhals (HTTP 429)"""
+        if self.use_proxies and self.proxies.report_rate_limited(proxy):
+            self.retire_proxy(proxy)
+
+    def get_proxy_stats(self):
+        """Returns the health statistics of all the configured proxies"""
+        if self.use_proxies:
+            return self.proxies.get_stats()
+
+        return {}
+
+    def get_session(self, proxy, host):
+        """Returns the pooled keep-alive session for requests to a host via the given proxy"""
+        return self.session_pool.get_session(proxy, host)
+
+    def retire_proxy(self, proxy):
+        """Tear down the pooled connections of a proxy which was rotated out because of an error"""
+        logger.info("Closing pooled connections of proxy '{}'".format(proxy))
+        self.session_pool.close_proxy(proxy)
+
+    @contextmanager
+    def proxy_slot(self, proxy):
+        """Context manager which limits the number of concurrent requests sent through a single proxy"""
+        if not self.max_requests_per_proxy:
+            yield
+            return
+
+        with self._proxy_semaphores_lock:
+            semaphore = self._proxy_semaphores.get(proxy)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_requests_per_proxy)
+                self._proxy_semaphores[proxy] = semaphore
+
+        with semaphore:
+            yield
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import html
 import os
 import re
 import unittest
@@ -62,3 +63,55 @@ class GeizhalsCoreTest(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             geizhals.core.parse_entity_name("Test", None)
+
+    def test_extract_entity_data(self):
+        """Test to check if name and price of entities are extracted in a single pass"""
+        data = geizhals.core.extract_entity_data(self.html_wl, EntityType.WISHLIST)
+        self.assertEqual("NAS", data.name)
+        self.assertEqual(717.81, data.price)
+        self.assertEqual(geizhals.core.ExtractionStatus.OK, data.status)
+
+        data = geizhals.core.extract_entity_data(self.html_p, EntityType.PRODUCT)
+        self.assertEqual("Samsung SSD 860 EVO 1TB, SATA (MZ-76E1T0B)", data.name)
+        self.assertEqual(199.65, data.price)
+        self.assertEqual(geizhals.core.ExtractionStatus.OK, data.status)
+
+        data = geizhals.core.extract_entity_data("<html><h1 class='gh_listtitle'>Test</h1></html>", EntityType.WISHLIST)
+        self.assertEqual("Test", data.name)
+        self.assertIsNone(data.price)
+        self.assertEqual(geizhals.core.ExtractionStatus.PRICE_MISSING, data.status)
+
+        data = geizhals.core.extract_entity_data("Test", EntityType.PRODUCT)
+        self.assertEqual(geizhals.core.ExtractionStatus.NAME_MISSING, data.status)
+
+        with self.assertRaises(ValueError):
+            geizhals.core.extract_entity_data("Test", None)
+
+    def test_parse_price_value(self):
+        """Test to check if price strings are converted to floats"""
+        self.assertEqual(199.65, geizhals.core.parse_price_value("199.65"))
+        self.assertEqual(199.0, geizhals.core.parse_price_value("199.--"))
+
+        with self.assertRaises(ValueError):
+            geizhals.core.parse_price_value("")
+
+    def test_read_until_markers(self):
+        """Test to check if reading a page stops as soon as the parts needed for the extraction were received"""
+        for html_str, entity_type in ((self.html_wl, EntityType.WISHLIST), (self.html_p, EntityType.PRODUCT)):
+            raw = html_str.encode("utf-8")
+            chunks = [raw[i:i + 1000] for i in range(0, len(raw), 1000)]
+
+            text, truncated = geizhals.core.read_until_markers(iter(chunks), geizhals.core.STREAM_END_MARKERS[entity_type])
+            self.assertTrue(truncated)
+            self.assertLess(len(text), len(html_str))
+
+            partial_data = geizhals.core.extract_entity_data(html.unescape(text), entity_type)
+            full_data = geizhals.core.extract_entity_data(html_str, entity_type)
+            self.assertEqual(full_data, partial_data)
+
+        # If the markers are missing, the whole page is read
+        raw = "<html>Test äöü</html>".encode("utf-8")
+        chunks = [raw[i:i + 3] for i in range(0, len(raw), 3)]
+        text, truncated = geizhals.core.read_until_markers(iter(chunks), geizhals.core.STREAM_END_MARKERS[EntityType.PRODUCT])
+        self.assertFalse(truncated)
+        self.assertEqual("<html>Test äöü</html>", text)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark comparing the PyQuery and the regex extractor on the test pages.
+Run it from the root directory of the project: python -m geizhals.tests.extractor_benchmark
+"""
+import os
+import timeit
+
+import geizhals.core
+from geizhals.entities import EntityType
+
+dir_path = os.path.dirname(os.path.abspath(__file__))
+pages = [("test_wishlist.html", EntityType.WISHLIST), ("test_product.html", EntityType.PRODUCT)]
+runs = 50
+
+
+def main():
+    for file_name, entity_type in pages:
+        with open(os.path.join(dir_path, file_name), "r", encoding='utf8') as f:
+            html_str = f.read()
+
+        print("{} ({} KiB, {} runs)".format(file_name, len(html_str) // 1024, runs))
+        for extractor in (geizhals.core.EXTRACTOR_PYQUERY, geizhals.core.EXTRACTOR_REGEX):
+            duration = timeit.timeit(lambda: geizhals.core.extract_entity_data(html_str, entity_type, extractor=extractor), number=runs)
+            print("  {:8} {:8.3f} ms per page".format(extractor, duration / runs * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import html
+import os
+import unittest
+
+import geizhals.core
+from geizhals import fast_extractor
+from geizhals.entities import EntityType
+
+
+class FastExtractorTest(unittest.TestCase):
+    """Makes sure that the regex extractor returns the same results as the PyQuery extractor"""
+    dir_path = os.path.dirname(os.path.abspath(__file__))
+    test_wl_file_path = os.path.join(dir_path, "test_wishlist.html")
+    test_p_file_path = os.path.join(dir_path, "test_product.html")
+
+    def setUp(self):
+        with open(self.test_wl_file_path, "r", encoding='utf8') as f:
+            self.html_wl = f.read()
+
+        with open(self.test_p_file_path, "r", encoding='utf8') as f:
+            self.html_p = f.read()
+
+        self.pages = [(self.html_wl, EntityType.WISHLIST), (self.html_p, EntityType.PRODUCT)]
+
+    def test_extract_name_parity(self):
+        """Test to check if the names match the ones parsed by PyQuery"""
+        for html_str, entity_type in self.pages:
+            self.assertEqual(geizhals.core.parse_entity_name(html_str, entity_type),
+                             fast_extractor.extract_name(html_str, entity_type))
+
+    def test_extract_price_parity(self):
+        """Test to check if the prices match the ones parsed by PyQuery"""
+        for html_str, entity_type in self.pages:
+            self.assertEqual(geizhals.core.parse_entity_price(html_str, entity_type),
+                             fast_extractor.extract_price(html_str, entity_type))
+
+    def test_extract_entity_data_parity(self):
+        """Test to check if both extractors return the same data - also for unescaped pages as send_request returns them"""
+        for html_str, entity_type in self.pages:
+            for page in (html_str, html.unescape(html_str)):
+                regex_data = geizhals.core.extract_entity_data(page, entity_type, extractor=geizhals.core.EXTRACTOR_REGEX)
+                pyquery_data = geizhals.core.extract_entity_data(page, entity_type, extractor=geizhals.core.EXTRACTOR_PYQUERY)
+                self.assertEqual(pyquery_data, regex_data)
+
+    def test_product_artbox_name(self):
+        """Test to check if the product name is taken from the artbox if present"""
+        page = "<div id=\"gh_artbox\"><h1><span itemprop=\"name\">Test &amp; Product</span></h1></div>"
+        self.assertEqual("Test & Product", fast_extractor.extract_name(page, EntityType.PRODUCT))
+        self.assertEqual(geizhals.core.parse_entity_name(page, EntityType.PRODUCT),
+                         fast_extractor.extract_name(page, EntityType.PRODUCT))
+
+    def test_product_name_outside_artbox(self):
+        """Test to check if names outside of the artbox are ignored and the headline is used like PyQuery does"""
+        page = "<div id=\"gh_artbox\"><div class=\"gallery\"></div><h1>Artbox</h1></div>" \
+               "<h1 id=\"productpage__headline\">Headline Product</h1>" \
+               "<div class=\"offer\"><span itemprop=\"name\">Offer Name</span></div>"
+        self.assertEqual("Headline Product", fast_extractor.extract_name(page, EntityType.PRODUCT))
+        self.assertEqual(geizhals.core.parse_entity_name(page, EntityType.PRODUCT),
+                         fast_extractor.extract_name(page, EntityType.PRODUCT))
+
+    def test_price_outside_price_area(self):
+        """Test to check if prices after a price area without price are ignored like PyQuery does"""
+        pages = [("<h1 id=\"productpage__headline\">Product</h1><div id=\"offer__price-0\"><span>n/a</span></div>"
+                  "<div class=\"other\"><span class=\"gh_price\">€ 9,99</span></div>", EntityType.PRODUCT),
+                 ("<h1 class=\"gh_listtitle\">Wishlist</h1><div class=\"wishlist_sum_area\"><span>n/a</span></div>"
+                  "<div class=\"other\"><span class=\"gh_price\">€ 9,99</span></div>", EntityType.WISHLIST)]
+
+        for page, entity_type in pages:
+            self.assertIsNone(fast_extractor.extract_price(page, entity_type))
+            regex_data = geizhals.core.extract_entity_data(page, entity_type, extractor=geizhals.core.EXTRACTOR_REGEX)
+            pyquery_data = geizhals.core.extract_entity_data(page, entity_type, extractor=geizhals.core.EXTRACTOR_PYQUERY)
+            self.assertEqual(geizhals.core.ExtractionStatus.PRICE_MISSING, regex_data.status)
+            self.assertEqual(pyquery_data, regex_data)
+
+    def test_no_match(self):
+        """Test to check if missing fragments lead to None and the PyQuery fallback is used"""
+        self.assertIsNone(fast_extractor.extract_name("Test", EntityType.WISHLIST))
+        self.assertIsNone(fast_extractor.extract_price("Test", EntityType.PRODUCT))
+
+        # The regex extractor can't handle the single quotes, PyQuery does
+        page = "<h1 class='gh_listtitle'>Test</h1><div class='wishlist_sum_area'><span class='gh_price'>" \
+               "<span class='gh_price'><span class='gh_price'>€ 12,34</span></span></span></div>"
+        self.assertIsNone(fast_extractor.extract_price(page, EntityType.WISHLIST))
+        data = geizhals.core.extract_entity_data(page, EntityType.WISHLIST, extractor=geizhals.core.EXTRACTOR_REGEX)
+        self.assertEqual("Test", data.name)
+        self.assertEqual(12.34, data.price)
+        self.assertEqual(geizhals.core.ExtractionStatus.OK, data.status)
+
+        with self.assertRaises(ValueError):
+            fast_extractor.extract_name("Test", None)
+
+        with self.assertRaises(ValueError):
+            geizhals.core.extract_entity_data("Test", EntityType.PRODUCT, extractor="unknown")
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from geizhals.core import EntityData, ExtractionStatus
+from geizhals.price_checker import PriceChecker
+
+
+class DummyEntity(object):
+    """Entity replacement which keeps track of the number of concurrent checks"""
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def __init__(self, url, price, name="Dummy", fail=False):
+        self.url = url
+        self.price = price
+        self.name = name
+        self.fail = fail
+
+    def get_current_data(self):
+        with DummyEntity.lock:
+            DummyEntity.running += 1
+            DummyEntity.max_running = max(DummyEntity.max_running, DummyEntity.running)
+
+        time.sleep(0.05)
+
+        with DummyEntity.lock:
+            DummyEntity.running -= 1
+
+        if self.fail:
+            return EntityData(name=self.name, price=None, status=ExtractionStatus.PRICE_MISSING)
+
+        return EntityData(name=self.name, price=self.price, status=ExtractionStatus.OK)
+
+
+class PriceCheckerTest(unittest.TestCase):
+
+    def setUp(self):
+        DummyEntity.running = 0
+        DummyEntity.max_running = 0
+
+    def test_check(self):
+        """Test to check if all entities are checked and their results are returned"""
+        entities = [DummyEntity("https://geizhals.de/a{}.html".format(i), i) for i in range(10)]
+        checker = PriceChecker(max_workers=4, max_requests_per_domain=4)
+
+        results = {}
+        for entity, future in checker.check(entities):
+            data = future.result()
+            results[entity.url] = (data.price, data.name)
+
+        self.assertEqual(len(entities), len(results))
+        for entity in entities:
+            self.assertEqual((entity.price, entity.name), results[entity.url])
+
+        self.assertGreater(DummyEntity.max_running, 1, msg="Entities were not checked concurrently!")
+        self.assertLessEqual(DummyEntity.max_running, 4)
+
+    def test_check_exception(self):
+        """Test to check if failed extractions are raised when accessing the result"""
+        entities = [DummyEntity("https://geizhals.de/a1.html", 1, fail=True)]
+        checker = PriceChecker(max_workers=2)
+
+        for entity, future in checker.check(entities):
+            with self.assertRaises(ValueError):
+                future.result()
+
+    def test_max_requests_per_domain(self):
+        """Test to check if the number of concurrent requests per domain is limited"""
+        entities = [DummyEntity("https://geizhals.de/a{}.html".format(i), i) for i in range(6)]
+        checker = PriceChecker(max_workers=6, max_requests_per_domain=2)
+
+        for entity, future in checker.check(entities):
+            future.result()
+
+        self.assertEqual(2, DummyEntity.max_running)
+
+        # Requests to different domains are limited independently
+        DummyEntity.max_running = 0
+        entities = [DummyEntity("https://geizhals.{}/a{}.html".format(tld, i), i) for tld in ("de", "at") for i in range(3)]
+        checker = PriceChecker(max_workers=6, max_requests_per_domain=1)
+
+        for entity, future in checker.check(entities):
+            future.result()
+
+        self.assertEqual(2, DummyEntity.max_running)
+
+    def test_max_in_flight(self):
+        """Test to check if only a limited number of entities is consumed and checked at the same time"""
+        consumed = []
+
+        def generate():
+            for i in range(20):
+                consumed.append(i)
+                yield DummyEntity("https://geizhals.de/a{}.html".format(i), i)
+
+        checker = PriceChecker(max_workers=8, max_requests_per_domain=8, max_in_flight=3)
+        results = []
+        for entity, future in checker.check(generate()):
+            # The generator is only consumed as far as the window of in-flight checks reaches
+            self.assertLessEqual(len(consumed), len(results) + 3 + 1)
+            results.append(future.result().price)
+
+        self.assertEqual(list(range(20)), sorted(results))
+        self.assertEqual(3, checker.peak_in_flight)
+        self.assertLessEqual(DummyEntity.max_running, 3)
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+from unittest import mock
 
+from geizhals.core import EntityData, ExtractionStatus
 from geizhals.exceptions import InvalidWishlistURLException
-from geizhals.entities import Product
+from geizhals.entities import EntityType, Product
 
 
 class ProductTest(unittest.TestCase):
@@ -37,3 +39,33 @@ class ProductTest(unittest.TestCase):
         # Make sure that wrong urls lead to exceptions
         with self.assertRaises(InvalidWishlistURLException):
             failed_p = Product.from_url("http://example.com")
+
+    def test_canonical_url(self):
+        """Test to check if product urls are normalized"""
+        self.assertEqual(self.p.url, Product.canonical_url(self.p.url))
+        self.assertEqual(self.p.url, Product.canonical_url(" " + self.p.url + "?hloc=at&hloc=de#offers"))
+        self.assertEqual("https://geizhals.at/a1756905.html", Product.canonical_url("https://geizhals.at/a1756905.html?v=l"))
+        self.assertEqual("http://example.com", Product.canonical_url("http://example.com"))
+
+    def test_id(self):
+        """Test to check if the id of a product is its entity id"""
+        self.assertEqual(self.p.entity_id, self.p.id)
+
+    def test_slots(self):
+        """Test to check if products don't carry a per-instance __dict__"""
+        self.assertFalse(hasattr(self.p, "__dict__"))
+
+        with self.assertRaises(AttributeError):
+            self.p.foo = "bar"
+
+    def test_release_html(self):
+        """Test to check if the html of a page is released as soon as it was parsed"""
+        data = EntityData(name="Samsung", price=195.85, status=ExtractionStatus.OK)
+        self.p._Entity__html = "<html></html>"
+
+        with mock.patch("geizhals.core.extract_entity_data", return_value=data) as extract:
+            self.assertEqual(data, self.p.get_current_data())
+            self.assertEqual(data, self.p.get_current_data())
+
+        extract.assert_called_once_with("<html></html>", EntityType.PRODUCT)
+        self.assertIsNone(self.p._Entity__html)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from geizhals.proxy_pool import ProxyPool
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProxyPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.proxies = ['http://a.net', 'http://b.net', 'http://c.net']
+        self.pool = ProxyPool(self.proxies, failure_threshold=2, base_cooldown=10, max_cooldown=25, clock=self.clock)
+
+    def test_get_proxy_weighted(self):
+        """Test to check if healthy proxies are chosen more often"""
+        for _ in range(20):
+            self.pool.report_success('http://a.net', 0.1)
+            self.pool.report_success('http://b.net', 2.0)
+            self.pool.report_success('http://c.net', 2.0)
+
+        counts = {proxy: 0 for proxy in self.proxies}
+        for _ in range(1000):
+            counts[self.pool.get_proxy()] += 1
+
+        self.assertGreater(counts['http://a.net'], counts['http://b.net'] + counts['http://c.net'])
+        self.assertGreater(counts['http://b.net'], 0)
+
+    def test_quarantine(self):
+        """Test to check if failing proxies are quarantined with an exponential cooldown"""
+        self.assertFalse(self.pool.report_failure('http://a.net'))
+        self.assertTrue(self.pool.report_failure('http://a.net'))
+
+        for _ in range(100):
+            self.assertNotEqual('http://a.net', self.pool.get_proxy())
+
+        self.assertEqual(10, self.pool.get_stats()['http://a.net']['quarantine_remaining'])
+
+        # After the cooldown the proxy is used again - the next quarantine takes twice as long
+        self.clock.now += 10
+        self.assertFalse(self.pool.get_stats()['http://a.net']['quarantined'])
+        self.pool.report_rate_limited('http://a.net')
+        self.pool.report_rate_limited('http://a.net')
+        self.assertEqual(20, self.pool.get_stats()['http://a.net']['quarantine_remaining'])
+
+        # The cooldown is capped
+        self.clock.now += 20
+        self.pool.report_failure('http://a.net')
+        self.pool.report_failure('http://a.net')
+        self.assertEqual(25, self.pool.get_stats()['http://a.net']['quarantine_remaining'])
+
+        # A success resets the cooldown
+        self.clock.now += 25
+        self.pool.report_success('http://a.net', 0.5)
+        self.pool.report_failure('http://a.net')
+        self.pool.report_failure('http://a.net')
+        self.assertEqual(10, self.pool.get_stats()['http://a.net']['quarantine_remaining'])
+
+    def test_all_quarantined(self):
+        """Test to check if the proxy released first is used if all proxies are quarantined"""
+        for proxy in self.proxies:
+            self.pool.report_failure(proxy)
+            self.pool.report_failure(proxy)
+            self.clock.now += 1
+
+        self.assertEqual('http://a.net', self.pool.get_proxy())
+
+    def test_get_stats(self):
+        """Test to check if the statistics of the proxies are tracked"""
+        self.pool.report_success('http://a.net', 1.0)
+        self.pool.report_success('http://a.net', 2.0)
+        self.pool.report_rate_limited('http://a.net')
+        self.pool.report_success('http://unknown.net', 1.0)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(3, len(stats))
+        self.assertEqual(2, stats['http://a.net']['successes'])
+        self.assertEqual(1, stats['http://a.net']['failures'])
+        self.assertEqual(1, stats['http://a.net']['rate_limited'])
+        self.assertAlmostEqual(1.3, stats['http://a.net']['latency'])
+        self.assertAlmostEqual(0.6, stats['http://a.net']['success_rate'])
+        self.assertIsNone(stats['http://b.net']['latency'])
+
+        self.assertIsNone(ProxyPool([]).get_proxy())
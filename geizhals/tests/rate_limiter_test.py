@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime, timezone
+
+from geizhals.rate_limiter import HostRateLimiter, parse_retry_after
+
+
+class FakeClock(object):
+    """Clock which only advances when sleep is called"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class HostRateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = HostRateLimiter(rate=4, min_rate=1, max_rate=5, increase=0.5, decrease_factor=0.5,
+                                       clock=self.clock, sleep=self.clock.sleep)
+
+    def test_adaptive_rate(self):
+        """Test to check if the rate decreases after 429s and slowly increases after successes"""
+        self.limiter.on_rate_limited("geizhals.de")
+        self.assertEqual(2, self.limiter.get_rates()["geizhals.de"])
+
+        self.limiter.on_rate_limited("geizhals.de")
+        self.limiter.on_rate_limited("geizhals.de")
+        self.assertEqual(1, self.limiter.get_rates()["geizhals.de"])
+
+        for _ in range(3):
+            self.limiter.on_success("geizhals.de")
+        self.assertEqual(2.5, self.limiter.get_rates()["geizhals.de"])
+
+        for _ in range(10):
+            self.limiter.on_success("geizhals.de")
+        self.assertEqual(5, self.limiter.get_rates()["geizhals.de"])
+
+        # Other hosts are not affected
+        self.limiter.acquire("geizhals.at")
+        self.assertEqual(4, self.limiter.get_rates()["geizhals.at"])
+
+    def test_retry_after(self):
+        """Test to check if requests are paused as long as the Retry-After header says"""
+        self.limiter.acquire("geizhals.de")
+        self.assertEqual(0, self.clock.slept)
+
+        self.limiter.on_rate_limited("geizhals.de", retry_after=30)
+        self.limiter.acquire("geizhals.de")
+        self.assertGreaterEqual(self.clock.slept, 30)
+        self.assertLess(self.clock.slept, 31)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120, parse_retry_after("120"))
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+        now = datetime(2015, 10, 21, 7, 27, 0, tzinfo=timezone.utc)
+        self.assertEqual(60, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=now))
+        self.assertEqual(0, parse_retry_after("Wed, 21 Oct 2015 07:20:00 GMT", now=now))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from geizhals.session_pool import SessionPool
+
+
+class SessionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = SessionPool(pool_size=5)
+
+    def tearDown(self):
+        self.pool.close_all()
+
+    def test_get_session(self):
+        """Test to check if sessions are reused per (proxy, host) pair"""
+        s1 = self.pool.get_session("http://proxy.net", "geizhals.de")
+        s2 = self.pool.get_session("http://proxy.net", "geizhals.de")
+        self.assertIs(s1, s2)
+        self.assertEqual({"http": "http://proxy.net", "https": "http://proxy.net"}, s1.proxies)
+
+        s3 = self.pool.get_session("http://proxy.net", "geizhals.at")
+        s4 = self.pool.get_session(None, "geizhals.de")
+        self.assertIsNot(s1, s3)
+        self.assertIsNot(s1, s4)
+        self.assertEqual(3, len(self.pool))
+
+        adapter = s1.get_adapter("https://geizhals.de")
+        self.assertEqual(5, adapter._pool_maxsize)
+
+    def test_close_proxy(self):
+        """Test to check if all sessions of a proxy get closed"""
+        s1 = self.pool.get_session("http://proxy.net", "geizhals.de")
+        self.pool.get_session("http://proxy.net", "geizhals.at")
+        self.pool.get_session("http://other.net", "geizhals.de")
+
+        self.pool.close_proxy("http://proxy.net")
+        self.assertEqual(1, len(self.pool))
+
+        # A new session gets created after the old one got closed
+        self.assertIsNot(s1, self.pool.get_session("http://proxy.net", "geizhals.de"))
+
+    def test_max_sessions(self):
+        """Test to check if the least recently used sessions are closed when the limit is reached"""
+        pool = SessionPool(max_sessions=2)
+        s1 = pool.get_session("http://a.net", "geizhals.de")
+        pool.get_session("http://b.net", "geizhals.de")
+        pool.get_session("http://a.net", "geizhals.de")
+        pool.get_session("http://c.net", "geizhals.de")
+
+        self.assertEqual(2, len(pool))
+        self.assertIs(s1, pool.get_session("http://a.net", "geizhals.de"))
+        pool.close_all()
+        self.assertEqual(0, len(pool))
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import threading
+import time
 import unittest
 
 from geizhals.state_handler import GeizhalsStateHandler
@@ -33,27 +35,63 @@ class GeizhalsStateHandlerTest(unittest.TestCase):
 
         self.assertEqual(len(self.sh.proxies), len(proxies))
 
-        p1 = self.sh.get_next_proxy()
-        i1 = proxies.index(p1)
+        # Proxies are chosen weighted by their health, so every healthy proxy gets used eventually
+        used_proxies = set()
+        for _ in range(200):
+            proxy = self.sh.get_next_proxy()
+            self.assertIn(proxy, proxies)
+            used_proxies.add(proxy)
 
-        p2 = self.sh.get_next_proxy()
-        i2 = proxies.index(p2)
+        self.assertEqual(set(proxies), used_proxies)
 
-        p3 = self.sh.get_next_proxy()
-        i3 = proxies.index(p3)
+    def test_report_failure(self):
+        """Test to check if failing proxies are not used anymore"""
+        GeizhalsStateHandler._instance = None
+        GeizhalsStateHandler._initialized = False
+        proxies = ['https://example.com', 'https://test.org']
+        self.sh = GeizhalsStateHandler(use_proxies=True, proxies=proxies)
 
-        p4 = self.sh.get_next_proxy()
-        i4 = proxies.index(p4)
+        for _ in range(3):
+            self.sh.report_rate_limited('https://example.com')
 
-        p5 = self.sh.get_next_proxy()
-        i5 = proxies.index(p5)
+        for _ in range(50):
+            self.assertEqual('https://test.org', self.sh.get_next_proxy())
 
-        p6 = self.sh.get_next_proxy()
-        i6 = proxies.index(p6)
+        stats = self.sh.get_proxy_stats()
+        self.assertTrue(stats['https://example.com']['quarantined'])
+        self.assertEqual(3, stats['https://example.com']['rate_limited'])
+        self.assertFalse(stats['https://test.org']['quarantined'])
 
-        self.assertEqual(i4, i1)
-        self.assertEqual(p4, p1)
-        self.assertEqual(i5, i2)
-        self.assertEqual(p5, p2)
-        self.assertEqual(i6, i3)
-        self.assertEqual(p6, p3)
+        # Without proxies reporting is ignored
+        GeizhalsStateHandler._instance = None
+        GeizhalsStateHandler._initialized = False
+        self.sh = GeizhalsStateHandler()
+        self.sh.report_failure(None)
+        self.sh.report_success(None, 0.5)
+        self.assertEqual({}, self.sh.get_proxy_stats())
+
+    def test_proxy_slot(self):
+        """Test to check if the number of concurrent requests per proxy is limited"""
+        GeizhalsStateHandler._instance = None
+        GeizhalsStateHandler._initialized = False
+        self.sh = GeizhalsStateHandler(use_proxies=True, proxies=['https://example.com'], max_requests_per_proxy=2)
+
+        lock = threading.Lock()
+        counter = {"running": 0, "max": 0}
+
+        def request():
+            with self.sh.proxy_slot('https://example.com'):
+                with lock:
+                    counter["running"] += 1
+                    counter["max"] = max(counter["max"], counter["running"])
+                time.sleep(0.05)
+                with lock:
+                    counter["running"] -= 1
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(2, counter["max"])
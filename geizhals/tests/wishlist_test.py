@@ -43,3 +43,9 @@ class WishlistTest(unittest.TestCase):
         # Since this is not implemented yet, there should be a exception
         with self.assertRaises(NotImplementedError):
             products = self.wl.get_wishlist_products()
+
+    def test_canonical_url(self):
+        """Test to check if wishlist urls are normalized"""
+        self.assertEqual(self.wl.url, Wishlist.canonical_url(self.wl.url))
+        self.assertEqual(self.wl.url, Wishlist.canonical_url("https://geizhals.de/?cat=WL-676328&sort=p#top"))
+        self.assertEqual("http://example.com", Wishlist.canonical_url("http://example.com"))
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 from .ringbuffer import Ringbuffer
+from .tokenbucket import TokenBucket
 
-__all__ = ['Ringbuffer']
+__all__ = ['Ringbuffer', 'TokenBucket']
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from geizhals.util.tokenbucket import TokenBucket
+
+
+class FakeClock(object):
+    """Clock which only advances when sleep is called"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=2, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_try_acquire(self):
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertFalse(self.bucket.try_acquire())
+
+        self.clock.now += 0.5
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertFalse(self.bucket.try_acquire())
+
+        # The bucket never holds more tokens than its capacity
+        self.clock.now += 100
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertFalse(self.bucket.try_acquire())
+
+    def test_acquire(self):
+        for _ in range(6):
+            self.bucket.acquire()
+
+        # 2 tokens were available, the other 4 took 0.5 seconds each
+        self.assertAlmostEqual(2.0, self.clock.slept)
+
+    def test_set_rate(self):
+        self.bucket.acquire()
+        self.bucket.acquire()
+        self.bucket.set_rate(0.5)
+        self.assertAlmostEqual(2.0, self.bucket.wait_time())
+
+    def test_pause(self):
+        self.bucket.pause(10)
+        self.assertFalse(self.bucket.try_acquire())
+        self.assertAlmostEqual(10, self.bucket.wait_time())
+
+        self.bucket.acquire()
+        self.assertAlmostEqual(10, self.clock.slept)
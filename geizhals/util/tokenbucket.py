@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket which refills with a certain rate (tokens per second) up to its capacity"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last_refill = clock()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0, now - self._last_refill)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def _take(self, tokens):
+        """Takes tokens from the bucket if possible - returns the time to wait otherwise"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+
+            return (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens=1):
+        """Takes tokens from the bucket without blocking - returns False if there are not enough tokens"""
+        return self._take(tokens) == 0
+
+    def acquire(self, tokens=1):
+        """Blocks until the requested number of tokens could be taken from the bucket"""
+        while True:
+            wait_time = self._take(tokens)
+            if wait_time == 0:
+                return
+
+            self._sleep(wait_time)
+
+    def wait_time(self, tokens=1):
+        """Returns the number of seconds until the requested tokens will be available"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            wait_time = max(0, (tokens - self._tokens) / self.rate)
+            return max(wait_time, self._paused_until - now)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = float(rate)
+
+    def pause(self, seconds):
+        """Don't hand out any tokens for the given number of seconds"""
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._last_refill = now
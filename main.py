@@ -7,19 +7,32 @@ from urllib.error import HTTPError
 
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.error import (TelegramError, Unauthorized, BadRequest,
-                            TimedOut, ChatMigrated, NetworkError)
+                            TimedOut, ChatMigrated, NetworkError, RetryAfter)
 from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters
 
 from bot.core import *
+from bot.dispatcher import MessageDispatcher
+from bot.history import HISTORY_RANGES, DEFAULT_HISTORY_RANGE
+from bot.outbox import merge_changes
+from bot.scheduler import CheckScheduler
+from bot.timing_wheel import TimingWheel
 from bot.user import User
-from config import BOT_TOKEN, USE_WEBHOOK, WEBHOOK_PORT, WEBHOOK_URL, CERTPATH, USE_PROXIES, PROXY_LIST, ADMIN_IDs
+from database.alert_rules import EVERY_CHANGE
+from config import BOT_TOKEN, USE_WEBHOOK, WEBHOOK_PORT, WEBHOOK_URL, CERTPATH, USE_PROXIES, PROXY_LIST, ADMIN_IDs, \
+    MAX_CONCURRENT_CHECKS, MAX_PAGES_IN_FLIGHT, MAX_REQUESTS_PER_DOMAIN, MAX_REQUESTS_PER_PROXY, SESSION_POOL_SIZE, \
+    STREAMING_DOWNLOADS, EXTRACTOR, REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL, \
+    CHECK_TICK, DB_BATCH_SIZE, DB_BATCH_INTERVAL, PRICE_HISTORY_RETENTION, HOURLY_HISTORY_RETENTION, \
+    ASYNC_DB_WRITES, DB_WRITE_QUEUE_SIZE, CACHE_SIZE, CACHE_TTL, MESSAGES_PER_SECOND, MESSAGES_PER_CHAT_PER_SECOND, \
+    MESSAGE_WORKERS, NOTIFICATION_BATCH_SIZE, MAX_NOTIFICATIONS_IN_FLIGHT, OUTBOX_RETENTION, DIGEST_WINDOW, \
+    BROADCAST_BATCH_SIZE, BROADCAST_REPORT_INTERVAL
 from filters.own_filters import new_filter, show_filter
-from geizhals import GeizhalsStateHandler
+from geizhals import GeizhalsStateHandler, PriceChecker
 from geizhals.entities import EntityType, Product, Wishlist
-from userstate import UserState
+from userstate import set_user_state, rm_user_state
 from util.exceptions import AlreadySubscribedException, WishlistNotFoundException, ProductNotFoundException, \
     InvalidURLException
-from util.formatter import bold, link, price
+from util.formatter import bold, link, parse_price, price
+from util.memory import format_memory, get_current_memory, get_peak_memory
 
 __author__ = 'Rico'
 
@@ -27,6 +40,12 @@ state_list = []
 STATE_SEND_LINK = 0
 STATE_SEND_WL_LINK = 1
 STATE_SEND_P_LINK = 2
+STATE_SEND_TARGET_PRICE = 3
+
+# Entity whose target price a user is asked for, keyed by user id
+target_price_entities = {}
+# Selectable price drops in percent of the alert rules
+ALERT_DROP_PERCENTS = (5, 10, 20)
 
 MAX_WISHLISTS = 5
 MAX_PRODUCTS = 5
@@ -52,29 +71,36 @@ if not re.match(r"[0-9]+:[a-zA-Z0-9\-_]+", BOT_TOKEN):
 updater = Updater(token=BOT_TOKEN)
 dp = updater.dispatcher
 
-cancel_button = InlineKeyboardButton("🚫 Abbrechen", callback_data='cancel')
 
+def handle_unauthorized(user_id, error):
+    """Called by the message dispatcher when a message couldn't be sent because the bot is not allowed to"""
+    if error.message == "Forbidden: user is deactivated":
+        logging.info("Removed user from db, because account was deleted.")
+        delete_user(user_id)
+    else:
+        logger.warning("Couldn't send a message to user {}: {}".format(user_id, error.message))
 
-def set_state(user_id, state):
-    state_set = False
 
-    for userstate in state_list:
-        if userstate.user_id() == user_id:
-            state_set = True
-            break
+# Notifications and broadcasts are sent by background workers which stay within the flood limits of Telegram
+message_dispatcher = MessageDispatcher(updater.bot.send_message, rate=MESSAGES_PER_SECOND,
+                                       per_chat_rate=MESSAGES_PER_CHAT_PER_SECOND, workers=MESSAGE_WORKERS,
+                                       retry_after=(RetryAfter,), retry=(TimedOut,), unauthorized=(Unauthorized,),
+                                       on_unauthorized=handle_unauthorized)
 
-    if not state_set:
-        state_list.append(UserState(user_id, state))
+cancel_button = InlineKeyboardButton("🚫 Abbrechen", callback_data='cancel')
 
+price_checker = PriceChecker(max_workers=MAX_CONCURRENT_CHECKS, max_requests_per_domain=MAX_REQUESTS_PER_DOMAIN,
+                             max_in_flight=MAX_PAGES_IN_FLIGHT)
+check_scheduler = CheckScheduler(min_interval=MIN_CHECK_INTERVAL * 60, max_interval=MAX_CHECK_INTERVAL * 60)
+check_wheel = TimingWheel(interval=MIN_CHECK_INTERVAL * 60, slots=max(1, MIN_CHECK_INTERVAL // CHECK_TICK))
+
+
+def set_state(user_id, state):
+    set_user_state(state_list, user_id, state)
 
-def rm_state(user_id):
-    index = 0
-    for userstate in state_list:
-        if userstate.user_id() == user_id:
-            del state_list[index]
-            break
 
-        index += 1
+def rm_state(user_id):
+    rm_user_state(state_list, user_id)
 
 
 # Text commands
@@ -99,12 +125,27 @@ def help_cmd(bot, update):
                 "/start	-	Startmenü\n" \
                 "/help	-	Zeigt diese Hilfe\n" \
                 "/show	-	Zeigt deine Listen an\n" \
+                "/digest	-	Preisänderungen gesammelt oder sofort erhalten\n" \
                 "/add	-	Fügt neue Wunschliste hinzu\n" \
                 # "/remove	-	Entfernt eine Wunschliste\n"
 
     bot.sendMessage(user_id, help_text)
 
 
+def digest_cmd(bot, update):
+    """Switches a user between getting each price change right away and getting a digest of them"""
+    user_id = update.message.from_user.id
+    digest = not is_digest_user(user_id)
+    set_digest_user(user_id, digest)
+
+    if digest:
+        text = "Du erhältst Preisänderungen ab jetzt gesammelt alle {} Minuten.".format(DIGEST_WINDOW)
+    else:
+        text = "Du erhältst Preisänderungen ab jetzt sofort."
+
+    bot.sendMessage(user_id, text)
+
+
 def broadcast(bot, update):
     """Method to send a broadcast to all of the users of the bot"""
     user_id = update.message.from_user.id
@@ -115,12 +156,47 @@ def broadcast(bot, update):
     logging.info("Sending message broadcast to all users! Requested by admin '{}'".format(user_id))
     message_with_prefix = update.message.text
     final_message = message_with_prefix.replace("/broadcast ", "")
-    users = get_all_subscribers()
-    for user in users:
-        bot.send_message(chat_id=user, text=final_message)
+    # The broadcast is stored and sent in the background, after all pending price notifications
+    broadcast_job = create_broadcast(final_message, user_id)
 
     for admin in ADMIN_IDs:
-        bot.send_message(chat_id=admin, text="Sent message broadcast to all users! Requested by admin '{}' with the text:\n\n{}".format(user_id, final_message))
+        message_dispatcher.send(admin, "Started message broadcast {} to {} users! Requested by admin '{}' with the text:\n\n{}".format(
+            broadcast_job.id, broadcast_job.total, user_id, final_message))
+
+
+def report_broadcast(broadcast_job):
+    """Reports the progress of a broadcast to the admins"""
+    if broadcast_job.finished is not None:
+        text = "Finished message broadcast {}: {} sent, {} failed.".format(broadcast_job.id, broadcast_job.sent, broadcast_job.failed)
+    else:
+        text = "Message broadcast {}: {} of {} users done, {} failed.".format(
+            broadcast_job.id, broadcast_job.sent + broadcast_job.failed, broadcast_job.total, broadcast_job.failed)
+
+    for admin in ADMIN_IDs:
+        message_dispatcher.send(admin, text)
+
+
+def proxy_stats_cmd(bot, update):
+    """Admin command which shows the health statistics of the configured proxies"""
+    user_id = update.message.from_user.id
+    if user_id not in ADMIN_IDs:
+        logger.warning("User {} tried to use the proxy stats functionality!".format(user_id))
+        return
+
+    stats = GeizhalsStateHandler().get_proxy_stats()
+    if len(stats) == 0:
+        bot.send_message(chat_id=user_id, text="Es sind keine Proxies konfiguriert!")
+        return
+
+    lines = []
+    for proxy, proxy_stats in sorted(stats.items(), key=lambda item: item[1]["health"], reverse=True):
+        latency = "-" if proxy_stats["latency"] is None else "{:.2f} s".format(proxy_stats["latency"])
+        quarantine = " (Quarantäne: {:.0f} s)".format(proxy_stats["quarantine_remaining"]) if proxy_stats["quarantined"] else ""
+        lines.append("{proxy}: {rate:.0%} OK, {latency}, {limited}x 429{quarantine}".format(
+            proxy=proxy, rate=proxy_stats["success_rate"], latency=latency,
+            limited=proxy_stats["rate_limited"], quarantine=quarantine))
+
+    bot.send_message(chat_id=user_id, text="\n".join(lines))
 
 
 # Inline menus
@@ -161,6 +237,10 @@ def handle_text(bot, update):
                 add_product(bot, update)
             elif userstate.state() == STATE_SEND_WL_LINK:
                 add_wishlist(bot, update)
+            elif userstate.state() == STATE_SEND_TARGET_PRICE:
+                set_target_price(bot, update)
+            # A user has only one state and the handlers might change the list
+            break
 
 
 def add_wishlist(bot, update):
@@ -169,7 +249,7 @@ def add_wishlist(bot, update):
 
     reply_markup = InlineKeyboardMarkup([[cancel_button]])
 
-    add_user_if_new(user)
+    add_user_if_new(User(user.id, user.first_name, user.username, user.language_code))
 
     try:
         url = get_wl_url(text)
@@ -226,7 +306,7 @@ def add_product(bot, update):
 
     reply_markup = InlineKeyboardMarkup([[cancel_button]])
 
-    add_user_if_new(user)
+    add_user_if_new(User(user.id, user.first_name, user.username, user.language_code))
 
     try:
         url = get_p_url(text)
@@ -279,56 +359,82 @@ def check_for_price_update(bot, job):
     """Check if the price of any subscribed wishlist or product was updated"""
     logger.debug("Checking for updates!")
 
-    entities = get_all_entities_with_subscribers()
-
-    # Check all entities for price updates
-    for entity in entities:
-        logger.debug("URL is '{}'".format(entity.url))
-        old_price = entity.price
-        old_name = entity.name
-        try:
-            new_price = entity.get_current_price()
-            new_name = entity.get_current_name()
-        except HTTPError as e:
-            if e.code == 403:
-                logger.error("Entity is not public!")
-
-                if entity.TYPE == EntityType.PRODUCT:
-                    entity_hidden = "Das Produkt {link_name} ist leider nicht mehr einsehbar. " \
-                                    "Ich entferne diesen Preisagenten!".format(link_name=link(entity.url, entity.name))
-                elif entity.TYPE == EntityType.WISHLIST:
-                    entity_hidden = "Die Wunschliste {link_name} ist leider nicht mehr einsehbar. " \
-                                    "Ich entferne diesen Preisagent.".format(link_name=link(entity.url, entity.name))
-                else:
-                    raise ValueError("No such entity type '{}'!".format(entity.TYPE))
-
-                for user_id in get_entity_subscribers(entity):
-                    user = get_user_by_id(user_id)
-                    bot.send_message(user_id, entity_hidden, parse_mode="HTML")
-                    unsubscribe_entity(user, entity)
-
-                rm_entity(entity)
-        except ValueError as e:
-            logger.error("ValueError while checking for price updates! {}".format(e))
-        except Exception as e:
-            logger.error("Exception while checking for price updates! {}".format(e))
+    now = int(datetime.today().timestamp())
+    entity_keys = []
+
+    # Plan all the entities becoming due within the next cycle evenly over the whole cycle. The wheel only holds their
+    # (type, id) keys - the entities are loaded per slot, so only the entities of the current slot are kept in memory
+    if check_wheel.is_cycle_finished(now):
+        cycle_keys = list(iter_entity_keys_with_subscribers(due_before=now + check_wheel.interval))
+        entity_keys.extend(check_wheel.start_cycle(cycle_keys, now))
+
+    entity_keys.extend(check_wheel.pop_due(now))
+    # Entities which were removed since the start of the cycle are left out
+    entities = get_entities(entity_keys)
+    logger.info("Checking {} entities - {} pending in this cycle, {:.0f} seconds behind schedule".format(
+        len(entities), check_wheel.pending, check_wheel.lag))
+    removed_entities = []
+    changed_entities = []
+
+    # Check all due entities for price updates - the pages are downloaded concurrently, the results are processed one by one.
+    # Price and name changes are collected and written in batched transactions instead of one commit per change
+    with create_update_batch(DB_BATCH_SIZE, DB_BATCH_INTERVAL) as batch:
+        for entity, future in price_checker.check(entities):
+            old_price = entity.price
+            old_name = entity.name
+            try:
+                data = future.result()
+                new_price, new_name = data.price, data.name
+            except HTTPError as e:
+                if e.code == 403:
+                    logger.error("Entity is not public!")
+                    removed_entities.append(entity)
+            except ValueError as e:
+                logger.error("ValueError while checking for price updates! {}".format(e))
+            except Exception as e:
+                logger.error("Exception while checking for price updates! {}".format(e))
+            else:
+                if old_price != new_price:
+                    entity.price = new_price
+                    batch.add_price(entity, new_price)
+                    changed_entities.append(entity)
+
+                if old_name != new_name:
+                    batch.add_name(entity, new_name)
+
+    # The price changes were written to the outbox together with the new prices - the outbox worker notifies the
+    # subscribers. Load the subscribers of all hidden entities at once instead of querying them per entity
+    subscribers = get_subscribers_for_entities(removed_entities)
+
+    for entity in removed_entities:
+        if entity.TYPE == EntityType.PRODUCT:
+            entity_hidden = "Das Produkt {link_name} ist leider nicht mehr einsehbar. " \
+                            "Ich entferne diesen Preisagenten!".format(link_name=link(entity.url, entity.name))
+        elif entity.TYPE == EntityType.WISHLIST:
+            entity_hidden = "Die Wunschliste {link_name} ist leider nicht mehr einsehbar. " \
+                            "Ich entferne diesen Preisagent.".format(link_name=link(entity.url, entity.name))
         else:
-            if old_price != new_price:
-                entity.price = new_price
-                update_entity_price(entity, new_price)
-                entity_subscribers = get_entity_subscribers(entity)
+            raise ValueError("No such entity type '{}'!".format(entity.TYPE))
+
+        for user in subscribers.get((entity.TYPE, entity.id), []):
+            message_dispatcher.send(user.user_id, entity_hidden, parse_mode="HTML")
+
+    # Unsubscribes all users from the hidden entities and removes them
+    rm_entities(removed_entities)
 
-                for user_id in entity_subscribers:
-                    # Notify each subscriber
-                    try:
-                        notify_user(bot, user_id, entity, old_price)
-                    except Unauthorized as e:
-                        if e.message == "Forbidden: user is deactivated":
-                            logging.info("Removed user from db, because account was deleted.")
-                            delete_user(user_id)
+    # The peak is the one of the whole process - only the current memory tells something about this cycle
+    logger.info("Price check finished: {} changed, {} removed - memory: {}, process peak: {}".format(
+        len(changed_entities), len(removed_entities), format_memory(get_current_memory()), format_memory(get_peak_memory())))
 
-            if old_name != new_name:
-                update_entity_name(entity, new_name)
+    # Plan the next check of each entity based on its price volatility and number of subscribers
+    check_scheduler.reschedule([entity for entity in entities if entity not in removed_entities], now)
+
+
+def prune_history(bot, job):
+    """Deletes price history entries and delivered notifications which are older than the configured retention"""
+    logger.info("Pruning the price history")
+    prune_price_history(PRICE_HISTORY_RETENTION, HOURLY_HISTORY_RETENTION)
+    prune_outbox(OUTBOX_RETENTION)
 
 
 def get_entity_keyboard(entity_type, entity_id, back_action):
@@ -337,10 +443,149 @@ def get_entity_keyboard(entity_type, entity_id, back_action):
     delete_button = InlineKeyboardButton("❌ Löschen", callback_data="delete_{entity_id}_{entity_type}".format(
         entity_id=entity_id, entity_type=entity_type.value))
     history_button = InlineKeyboardButton("📊 Preisverlauf", callback_data="history_{entity_id}_{entity_type}".format(
-        entity_id=entity_id, entity_type=entity_type))
-    # TODO implement history button and functionality
+        entity_id=entity_id, entity_type=entity_type.value))
+    alert_button = InlineKeyboardButton("🔔 Benachrichtigungen", callback_data="alert_{entity_id}_{entity_type}".format(
+        entity_id=entity_id, entity_type=entity_type.value))
+
+    return InlineKeyboardMarkup([[history_button], [alert_button], [delete_button], [back_button]])
+
+
+def get_history_keyboard(entity_type, entity_id):
+    """Returns a keyboard to choose the range of the price history and to go back to the entity"""
+    range_buttons = []
+    for days, label in HISTORY_RANGES.items():
+        callback_data = "history{days}_{entity_id}_{entity_type}".format(days=days, entity_id=entity_id, entity_type=entity_type.value)
+        range_buttons.append(InlineKeyboardButton(label, callback_data=callback_data))
+
+    back_button = InlineKeyboardButton("↩️ Zurück", callback_data="show_{entity_id}_{entity_type}".format(
+        entity_id=entity_id, entity_type=entity_type.value))
+
+    return InlineKeyboardMarkup([range_buttons, [back_button]])
+
+
+def show_price_history(bot, user_id, message_id, callback_query_id, entity, action):
+    """Shows the price history of an entity - the range in days is appended to the action, e.g. 'history7'"""
+    days = action[len("history"):]
+    days = int(days) if days.isdigit() and int(days) in HISTORY_RANGES else DEFAULT_HISTORY_RANGE
+
+    text = "{link_name}\n\n{history}".format(link_name=link(entity.url, entity.name), history=get_price_history(entity, days))
+    try:
+        bot.editMessageText(chat_id=user_id, message_id=message_id, text=text,
+                            reply_markup=get_history_keyboard(entity.TYPE, entity.id),
+                            parse_mode="HTML", disable_web_page_preview=True)
+    except BadRequest as e:
+        # Choosing the range which is already shown does not change the message
+        logger.debug("Price history not updated: {}".format(e))
+    bot.answerCallbackQuery(callback_query_id=callback_query_id)
 
-    return InlineKeyboardMarkup([[delete_button], [back_button]])
+
+def describe_alert_rule(rule):
+    """Returns a text describing when a subscriber with the given alert rule is notified"""
+    if rule == EVERY_CHANGE:
+        return "bei jeder Preisänderung"
+
+    conditions = []
+    if rule.target_price is not None:
+        conditions.append("wenn der Preis auf {} oder weniger fällt".format(bold(price(rule.target_price, signed=False))))
+    if rule.min_drop_percent is not None:
+        conditions.append("wenn der Preis um mindestens {:g} % fällt".format(rule.min_drop_percent))
+    if rule.all_time_low:
+        conditions.append("bei einem neuen Tiefstpreis")
+
+    return " oder ".join(conditions)
+
+
+def get_alert_keyboard(entity_type, entity_id, rule):
+    """Returns a keyboard to choose the alert rule of a subscription - active rules are checked"""
+    def button(label, mode, active):
+        callback_data = "alert{mode}_{entity_id}_{entity_type}".format(mode=mode, entity_id=entity_id, entity_type=entity_type.value)
+        return InlineKeyboardButton(("✅ " if active else "") + label, callback_data=callback_data)
+
+    drop_buttons = [button("-{} %".format(percent), "Drop{}".format(percent), rule.min_drop_percent == percent)
+                    for percent in ALERT_DROP_PERCENTS]
+    back_button = InlineKeyboardButton("↩️ Zurück", callback_data="show_{entity_id}_{entity_type}".format(
+        entity_id=entity_id, entity_type=entity_type.value))
+
+    return InlineKeyboardMarkup([[button("Jede Änderung", "All", rule == EVERY_CHANGE)],
+                                 [button("Neuer Tiefstpreis", "Low", rule.all_time_low)],
+                                 drop_buttons,
+                                 [button("Zielpreis", "Target", rule.target_price is not None)],
+                                 [back_button]])
+
+
+def show_alert_rule(bot, user, message_id, callback_query_id, entity, action):
+    """Shows and changes the alert rule of a subscription - the change is appended to the action, e.g. 'alertDrop5'"""
+    rule = get_alert_rule(user, entity)
+    if rule is None:
+        bot.answerCallbackQuery(callback_query_id=callback_query_id, text="Du hast diesen Preisagenten nicht mehr!")
+        return
+
+    mode = action[len("alert"):]
+    if mode == "Target":
+        target_price_entities[user.id] = entity
+        set_state(user.id, STATE_SEND_TARGET_PRICE)
+        bot.editMessageText(chat_id=user.id, message_id=message_id,
+                            text="Bitte sende mir den Zielpreis für {link_name}, z.B. 199,99".format(
+                                link_name=link(entity.url, entity.name)),
+                            reply_markup=InlineKeyboardMarkup([[cancel_button]]),
+                            parse_mode="HTML", disable_web_page_preview=True)
+        bot.answerCallbackQuery(callback_query_id=callback_query_id)
+        return
+
+    if mode == "All":
+        rule = EVERY_CHANGE
+    elif mode == "Low":
+        rule = rule._replace(all_time_low=not rule.all_time_low)
+    elif mode.startswith("Drop") and mode[len("Drop"):].isdigit():
+        percent = int(mode[len("Drop"):])
+        rule = rule._replace(min_drop_percent=None if rule.min_drop_percent == percent else percent)
+
+    if mode != "":
+        set_alert_rule(user, entity, rule)
+
+    text = "Ich benachrichtige dich über {link_name} {condition}.".format(link_name=link(entity.url, entity.name),
+                                                                        condition=describe_alert_rule(rule))
+    try:
+        bot.editMessageText(chat_id=user.id, message_id=message_id, text=text,
+                            reply_markup=get_alert_keyboard(entity.TYPE, entity.id, rule),
+                            parse_mode="HTML", disable_web_page_preview=True)
+    except BadRequest as e:
+        logger.debug("Alert rule not updated: {}".format(e))
+    bot.answerCallbackQuery(callback_query_id=callback_query_id)
+
+
+def set_target_price(bot, update):
+    """Sets the target price a user sent for the entity chosen before"""
+    user = get_user_by_id(update.message.from_user.id)
+    entity = target_price_entities.get(update.message.from_user.id)
+    if user is None or entity is None:
+        rm_state(update.message.from_user.id)
+        return
+
+    try:
+        target_price = parse_price(update.message.text)
+    except ValueError:
+        target_price = 0
+
+    if target_price <= 0:
+        bot.sendMessage(chat_id=user.id, text="Das ist kein gültiger Preis! Bitte sende mir den Zielpreis, z.B. 199,99",
+                        reply_markup=InlineKeyboardMarkup([[cancel_button]]))
+        return
+
+    rm_state(user.id)
+    del target_price_entities[user.id]
+    rule = get_alert_rule(user, entity)
+    if rule is None:
+        bot.sendMessage(chat_id=user.id, text="Du hast diesen Preisagenten nicht mehr!")
+        return
+
+    rule = rule._replace(target_price=target_price)
+    set_alert_rule(user, entity, rule)
+    bot.sendMessage(chat_id=user.id,
+                    text="Ich benachrichtige dich über {link_name} {condition}.".format(link_name=link(entity.url, entity.name),
+                                                                                        condition=describe_alert_rule(rule)),
+                    reply_markup=get_alert_keyboard(entity.TYPE, entity.id, rule),
+                    parse_mode="HTML", disable_web_page_preview=True)
 
 
 def get_entities_keyboard(action, entities, prefix_text="", cancel=False, columns=2):
@@ -375,9 +620,37 @@ def generate_keyboard(buttons, columns, cancel=False):
     return InlineKeyboardMarkup(keyboard)
 
 
-def notify_user(bot, user_id, entity, old_price):
-    """Notify a user of price changes"""
-    diff = entity.price - old_price
+def render_notifications(notifications):
+    """
+    Renders the price change notifications of a user, which are delivered together, into one message. Returns the text
+    and the options of the message or None if no price changed in the end.
+    """
+    changes = merge_changes(notifications)
+    if len(changes) == 0:
+        return None
+
+    logger.info("Notifying user {} of {} price changes!".format(notifications[0].user_id, len(changes)))
+
+    if len(changes) == 1:
+        message = render_price_change(changes[0])
+    else:
+        lines = []
+        for change in changes:
+            diff = change.new_price - change.old_price
+            lines.append("{emoji} {link_name}: {price} ({diff})".format(emoji="📈" if diff > 0 else "📉",
+                                                                        link_name=link(change.url, change.name),
+                                                                        price=bold(price(change.new_price, signed=False)),
+                                                                        diff=price(diff)))
+
+        message = "Die Preise von {count} deiner Preisagenten haben sich geändert:\n\n{lines}".format(
+            count=len(changes), lines="\n".join(lines))
+
+    return message, {"parse_mode": "HTML", "disable_web_page_preview": True}
+
+
+def render_price_change(notification):
+    """Renders the message of a single price change"""
+    diff = notification.new_price - notification.old_price
 
     if diff > 0:
         emoji = "📈"
@@ -386,15 +659,13 @@ def notify_user(bot, user_id, entity, old_price):
         emoji = "📉"
         change = "billiger"
 
-    logger.info("Notifying user {}!".format(user_id))
-
     message = "Der Preis von {link_name} hat sich geändert: {price}\n\n" \
-              "{emoji} {diff} {change}".format(link_name=link(entity.url, entity.name),
-                                               price=bold(price(entity.price, signed=False)),
+              "{emoji} {diff} {change}".format(link_name=link(notification.url, notification.name),
+                                               price=bold(price(notification.new_price, signed=False)),
                                                emoji=emoji,
                                                diff=bold(price(diff)),
                                                change=change)
-    bot.sendMessage(user_id, message, parse_mode="HTML", disable_web_page_preview=True)
+    return message
 
 
 # Handles the callbacks of inline keyboards
@@ -454,6 +725,10 @@ def callback_handler_f(bot, update):
                                     reply_markup=get_entity_keyboard(EntityType.WISHLIST, wishlist.id, "showWishlists"),
                                     parse_mode="HTML", disable_web_page_preview=True)
                 bot.answerCallbackQuery(callback_query_id=callback_query_id)
+            elif action.startswith("history"):
+                show_price_history(bot, user_id, message_id, callback_query_id, wishlist, action)
+            elif action.startswith("alert"):
+                show_alert_rule(bot, user, message_id, callback_query_id, wishlist, action)
             elif action == "subscribe":
                 try:
                     subscribe_entity(user, wishlist)
@@ -501,6 +776,10 @@ def callback_handler_f(bot, update):
                                     reply_markup=get_entity_keyboard(EntityType.PRODUCT, product.id, "showProducts"),
                                     parse_mode="HTML", disable_web_page_preview=True)
                 bot.answerCallbackQuery(callback_query_id=callback_query_id)
+            elif action.startswith("history"):
+                show_price_history(bot, user_id, message_id, callback_query_id, product, action)
+            elif action.startswith("alert"):
+                show_alert_rule(bot, user, message_id, callback_query_id, product, action)
             elif action == "subscribe":
                 try:
                     subscribe_entity(user, product)
@@ -530,6 +809,7 @@ def callback_handler_f(bot, update):
     elif action == "cancel":
         """Reset the user's state"""
         rm_state(user_id)
+        target_price_entities.pop(user_id, None)
         text = "Okay, Ich habe die Aktion abgebrochen!"
         bot.editMessageText(chat_id=user_id, message_id=message_id, text=text)
         bot.answerCallbackQuery(callback_query_id=callback_query_id, text=text)
@@ -627,6 +907,8 @@ dp.add_handler(MessageHandler(new_filter, add_menu))
 dp.add_handler(MessageHandler(show_filter, show_menu))
 
 dp.add_handler(CommandHandler('broadcast', callback=broadcast))
+dp.add_handler(CommandHandler('proxies', callback=proxy_stats_cmd))
+dp.add_handler(CommandHandler('digest', callback=digest_cmd))
 
 # Callback, Text and fallback handlers
 dp.add_handler(CallbackQueryHandler(callback_handler_f))
@@ -634,22 +916,21 @@ dp.add_handler(MessageHandler(Filters.text, handle_text))
 dp.add_handler(MessageHandler(Filters.command, unknown))
 dp.add_error_handler(error_callback)
 
-# Scheduling the check for updates
-dt = datetime.today()
-seconds = int(dt.timestamp())
-repeat_in_minutes = 30
-repeat_in_seconds = 60 * repeat_in_minutes
-delta_t = repeat_in_seconds - (seconds % (60 * repeat_in_minutes))
-
-updater.job_queue.run_repeating(callback=check_for_price_update, interval=repeat_in_seconds, first=delta_t)
-updater.job_queue.start()
-
-if USE_WEBHOOK:
-    updater.start_webhook(listen="127.0.0.1", port=WEBHOOK_PORT, url_path=BOT_TOKEN, cert=CERTPATH, webhook_url=WEBHOOK_URL)
-    updater.bot.set_webhook(WEBHOOK_URL)
-else:
-    updater.start_polling()
-
+# Database writes of the price check are done by a background thread, so that the checks don't wait for SQLite
+if ASYNC_DB_WRITES:
+    start_db_writer(max_queue_size=DB_WRITE_QUEUE_SIZE)
+
+configure_cache(max_entries=CACHE_SIZE, ttl=CACHE_TTL)
+configure_digest(window=DIGEST_WINDOW * 60)
+message_dispatcher.start()
+# Price change notifications are stored in the outbox by the price check and delivered independently of it
+start_outbox_worker(message_dispatcher, render_notifications, batch_size=NOTIFICATION_BATCH_SIZE,
+                    max_in_flight=MAX_NOTIFICATIONS_IN_FLIGHT)
+# Broadcasts are stored jobs which are resumed after a restart
+start_broadcast_worker(message_dispatcher, report_broadcast, batch_size=BROADCAST_BATCH_SIZE,
+                       report_interval=BROADCAST_REPORT_INTERVAL)
+
+# The state handler is a singleton - it has to be configured before the first price check can create it
 if USE_PROXIES:
     proxy_path = os.path.join(project_path, PROXY_LIST)
     with open(proxy_path, "r", encoding="utf-8") as f:
@@ -659,11 +940,39 @@ if USE_PROXIES:
         proxies[:] = [x for x in proxies if not x.startswith('#') and not x == '']
     if proxies is not None and isinstance(proxies, list):
         logger.info("Using proxies!")
-        gh = GeizhalsStateHandler(use_proxies=USE_PROXIES, proxies=proxies)
+        gh = GeizhalsStateHandler(use_proxies=USE_PROXIES, proxies=proxies, max_requests_per_proxy=MAX_REQUESTS_PER_PROXY,
+                                  pool_size=SESSION_POOL_SIZE, streaming=STREAMING_DOWNLOADS, extractor=EXTRACTOR,
+                                  requests_per_second=REQUESTS_PER_SECOND, max_requests_per_second=MAX_REQUESTS_PER_SECOND)
     else:
         logger.error("Proxies list is either empty or has mismatching type!")
 else:
-    GeizhalsStateHandler(use_proxies=USE_PROXIES, proxies=None)
+    GeizhalsStateHandler(use_proxies=USE_PROXIES, proxies=None, max_requests_per_proxy=MAX_REQUESTS_PER_PROXY,
+                         pool_size=SESSION_POOL_SIZE, streaming=STREAMING_DOWNLOADS, extractor=EXTRACTOR,
+                         requests_per_second=REQUESTS_PER_SECOND, max_requests_per_second=MAX_REQUESTS_PER_SECOND)
+
+# Scheduling the check for updates - each run only checks the entities of the current slot of the timing wheel
+repeat_in_seconds = check_wheel.slot_length
+
+updater.job_queue.run_repeating(callback=check_for_price_update, interval=repeat_in_seconds, first=0)
+updater.job_queue.run_repeating(callback=prune_history, interval=24 * 60 * 60, first=60)
+updater.job_queue.start()
+
+if USE_WEBHOOK:
+    updater.start_webhook(listen="127.0.0.1", port=WEBHOOK_PORT, url_path=BOT_TOKEN, cert=CERTPATH, webhook_url=WEBHOOK_URL)
+    updater.bot.set_webhook(WEBHOOK_URL)
+else:
+    updater.start_polling()
 
 logger.info("Bot started as @{}".format(updater.bot.username))
 updater.idle()
+
+# Stop the workers first, so that they don't queue messages anymore, then send the messages which are still queued
+stop_broadcast_worker(timeout=30)
+stop_outbox_worker(timeout=30)
+message_dispatcher.close(timeout=30)
+
+# Write the changes which are still queued before exiting
+stop_db_writer()
+
+# Close all the pooled connections to Geizhals after the bot was stopped
+GeizhalsStateHandler().session_pool.close_all()
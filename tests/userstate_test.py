@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from userstate import UserState, set_user_state, rm_user_state
+
+
+class UserStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_list = [UserState(2, 1)]
+
+    def get_states(self):
+        return [(userstate.user_id(), userstate.state()) for userstate in self.state_list]
+
+    def test_set_user_state(self):
+        """Test to check if a new state replaces a state the user is still in"""
+        # E.g. a user who asked to add a product and then chose to set a target price instead
+        set_user_state(self.state_list, 1, 2)
+        set_user_state(self.state_list, 1, 3)
+
+        self.assertEqual([(2, 1), (1, 3)], self.get_states())
+
+    def test_rm_user_state(self):
+        """Test to check if only the state of the given user is removed"""
+        set_user_state(self.state_list, 1, 2)
+        rm_user_state(self.state_list, 1)
+        rm_user_state(self.state_list, 3)
+
+        self.assertEqual([(2, 1)], self.get_states())
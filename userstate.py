@@ -11,3 +11,13 @@ class UserState(object):
 
     def state(self):
         return self.__state
+
+
+def set_user_state(state_list, user_id, state):
+    """Sets the state of a user - a state the user is still in, e.g. of an aborted dialog, is replaced"""
+    rm_user_state(state_list, user_id)
+    state_list.append(UserState(user_id, state))
+
+
+def rm_user_state(state_list, user_id):
+    state_list[:] = [userstate for userstate in state_list if userstate.user_id() != user_id]
@@ -1,4 +1,5 @@
 import html
+import re
 
 
 def bold(text):
@@ -17,3 +18,37 @@ def price(price_value, signed=True):
         return "{price:+.2f} €".format(price=price_value)
     else:
         return "{price:.2f} €".format(price=price_value)
+
+
+def parse_price(text):
+    """
+    Parses a price sent by a user, e.g. '1.299,99 €', '1 299,99' or '199.99'. Dots are thousands separators if the text
+    contains a comma or only groups of three digits follow them. Raises a ValueError if the text is no price.
+    """
+    text = "".join(text.replace("€", "").split())
+
+    if "," in text or re.match(r"^\d{1,3}(\.\d{3})+$", text):
+        text = text.replace(".", "")
+
+    text = text.replace(",", ".")
+    # float() would accept 'inf', 'nan' or signs as well
+    if not re.match(r"^(\d+\.?\d*|\.\d+)$", text):
+        raise ValueError("'{}' is no price!".format(text))
+
+    return float(text)
+
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values):
+    """Generates a text chart of the values with one block character per value"""
+    if len(values) == 0:
+        return ""
+
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2 - 1] * len(values)
+
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return "".join(SPARK_CHARS[int(round((value - low) * scale))] for value in values)
@@ -0,0 +1,39 @@
+"""Memory usage of the bot process"""
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def get_current_memory():
+    """Returns the current resident memory of the process in MB or None if it can't be determined (only on Linux)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def get_peak_memory():
+    """Returns the peak resident memory over the whole lifetime of the process in MB or None if it can't be determined"""
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    if sys.platform == "darwin":
+        return max_rss / (1024 * 1024)
+
+    return max_rss / 1024
+
+
+def format_memory(memory):
+    """Formats a memory size in MB for the log"""
+    return "{:.1f} MB".format(memory) if memory is not None else "unknown"
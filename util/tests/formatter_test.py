@@ -38,3 +38,21 @@ class FormatterTest(unittest.TestCase):
 
         self.assertEqual(formatter.price(price_pos, False), "1.75 €", msg="Positive price not displayed correctly")
         self.assertEqual(formatter.price(price_neg, False), "-1.82 €", msg="Negative price not displayed correctly")
+
+    def test_sparkline(self):
+        self.assertEqual(formatter.sparkline([]), "")
+        self.assertEqual(formatter.sparkline([1, 2, 3, 4, 5, 6, 7, 8]), "▁▂▃▄▅▆▇█")
+        self.assertEqual(formatter.sparkline([10.0, 20.0, 10.0]), "▁█▁")
+        self.assertEqual(formatter.sparkline([5, 5, 5]), "▄▄▄")
+
+    def test_parse_price(self):
+        for text in ("1.299,99", "1 299,99", "1.299,99 €", " 1299,99", "1299.99", "€ 1\u00a0299,99"):
+            self.assertEqual(1299.99, formatter.parse_price(text), "Price '{}' not parsed correctly!".format(text))
+
+        self.assertEqual(1299.0, formatter.parse_price("1.299"))
+        self.assertEqual(1234567.0, formatter.parse_price("1.234.567"))
+        self.assertEqual(199.9, formatter.parse_price("199,9"))
+
+        for text in ("", "abc", "1,2,3", "inf", "nan", "-5"):
+            with self.assertRaises(ValueError):
+                formatter.parse_price(text)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from util import memory
+
+
+class MemoryTest(unittest.TestCase):
+
+    @unittest.skipIf(memory.resource is None, "The resource module is not available on this platform")
+    def test_get_peak_memory(self):
+        peak = memory.get_peak_memory()
+        self.assertGreater(peak, 1)
+
+        # The peak never decreases
+        data = bytearray(20 * 1024 * 1024)
+        self.assertGreaterEqual(memory.get_peak_memory(), peak)
+        del data
+
+    @unittest.skipIf(memory.get_current_memory() is None, "The current memory can only be determined on Linux")
+    def test_get_current_memory(self):
+        current = memory.get_current_memory()
+        self.assertGreater(current, 1)
+
+        data = bytearray(50 * 1024 * 1024)
+        data[::4096] = b"x" * len(data[::4096])
+        allocated = memory.get_current_memory()
+        self.assertGreater(allocated, current + 40)
+
+        # Unlike the peak, the current memory goes down again
+        del data
+        self.assertLess(memory.get_current_memory(), allocated - 40)
+
+    def test_format_memory(self):
+        self.assertEqual("12.3 MB", memory.format_memory(12.34))
+        self.assertEqual("unknown", memory.format_memory(None))